@@ -0,0 +1,118 @@
+import math
+import time
+import threading
+import logging
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+# Configuração de logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def _normalize(vector: List[float]) -> List[float]:
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return [x / norm for x in vector]
+
+
+class SemanticAnswerCache:
+    """Cache de respostas indexado pelo embedding da pergunta reformulada.
+
+    Uma pergunta nova reaproveita a resposta (e as fontes) de uma pergunta já
+    respondida quando a similaridade de cosseno entre as duas passa de
+    `threshold`. As entradas expiram após `ttl_seconds`, são descartadas em
+    ordem LRU acima de `max_entries` e o cache inteiro é esvaziado quando a
+    versão do índice (`version_fn`) muda.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.95,
+        ttl_seconds: float = 24 * 3600,
+        max_entries: int = 512,
+        version_fn: Optional[Callable[[], Any]] = None
+    ):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.version_fn = version_fn
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._next_id = 0
+        self._version = version_fn() if version_fn else None
+        self._lock = threading.Lock()
+
+    def _check_version(self):
+        if self.version_fn is None:
+            return
+        version = self.version_fn()
+        if version != self._version:
+            if self._entries:
+                logger.info("Índice alterado; cache de respostas invalidado")
+            self._entries.clear()
+            self._version = version
+
+    def _expire(self, now: float):
+        expired = [key for key, entry in self._entries.items() if now - entry["created_at"] > self.ttl_seconds]
+        for key in expired:
+            del self._entries[key]
+
+    def lookup(self, embedding: List[float]) -> Optional[Dict[str, Any]]:
+        """Retorna a entrada mais similar acima do limiar (com "similarity") ou None."""
+        query = _normalize(embedding)
+        now = time.time()
+
+        with self._lock:
+            self._check_version()
+            self._expire(now)
+
+            best_key, best_score = None, -1.0
+            for key, entry in self._entries.items():
+                score = sum(a * b for a, b in zip(query, entry["embedding"]))
+                if score > best_score:
+                    best_key, best_score = key, score
+
+            if best_key is None or best_score < self.threshold:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._entries.move_to_end(best_key)
+            entry = self._entries[best_key]
+            return {
+                "question": entry["question"],
+                "answer": entry["answer"],
+                "context": entry["context"],
+                "similarity": best_score
+            }
+
+    def store(self, embedding: List[float], question: str, answer: str, context: List[Any]):
+        """Guarda a resposta de uma pergunta."""
+        with self._lock:
+            self._check_version()
+            self._entries[self._next_id] = {
+                "embedding": _normalize(embedding),
+                "question": question,
+                "answer": answer,
+                "context": context,
+                "created_at": time.time()
+            }
+            self._next_id += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        """Estatísticas de uso do cache."""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "entries": len(self._entries)
+            }
@@ -0,0 +1,314 @@
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+import logging
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+# Adiciona o diretório do projeto ao PATH para importações relativas
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.chat import build_qa_chain
+from ingest.tracing import percentile
+
+# Configuração de logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class StubChatModel(BaseChatModel):
+    """LLM local e determinístico para executar o lote sem rede nem API key.
+
+    Responde com um texto fixo que informa o tamanho do prompt, esperando
+    `latency` segundos para simular o tempo de uma chamada real.
+    """
+
+    latency: float = 0.05
+
+    @property
+    def _llm_type(self) -> str:
+        return "invest-guru-stub"
+
+    def _reply(self, messages: List[BaseMessage]) -> ChatResult:
+        prompt = "\n".join(str(message.content) for message in messages)
+        text = f"[stub] Resposta simulada para um prompt de {len(prompt)} caracteres."
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    def _generate(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        time.sleep(self.latency)
+        return self._reply(messages)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        await asyncio.sleep(self.latency)
+        return self._reply(messages)
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def is_rate_limit(error: Exception) -> bool:
+    return _status_code(error) == 429 or "RateLimit" in type(error).__name__
+
+
+def is_retryable(error: Exception) -> bool:
+    """Limite de taxa, timeouts, falhas de conexão e erros 5xx valem nova tentativa."""
+    if is_rate_limit(error):
+        return True
+    status = _status_code(error)
+    if status is not None:
+        return status >= 500 or status == 408
+    name = type(error).__name__
+    return any(word in name for word in ("Timeout", "Connection", "APIError"))
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    """Segundos pedidos pelo servidor no cabeçalho Retry-After, se houver."""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class AdaptiveLimiter:
+    """Limita as perguntas simultâneas e ajusta o limite aos erros de taxa.
+
+    Começa em `max_concurrency`; cada erro 429 reduz o limite pela metade e
+    pausa novas chamadas até `pause_until`, e cada `recover_after` sucessos
+    seguidos devolvem uma vaga. Com `rpm`, as chamadas também são espaçadas
+    para não passar de `rpm` por minuto.
+    """
+
+    def __init__(self, max_concurrency: int, rpm: Optional[float] = None, recover_after: int = 10):
+        self.max_concurrency = max(1, max_concurrency)
+        self.limit = self.max_concurrency
+        self.min_interval = 60.0 / rpm if rpm else 0.0
+        self.recover_after = recover_after
+        self.in_flight = 0
+        self.pause_until = 0.0
+        self._next_start = 0.0
+        self._successes = 0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self):
+        async with self._condition:
+            while True:
+                now = time.monotonic()
+                if self.in_flight < self.limit and now >= self.pause_until:
+                    break
+                timeout = max(self.pause_until - now, 0.05) if now < self.pause_until else None
+                try:
+                    await asyncio.wait_for(self._condition.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+            self.in_flight += 1
+            start_at = max(self._next_start, time.monotonic())
+            self._next_start = start_at + self.min_interval
+        delay = start_at - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def release(self, rate_limited: bool = False, pause: float = 0.0):
+        async with self._condition:
+            self.in_flight -= 1
+            if rate_limited:
+                self.limit = max(1, self.limit // 2)
+                self._successes = 0
+                self.pause_until = max(self.pause_until, time.monotonic() + pause)
+                logger.warning(f"Limite de taxa atingido; concorrência reduzida para {self.limit}")
+            else:
+                self._successes += 1
+                if self._successes >= self.recover_after and self.limit < self.max_concurrency:
+                    self.limit += 1
+                    self._successes = 0
+            self._condition.notify_all()
+
+
+def load_questions(path: str) -> List[Dict[str, Any]]:
+    """Lê perguntas de um JSONL ({"question": ...} ou {"input": ...}, com "id", "modules" e "chat_history" opcionais)."""
+    questions = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            if isinstance(item, str):
+                item = {"question": item}
+            question = item.get("question") or item.get("input")
+            if not question:
+                raise ValueError(f"Linha {line_number} sem 'question'")
+            questions.append({
+                "id": item.get("id", line_number),
+                "question": question,
+                "modules": item.get("modules") or None,
+                "chat_history": [tuple(turn) for turn in item.get("chat_history", [])]
+            })
+    return questions
+
+
+def _sources(context: List[Any]) -> List[Dict[str, Any]]:
+    return [
+        {
+            "source": doc.metadata.get("source", "Desconhecido"),
+            "page": doc.metadata.get("page", "N/A"),
+            "page_end": doc.metadata.get("page_end", doc.metadata.get("page", "N/A")),
+            "module": doc.metadata.get("module", "Desconhecido")
+        }
+        for doc in context
+    ]
+
+
+async def answer_question(
+    qa_chain,
+    item: Dict[str, Any],
+    limiter: AdaptiveLimiter,
+    use_cache: bool = False,
+    max_retries: int = 4,
+    base_delay: float = 1.0,
+    max_delay: float = 30.0
+) -> Dict[str, Any]:
+    """Responde uma pergunta com novas tentativas e espera exponencial (com jitter) em erros transitórios."""
+    inputs = {"input": item["question"], "chat_history": item["chat_history"], "modules": item["modules"]}
+    start = None
+    attempt = 0
+
+    while True:
+        attempt += 1
+        await limiter.acquire()
+        call_start = time.perf_counter()
+        # A latência conta a partir da primeira chamada (sem a espera na fila), incluindo novas tentativas
+        start = start or call_start
+        try:
+            response = await qa_chain.ainvoke(inputs, use_cache=use_cache)
+        except Exception as e:
+            delay = min(max_delay, base_delay * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+            delay = max(delay, retry_after(e) or 0.0)
+            await limiter.release(rate_limited=is_rate_limit(e), pause=delay)
+            if attempt > max_retries or not is_retryable(e):
+                logger.error(f"Pergunta {item['id']} falhou após {attempt} tentativa(s): {e}")
+                return {
+                    "id": item["id"],
+                    "question": item["question"],
+                    "error": f"{type(e).__name__}: {e}",
+                    "attempts": attempt,
+                    "latency_ms": round((time.perf_counter() - start) * 1000, 1)
+                }
+            logger.warning(f"Pergunta {item['id']}: {type(e).__name__}; nova tentativa em {delay:.1f}s")
+            await asyncio.sleep(delay)
+            continue
+
+        await limiter.release()
+        trace = response["trace"]
+        spans = trace.breakdown()
+        prompt_tokens = sum(span["attributes"].get("prompt_tokens", 0) for span in spans if span["name"] == "llm")
+        return {
+            "id": item["id"],
+            "question": item["question"],
+            "standalone_question": response["standalone_question"],
+            "answer": response["answer"],
+            "sources": _sources(response["context"]),
+            "cache_hit": response.get("cache_hit", False),
+            "attempts": attempt,
+            "latency_ms": round((time.perf_counter() - start) * 1000, 1),
+            "call_latency_ms": round((time.perf_counter() - call_start) * 1000, 1),
+            "prompt_tokens": prompt_tokens,
+            "timings": {span["name"]: span["duration_ms"] for span in spans}
+        }
+
+
+async def run_batch(
+    qa_chain,
+    questions: List[Dict[str, Any]],
+    output_path: str,
+    concurrency: int = 4,
+    rpm: Optional[float] = None,
+    use_cache: bool = False,
+    max_retries: int = 4
+) -> Dict[str, Any]:
+    """Executa as perguntas em paralelo e grava cada resultado (JSONL) assim que fica pronto."""
+    limiter = AdaptiveLimiter(concurrency, rpm)
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    started = time.perf_counter()
+    results = []
+
+    with open(output_path, "w", encoding="utf-8") as output:
+        tasks = [
+            asyncio.create_task(answer_question(qa_chain, item, limiter, use_cache, max_retries))
+            for item in questions
+        ]
+        for done, task in enumerate(asyncio.as_completed(tasks), 1):
+            result = await task
+            results.append(result)
+            output.write(json.dumps(result, ensure_ascii=False) + "\n")
+            output.flush()
+            logger.info(f"[{done}/{len(questions)}] {result['id']}: {result['latency_ms']:.0f} ms")
+
+    latencies = [result["latency_ms"] for result in results if "error" not in result]
+    prompt_tokens = [result["prompt_tokens"] for result in results if result.get("prompt_tokens")]
+    elapsed = time.perf_counter() - started
+    return {
+        "questions": len(questions),
+        "answered": len(latencies),
+        "failed": len(results) - len(latencies),
+        "retries": sum(result["attempts"] - 1 for result in results),
+        "elapsed_seconds": round(elapsed, 2),
+        "questions_per_second": round(len(results) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50), 1),
+        "p95_ms": round(percentile(latencies, 95), 1),
+        "p99_ms": round(percentile(latencies, 99), 1),
+        "avg_prompt_tokens": round(sum(prompt_tokens) / len(prompt_tokens), 1) if prompt_tokens else 0.0,
+        "final_concurrency": limiter.limit
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Responde em lote perguntas de um arquivo JSONL usando a cadeia de QA.")
+    parser.add_argument("questions", help="Arquivo JSONL com as perguntas")
+    parser.add_argument("-o", "--output", help="Arquivo JSONL de saída (padrão: data/batch/answers-<data>.jsonl)")
+    parser.add_argument("--model", default="gpt-3.5-turbo", help="Modelo LLM, ou 'stub' para o modelo local simulado")
+    parser.add_argument("--stub-latency", type=float, default=0.05, help="Latência simulada do modelo 'stub' (s)")
+    parser.add_argument("--embedding-model", choices=["huggingface", "openai"], default="huggingface")
+    parser.add_argument("--openai-api-key", default=None, help="Chave da OpenAI (padrão: OPENAI_API_KEY)")
+    parser.add_argument("--concurrency", type=int, default=4, help="Perguntas simultâneas (máximo)")
+    parser.add_argument("--rpm", type=float, default=None, help="Máximo de perguntas iniciadas por minuto")
+    parser.add_argument("--max-retries", type=int, default=4)
+    parser.add_argument("--use-cache", action="store_true", help="Usar o cache semântico de respostas")
+    parser.add_argument("--context-tokens", type=int, default=None, help="Orçamento de tokens do contexto (padrão: o do modelo)")
+    args = parser.parse_args(argv)
+
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    api_key = args.openai_api_key or os.getenv("OPENAI_API_KEY")
+    llm = StubChatModel(latency=args.stub_latency) if args.model == "stub" else None
+    qa_chain = build_qa_chain(api_key, args.model, args.embedding_model, llm=llm, context_tokens=args.context_tokens)
+
+    questions = load_questions(args.questions)
+    output = args.output or os.path.join("data/batch", f"answers-{datetime.now():%Y%m%d-%H%M%S}.jsonl")
+    summary = asyncio.run(run_batch(
+        qa_chain,
+        questions,
+        output,
+        concurrency=args.concurrency,
+        rpm=args.rpm,
+        use_cache=args.use_cache,
+        max_retries=args.max_retries
+    ))
+    summary["output"] = output
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -8,15 +8,16 @@ import time
 # Adiciona o diretório do projeto ao PATH para importações relativas
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from app.utils import get_llm_model, format_sources
-from ingest.ingest_pdf import PDFProcessor
+from app.utils import get_llm_model, format_sources, format_timings
+from app.resources import get_duplicate_references, get_qa_chain, get_vectorstore, list_indexed_modules
+from app.qa_chain import QAChain
+from app.answer_cache import SemanticAnswerCache
+from app.context import ContextBuilder
+from ingest.ingest_pdf import read_index_version
+from ingest.index_versions import resolve_index
+from ingest.tracing import Trace, export_trace
 from dotenv import load_dotenv
 
-from langchain.chains.combine_documents import create_stuff_documents_chain
-from langchain.chains import create_history_aware_retriever
-from langchain.chains.retrieval import create_retrieval_chain
-
-
 from langchain_core.prompts import PromptTemplate
 
 
@@ -27,83 +28,138 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Descrição de como a pergunta foi reformulada (ver QuestionRewriter)
+REWRITE_LABELS = {
+    "no_history": "não necessária (sem histórico)",
+    "skipped": "dispensada (pergunta autocontida)",
+    "memo": "reaproveitada (memoizada)",
+    "llm": "feita pelo LLM"
+}
 
 
 def setup_qa_chain(api_key, model_name="gpt-3.5-turbo", embedding_model="huggingface"):
-    """Configura a cadeia de QA com base nos parâmetros selecionados."""
+    """Configura a cadeia de QA com base nos parâmetros selecionados.
+
+    A cadeia é construída uma única vez por configuração e compartilhada entre
+    as sessões através do registro de recursos. O índice é resolvido a cada
+    pergunta: depois de uma reconstrução, a próxima já usa a nova versão.
+    """
     try:
         index_path = Path("data/index")
         if not index_path.exists():
             return None, "O índice de documentos não existe. Carregue documentos primeiro."
 
-        processor = PDFProcessor(
-            embedding_model_type=embedding_model,
-            openai_api_key=api_key if embedding_model == "openai" else None
+        persist_directory = resolve_index(str(index_path))
+        qa_chain = get_qa_chain(
+            api_key,
+            model_name,
+            embedding_model,
+            factory=lambda: build_qa_chain(api_key, model_name, embedding_model, persist_directory=persist_directory),
+            persist_directory=persist_directory
         )
+        return qa_chain, None
+
+    except Exception as e:
+        logger.error(f"Erro ao configurar a cadeia de QA: {e}")
+        return None, f"Erro ao configurar o sistema: {str(e)}"
+
 
-        retriever = processor.db.as_retriever(search_type="similarity", search_kwargs={"k": 4})
+def build_qa_chain(
+    api_key,
+    model_name="gpt-3.5-turbo",
+    embedding_model="huggingface",
+    llm=None,
+    context_tokens=None,
+    persist_directory="data/index"
+):
+    """Constrói a cadeia de QA (reformulação com histórico + busca + resposta).
+
+    `llm` substitui o modelo indicado por `model_name` (ex.: um modelo local
+    simulado no processamento em lote). `context_tokens` substitui o orçamento
+    de tokens do contexto do modelo (ver `CONTEXT_TOKEN_BUDGETS` em app/context.py).
+    """
+    # Versão ativa do índice, fixa durante a vida da cadeia
+    persist_directory = resolve_index(persist_directory)
+    db = get_vectorstore(
+        embedding_model_type=embedding_model,
+        openai_api_key=api_key if embedding_model == "openai" else None,
+        persist_directory=persist_directory
+    )
+
+    if llm is None:
         llm = get_llm_model(model_name, api_key)
 
-        # Atual: o prompt se chama `question_prompt` na nova versão
-        question_prompt = PromptTemplate.from_template("""
-        Você está atuando como um reformulador de perguntas em um sistema de chat sobre investimentos.
+    # Atual: o prompt se chama `question_prompt` na nova versão
+    question_prompt = PromptTemplate.from_template("""
+    Você está atuando como um reformulador de perguntas em um sistema de chat sobre investimentos.
 
-        Dado o histórico da conversa e a pergunta atual, reformule a pergunta de forma **independente**, clara e objetiva, garantindo que ela **possa ser compreendida fora do contexto**.
+    Dado o histórico da conversa e a pergunta atual, reformule a pergunta de forma **independente**, clara e objetiva, garantindo que ela **possa ser compreendida fora do contexto**.
 
-        Não altere o significado, apenas reescreva para que fique completa e autocontida.
+    Não altere o significado, apenas reescreva para que fique completa e autocontida.
 
-        HISTÓRICO DO CHAT:
-        {chat_history}
+    HISTÓRICO DO CHAT:
+    {chat_history}
 
-        PERGUNTA ATUAL:
-        {input}
+    PERGUNTA ATUAL:
+    {input}
 
-        PERGUNTA REFORMULADA:
-        """)
+    PERGUNTA REFORMULADA:
+    """)
 
-        retriever_with_history = create_history_aware_retriever(
-            llm=llm,
-            retriever=retriever,
-            prompt=question_prompt
-        )
+    # Resumo incremental das trocas antigas da conversa (ver app/memory.py)
+    summary_prompt = PromptTemplate.from_template("""
+    Você mantém o resumo de uma conversa entre um usuário e um assistente sobre investimentos.
 
-        qa_prompt = PromptTemplate.from_template("""
-        Você é um assistente especializado em finanças pessoais e investimentos. 
-        Seu objetivo é ajudar o usuário a compreender conceitos com base nos documentos fornecidos.
+    Atualize o resumo anterior incorporando as novas trocas. Preserve os temas, produtos, termos e valores citados, para que perguntas seguintes possam se referir a eles. Responda apenas com o resumo, em no máximo 120 palavras.
 
-        ⚠️ Regras importantes:
-        - **Nunca** invente informações.
-        - **Nunca** dê sugestões de investimento, recomendação de compra ou previsão de mercado.
-        - Use **somente** as informações disponíveis nos documentos.
-        - Caso a resposta não esteja clara nos documentos, diga honestamente que **não há dados suficientes para responder**.
-        - Seja didático, claro e objetivo. Assuma que a pessoa é leiga no assunto.
-        - Sempre que possível, use analogias simples e organize a resposta em etapas ou tópicos.
-        - Ao explicar algo, seja detalhista em como realizar aquilo, com exemplos.
+    RESUMO ANTERIOR:
+    {summary}
 
-        DOCUMENTOS FORNECIDOS:
-        {context}
+    NOVAS TROCAS:
+    {turns}
 
-        PERGUNTA DO USUÁRIO:
-        {input}
+    RESUMO ATUALIZADO:
+    """)
 
-        RESPOSTA DETALHADA:
-        """)
+    qa_prompt = PromptTemplate.from_template("""
+    Você é um assistente especializado em finanças pessoais e investimentos. 
+    Seu objetivo é ajudar o usuário a compreender conceitos com base nos documentos fornecidos.
 
-        combine_docs_chain = create_stuff_documents_chain(
-            llm=llm,
-            prompt=qa_prompt
-        )
+    ⚠️ Regras importantes:
+    - **Nunca** invente informações.
+    - **Nunca** dê sugestões de investimento, recomendação de compra ou previsão de mercado.
+    - Use **somente** as informações disponíveis nos documentos.
+    - Caso a resposta não esteja clara nos documentos, diga honestamente que **não há dados suficientes para responder**.
+    - Seja didático, claro e objetivo. Assuma que a pessoa é leiga no assunto.
+    - Sempre que possível, use analogias simples e organize a resposta em etapas ou tópicos.
+    - Ao explicar algo, seja detalhista em como realizar aquilo, com exemplos.
 
-        qa_chain = create_retrieval_chain(
-            retriever=retriever_with_history,
-            combine_docs_chain=combine_docs_chain
-        )
+    DOCUMENTOS FORNECIDOS:
+    {context}
 
-        return qa_chain, None
+    PERGUNTA DO USUÁRIO:
+    {input}
 
-    except Exception as e:
-        logger.error(f"Erro ao configurar a cadeia de QA: {e}")
-        return None, f"Erro ao configurar o sistema: {str(e)}"
+    RESPOSTA DETALHADA:
+    """)
+
+    # Cache semântico de respostas, esvaziado sempre que o índice muda
+    answer_cache = SemanticAnswerCache(
+        version_fn=lambda: read_index_version(persist_directory)
+    )
+
+    qa_chain = QAChain(
+        llm=llm,
+        vectorstore=db,
+        question_prompt=question_prompt,
+        qa_prompt=qa_prompt,
+        k=4,
+        answer_cache=answer_cache,
+        context_builder=ContextBuilder.for_model(model_name, context_tokens),
+        summary_prompt=summary_prompt
+    )
+
+    return qa_chain
 
 
 def chat_section():
@@ -112,7 +168,8 @@ def chat_section():
 
     
     # Configurações do modelo de linguagem
-    with st.expander("⚙️ Configurações do Agente", expanded=False):
+    settings = st.expander("⚙️ Configurações do Agente", expanded=False)
+    with settings:
         col1, col2 = st.columns(2)
         
         with col1:
@@ -138,19 +195,41 @@ def chat_section():
                 index=0,
                 key="chat_embedding_model"
             )
+            
+            use_answer_cache = st.checkbox(
+                "Cache de respostas",
+                value=True,
+                key="chat_use_answer_cache",
+                help="Reaproveita respostas de perguntas equivalentes já feitas (invalidado quando os documentos mudam)"
+            )
+            
+            stream_answers = st.checkbox(
+                "Exibir resposta em tempo real",
+                value=True,
+                key="chat_stream_answers",
+                help="Mostra os tokens da resposta à medida que são gerados"
+            )
     
     # Verificar se já temos documentos carregados
     index_path = Path("data/index")
     if not index_path.exists() or not any(os.listdir(index_path)) if index_path.exists() else True:
-        st.warning("⚠️ Nenhum documento carregado. Por favor, adicione PDFs na aba de Upload primeiro.")
+        st.warning("⚠️ Nenhum documento carregado. Por favor, adicione PDFs na seção de Gerenciamento de Documentos primeiro.")
         return
     
-    # Inicializar a cadeia de QA
-    qa_chain, error = setup_qa_chain(api_key, llm_model, embedding_model)
-    
-    if error:
-        st.error(f"❌ {error}")
-        return
+    # Filtro de módulos (em índices por módulo, sem filtro os shards são escolhidos automaticamente).
+    # Os módulos vêm do catálogo: a cadeia de QA (embeddings, Chroma, LLM) só é montada ao perguntar.
+    try:
+        modules = list_indexed_modules()
+    except Exception as e:
+        logger.error(f"Erro ao listar os módulos: {e}")
+        modules = []
+    with settings:
+        selected_modules = st.multiselect(
+            "Módulos consultados",
+            options=modules,
+            key="chat_modules",
+            help="Restringe a busca aos módulos escolhidos. Vazio: todos (ou roteamento automático em índices por módulo)."
+        )
     
     # Inicializa o histórico se ainda não existir
     if "messages" not in st.session_state:
@@ -167,8 +246,20 @@ def chat_section():
             if message["role"] == "assistant" and "sources" in message:
                 with st.expander("🔍 Ver Fontes"):
                     st.markdown(message["sources"])
+                    if message.get("timings"):
+                        st.caption(f"Etapas: {message['timings']}")
+                    if message.get("cache_hit"):
+                        st.caption("⚡ Resposta do cache")
     
     if user_query:
+        # Inicializar a cadeia de QA (já aquecida em segundo plano, ver app/startup.py)
+        with st.spinner("Carregando o modelo..."):
+            qa_chain, error = setup_qa_chain(api_key, llm_model, embedding_model)
+        
+        if error:
+            st.error(f"❌ {error}")
+            return
+        
         # Adicionar mensagem do usuário ao histórico
         st.session_state.messages.append({"role": "user", "content": user_query})
         
@@ -181,41 +272,92 @@ def chat_section():
             message_placeholder = st.empty()
             
             try:
-                with st.spinner("Buscando informações..."):
-                    # Executar a consulta na cadeia de QA
-                    chat_history = [(msg["content"], res["content"]) 
-                                    for msg, res in zip(st.session_state.messages[::2], st.session_state.messages[1::2]) 
-                                    if msg["role"] == "user" and res["role"] == "assistant"]
-                    
-                    start_time = time.time()
-                    response = qa_chain.invoke({"input": user_query, "chat_history": chat_history})
-                    end_time = time.time()
-
-                    print(f'RESPONSE: {response}')
-                    
-                    answer = response["answer"]
-                    source_documents = response["context"]
-                    
-                    # Formatar as fontes para exibição
+                # Executar a consulta na cadeia de QA, com o histórico limitado da memória
+                # (trocas recentes literais e um resumo das anteriores)
+                memory = st.session_state.chat_memory
+                inputs = {"input": user_query, "chat_history": memory.history(), "modules": selected_modules}
+                
+                start_time = time.time()
+                first_token_time = None
+                trace = Trace("qa", streamed=stream_answers)
+                
+                if stream_answers:
+                    # Escrever os tokens no placeholder à medida que chegam
+                    response = {}
+                    answer = ""
+                    with st.spinner("Buscando informações..."):
+                        stream = qa_chain.stream(inputs, use_cache=use_answer_cache, trace=trace)
+                        response.update(next(stream))
+                    for chunk in stream:
+                        if "answer" in chunk:
+                            if first_token_time is None:
+                                first_token_time = time.time()
+                            answer += chunk["answer"]
+                            message_placeholder.markdown(answer + "▌")
+                    response["answer"] = answer
+                else:
+                    with st.spinner("Buscando informações..."):
+                        response = qa_chain.invoke(inputs, use_cache=use_answer_cache, trace=trace)
+                end_time = time.time()
+                
+                answer = response["answer"]
+                source_documents = response["context"]
+                
+                # Formatar as fontes para exibição
+                with trace.span("format_sources", documents=len(source_documents)):
                     if not source_documents:
                         sources_text = "_Nenhuma fonte foi usada._"
                     else:
-                        sources_text = format_sources(source_documents)
-                    
-                    # Exibir a resposta
-                    message_placeholder.markdown(answer)
-                    
-                    # Exibir as fontes em um expander
-                    with st.expander("🔍 Ver Fontes"):
-                        st.markdown(sources_text)
-                        st.caption(f"Tempo de resposta: {end_time - start_time:.2f} segundos")
-                    
-                    # Adicionar resposta ao histórico
-                    st.session_state.messages.append({
-                        "role": "assistant",
-                        "content": answer,
-                        "sources": sources_text
-                    })
+                        references = get_duplicate_references([doc.id for doc in source_documents])
+                        sources_text = format_sources(source_documents, references)
+                
+                trace.finish(cache_hit=response.get("cache_hit", False), rewrite_mode=response.get("rewrite_mode"))
+                export_trace(trace)
+                timings = format_timings(trace.breakdown(), trace.duration_ms)
+                logger.info(f"Pergunta respondida em {trace.duration_ms / 1000:.2f}s: {timings}")
+                
+                # Exibir a resposta
+                message_placeholder.markdown(answer)
+                
+                # Exibir as fontes em um expander
+                with st.expander("🔍 Ver Fontes"):
+                    st.markdown(sources_text)
+                    st.caption(f"Tempo de resposta: {end_time - start_time:.2f} segundos")
+                    if first_token_time is not None:
+                        st.caption(f"Primeiro token: {first_token_time - start_time:.2f} segundos")
+                    st.caption(f"Etapas: {timings}")
+                    st.caption(
+                        f"Histórico enviado: ~{memory.tokens()} tokens "
+                        f"({len(memory.turns)} trocas recentes, {memory.summarized_turns} resumidas)"
+                    )
+                    rewrite_stats = qa_chain.rewriter.stats()
+                    st.caption(
+                        f"Reformulação: {REWRITE_LABELS.get(response.get('rewrite_mode'), '-')} · "
+                        f"sem LLM em {rewrite_stats['skip_rate']:.0%} das perguntas com histórico, "
+                        f"memoizadas {rewrite_stats['memo_hit_rate']:.0%}"
+                    )
+                    if response.get("cache_hit"):
+                        st.caption(
+                            f"⚡ Resposta do cache (similaridade {response['cache_similarity']:.2f} "
+                            f"com: _{response['standalone_question']}_)"
+                        )
+                
+                # Adicionar resposta ao histórico
+                st.session_state.messages.append({
+                    "role": "assistant",
+                    "content": answer,
+                    "sources": sources_text,
+                    "cache_hit": response.get("cache_hit", False),
+                    "timings": timings
+                })
+                
+                # Depois de exibir a resposta: as trocas que saem da janela são resumidas
+                memory.summarize_fn = qa_chain.summarize
+                memory_trace = Trace("chat_memory")
+                memory.add_turn(user_query, answer, memory_trace)
+                if memory_trace.breakdown():
+                    memory_trace.finish(summarized_turns=memory.summarized_turns, history_tokens=memory.tokens())
+                    export_trace(memory_trace)
             
             except Exception as e:
                 logger.error(f"Erro durante a consulta: {e}")
@@ -230,4 +372,6 @@ def chat_section():
 def clear_chat_history():
     """Limpa o histórico de chat."""
     st.session_state.messages = []
-    st.session_state.chat_history = [] 
\ No newline at end of file
+    st.session_state.chat_history = []
+    if "chat_memory" in st.session_state:
+        st.session_state.chat_memory.clear()
\ No newline at end of file
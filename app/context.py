@@ -0,0 +1,232 @@
+import re
+import logging
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+from ingest.tracing import estimate_tokens
+
+# Configuração de logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Orçamento de tokens do contexto (documentos) por modelo oferecido na interface
+# (app/chat.py); o restante da janela fica para as instruções, a pergunta e a resposta
+CONTEXT_TOKEN_BUDGETS = {
+    "gpt-3.5-turbo": 1500,
+    "gpt-4o": 2500
+}
+DEFAULT_CONTEXT_TOKENS = 1500
+
+# Sobreposição mínima (em caracteres) para considerar que dois chunks são vizinhos no texto
+MIN_OVERLAP = 20
+
+# Linhas menores que isso (títulos, cabeçalhos, números) não passam pela deduplicação
+MIN_DEDUP_LINE = 40
+
+# Abaixo disso não vale a pena incluir um trecho truncado do próximo documento
+MIN_TRUNCATED_TOKENS = 64
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def _normalize(text: str) -> str:
+    return _WHITESPACE.sub(" ", text).strip().lower()
+
+
+def token_counter(model_name: Optional[str] = None) -> Callable[[str], int]:
+    """Contador de tokens do modelo (tiktoken, se instalado) ou a estimativa de ~4 caracteres por token."""
+    if model_name:
+        try:
+            import tiktoken
+            encoding = tiktoken.encoding_for_model(model_name)
+            return lambda text: len(encoding.encode(text, disallowed_special=()))
+        except ImportError:
+            pass
+        except Exception as e:
+            # Modelo desconhecido ou arquivo do tokenizer indisponível (o tiktoken o baixa na primeira vez)
+            logger.warning(f"Tokenizer do modelo {model_name} indisponível, usando estimativa: {e}")
+    return estimate_tokens
+
+
+def _page_range(doc: Document) -> Tuple[int, int]:
+    page = doc.metadata.get("page")
+    if not isinstance(page, int):
+        return (-1, -1)
+    return (page, doc.metadata.get("page_end") or page)
+
+
+def _text_overlap(first: str, second: str) -> int:
+    """Tamanho do maior sufixo de `first` que é prefixo de `second` (0 se menor que MIN_OVERLAP)."""
+    if len(first) < MIN_OVERLAP or len(second) < MIN_OVERLAP:
+        return 0
+    probe = second[:MIN_OVERLAP]
+    start = max(len(first) - len(second), 0)
+    position = first.find(probe, start)
+    while position >= 0:
+        if second.startswith(first[position:]):
+            return len(first) - position
+        position = first.find(probe, position + 1)
+    return 0
+
+
+class ContextBuilder:
+    """Monta o contexto do prompt a partir dos chunks recuperados.
+
+    Os chunks vizinhos de uma mesma fonte (páginas iguais ou adjacentes) que se
+    sobrepõem no texto — o `chunk_overlap` do splitter — são unidos em um só
+    trecho, sem repetir a sobreposição; chunks contidos em outro e linhas
+    longas já vistas em outro trecho são descartados. Os trechos entram na
+    ordem de relevância (a do melhor chunk de cada um) até preencher
+    `token_budget`; o primeiro que não couber é truncado no fim da última
+    frase que cabe, ou descartado se sobrar pouco espaço.
+    """
+
+    def __init__(self, token_budget: int = DEFAULT_CONTEXT_TOKENS, count_tokens: Optional[Callable[[str], int]] = None):
+        self.token_budget = token_budget
+        self.count_tokens = count_tokens or estimate_tokens
+
+    @classmethod
+    def for_model(cls, model_name: str, token_budget: Optional[int] = None) -> "ContextBuilder":
+        """Construtor com o orçamento e o tokenizer do modelo."""
+        if token_budget is None:
+            token_budget = CONTEXT_TOKEN_BUDGETS.get(model_name, DEFAULT_CONTEXT_TOKENS)
+        return cls(token_budget, token_counter(model_name))
+
+    def build(self, documents: List[Document]) -> Tuple[List[Document], Dict[str, Any]]:
+        """Retorna os trechos do contexto e estatísticas da montagem (para o trace)."""
+        groups, merged, duplicates = self._merge(documents)
+        passages, removed_lines = self._dedup_lines(groups)
+
+        context: List[Document] = []
+        used = 0
+        truncated = 0
+        for doc in passages:
+            remaining = self.token_budget - used
+            tokens = self.count_tokens(doc.page_content)
+            if tokens > remaining:
+                if remaining >= MIN_TRUNCATED_TOKENS:
+                    doc = self._truncate(doc, remaining)
+                    if doc is not None:
+                        context.append(doc)
+                        used += self.count_tokens(doc.page_content)
+                        truncated += 1
+                break
+            context.append(doc)
+            used += tokens
+
+        stats = {
+            "documents_in": len(documents),
+            "documents": len(context),
+            "merged": merged,
+            "duplicates": duplicates,
+            "removed_lines": removed_lines,
+            "truncated": truncated,
+            "dropped": len(passages) - len(context),
+            "tokens_in": sum(self.count_tokens(doc.page_content) for doc in documents),
+            "tokens": used,
+            "token_budget": self.token_budget
+        }
+        return context, stats
+
+    def _merge(self, documents: List[Document]) -> Tuple[List[Document], int, int]:
+        """Une chunks sobrepostos da mesma fonte; retorna (trechos, uniões, duplicados)."""
+        # Cada grupo: [posição do melhor chunk, fonte, (página inicial, final), texto, metadados, id]
+        groups: List[List[Any]] = []
+        merged = 0
+        duplicates = 0
+        for rank, doc in enumerate(documents):
+            text = doc.page_content.strip()
+            normalized = _normalize(text)
+            if not normalized or any(normalized in _normalize(group[3]) for group in groups):
+                duplicates += 1
+                continue
+            group = [rank, doc.metadata.get("source"), _page_range(doc), text, dict(doc.metadata), doc.id]
+            # Um chunk novo pode unir dois trechos já montados: repetir até não haver mudança
+            changed = True
+            while changed:
+                changed = False
+                for other in groups:
+                    combined = self._combine(group, other)
+                    if combined is not None:
+                        groups.remove(other)
+                        group = combined
+                        merged += 1
+                        changed = True
+                        break
+            groups.append(group)
+
+        groups.sort(key=lambda group: group[0])
+        passages = []
+        for rank, source, (page, page_end), text, metadata, doc_id in groups:
+            if page >= 0:
+                metadata["page"] = page
+                metadata.pop("page_end", None)
+                if page_end > page:
+                    metadata["page_end"] = page_end
+            passages.append(Document(page_content=text, metadata=metadata, id=doc_id))
+        return passages, merged, duplicates
+
+    @staticmethod
+    def _combine(first: List[Any], second: List[Any]) -> Optional[List[Any]]:
+        """Une dois trechos da mesma fonte e de páginas vizinhas, se um continua o outro."""
+        if first[1] != second[1] or first[2][0] < 0 or second[2][0] < 0:
+            return None
+        (first_start, first_end), (second_start, second_end) = first[2], second[2]
+        if first_start > second_end + 1 or second_start > first_end + 1:
+            return None
+
+        if second[3] in first[3]:
+            text = first[3]
+        elif first[3] in second[3]:
+            text = second[3]
+        else:
+            overlap = _text_overlap(first[3], second[3])
+            if overlap:
+                text = first[3] + second[3][overlap:]
+            else:
+                overlap = _text_overlap(second[3], first[3])
+                if not overlap:
+                    return None
+                text = second[3] + first[3][overlap:]
+
+        best = first if first[0] <= second[0] else second
+        pages = (min(first_start, second_start), max(first_end, second_end))
+        return [best[0], best[1], pages, text, best[4], best[5]]
+
+    @staticmethod
+    def _dedup_lines(passages: List[Document]) -> Tuple[List[Document], int]:
+        """Remove linhas longas repetidas de trechos anteriores (ex.: mesmo parágrafo em dois PDFs)."""
+        seen = set()
+        removed = 0
+        result = []
+        for doc in passages:
+            lines = []
+            for line in doc.page_content.split("\n"):
+                key = _normalize(line)
+                if len(key) >= MIN_DEDUP_LINE:
+                    if key in seen:
+                        removed += 1
+                        continue
+                    seen.add(key)
+                lines.append(line)
+            text = "\n".join(lines).strip()
+            if text:
+                result.append(Document(page_content=text, metadata=doc.metadata, id=doc.id))
+        return result, removed
+
+    def _truncate(self, doc: Document, token_budget: int) -> Optional[Document]:
+        """Corta o trecho no fim da última frase (ou linha) que cabe no orçamento."""
+        text = doc.page_content
+        # Estimativa inicial proporcional, corrigida se o tokenizer discordar
+        limit = len(text) * token_budget // max(self.count_tokens(text), 1)
+        while limit > 0 and self.count_tokens(text[:limit]) > token_budget:
+            limit = limit * 9 // 10
+        cut = text[:limit]
+        boundary = max(cut.rfind(". "), cut.rfind(".\n"), cut.rfind("\n"))
+        if boundary > 0:
+            cut = cut[:boundary + 1]
+        cut = cut.strip()
+        if not cut:
+            return None
+        return Document(page_content=cut, metadata={**doc.metadata, "truncated": True}, id=doc.id)
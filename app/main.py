@@ -7,8 +7,7 @@ import logging
 # Adiciona o diretório do projeto ao PATH para importações relativas
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from app.chat import chat_section, clear_chat_history
-from app.upload import upload_section, document_management_section
+from app.startup import report as startup
 from app.utils import initialize_session_state
 from dotenv import load_dotenv
 
@@ -30,6 +29,10 @@ st.set_page_config(
 # Inicializar variáveis de estado da sessão
 initialize_session_state()
 
+# Carregar o modelo de embeddings e abrir o índice em segundo plano (uma vez por processo),
+# enquanto a página é desenhada; cada seção importa seu módulo só quando é selecionada
+startup.start_warmup()
+
 # Função para verificar se o diretório de PDFs existe e contém arquivos
 def check_pdfs_loaded():
     pdf_dir = Path("data/pdfs")
@@ -58,11 +61,21 @@ with st.sidebar:
     
     # Opções
     if st.button("🧹 Limpar Chat", use_container_width=True):
-        clear_chat_history()
+        startup.lazy_import("app.chat").clear_chat_history()
         st.rerun()
     
     st.markdown("---")
     
+    # Tempo de inicialização do processo (importações pesadas e aquecimento)
+    startup_summary = startup.summary()
+    warmup_text = {
+        "done": f"{startup_summary['warmup_seconds']:.1f}s",
+        "running": "em andamento...",
+        "failed": "falhou",
+        "disabled": "desativado"
+    }[startup_summary["warmup_status"]]
+    st.caption(f"⏱️ Inicialização: importações {startup_summary['imports_seconds']:.1f}s · aquecimento {warmup_text}")
+    
     # Informações do sistema
     st.caption("Desenvolvido com LangChain, ChromaDB e Streamlit")
     st.caption("v1.0.0 - 2023")
@@ -71,16 +84,26 @@ with st.sidebar:
 # Corpo principal
 st.title("📚 Invest Guru 🤖")
 
-# Abas para as diferentes seções
-tab1, tab2 = st.tabs(["💬 Chat", "📤 Gerenciamento de Documentos"])
-
-with tab1:
-    chat_section()
+# Seletor das seções: ao contrário de st.tabs, que executa o conteúdo de todas as abas a cada
+# execução, só a seção ativa é desenhada e só o módulo dela é importado
+section = st.radio(
+    "Seção",
+    ["💬 Chat", "📤 Gerenciamento de Documentos"],
+    horizontal=True,
+    label_visibility="collapsed",
+    key="active_section"
+)
 
-with tab2:
-    upload_section()
+if section == "💬 Chat":
+    startup.lazy_import("app.chat").chat_section()
+else:
+    upload = startup.lazy_import("app.upload")
+    upload.upload_section()
     st.markdown("---")
-    document_management_section()
+    upload.document_management_section()
+
+# Exporta o trace de inicialização assim que o aquecimento terminar
+startup.export_once()
 
 if __name__ == "__main__":
     # Aqui poderia ter código adicional para inicialização se necessário
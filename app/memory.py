@@ -0,0 +1,113 @@
+import logging
+from typing import Callable, List, Optional, Tuple
+
+from ingest.tracing import Trace, estimate_tokens
+
+# Configuração de logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Rótulo da troca sintética que leva o resumo para o prompt de reformulação
+SUMMARY_LABEL = "Resumo da conversa anterior"
+
+# Uma troca da conversa: (pergunta do usuário, resposta do assistente)
+Turn = Tuple[str, str]
+
+
+def _clip(text: str, max_tokens: int, count_tokens: Callable[[str], int]) -> str:
+    """Mantém o fim do texto (a parte mais recente) dentro de `max_tokens`."""
+    if count_tokens(text) <= max_tokens:
+        return text
+    keep = len(text) * max_tokens // max(count_tokens(text), 1)
+    while keep > 0 and count_tokens(text[-keep:]) > max_tokens:
+        keep = keep * 9 // 10
+    clipped = text[-keep:] if keep > 0 else ""
+    # Começar em uma palavra inteira
+    space = clipped.find(" ")
+    return clipped[space + 1:] if 0 <= space < 40 else clipped
+
+
+class ConversationMemory:
+    """Memória da conversa de uma sessão, com tamanho limitado.
+
+    As últimas `max_turns` trocas vão literais para o prompt de reformulação;
+    as mais antigas são incorporadas a um resumo atualizado incrementalmente
+    (só as trocas que saem da janela passam pelo `summarize_fn`, uma vez). As
+    trocas recentes e o resumo também respeitam `token_budget`: se uma resposta
+    longa estourar o orçamento, mais trocas vão para o resumo (sempre fica a
+    última), cada resposta guardada é limitada a `answer_tokens` e o resumo é
+    cortado em `summary_tokens`.
+
+    Sem `summarize_fn` (ou se ele falhar), o resumo guarda apenas as perguntas
+    anteriores, que é o que a reformulação mais usa.
+    """
+
+    def __init__(
+        self,
+        summarize_fn: Optional[Callable[[str, List[Turn]], str]] = None,
+        max_turns: int = 3,
+        token_budget: int = 1000,
+        summary_tokens: int = 250,
+        answer_tokens: int = 400,
+        count_tokens: Optional[Callable[[str], int]] = None
+    ):
+        self.summarize_fn = summarize_fn
+        self.max_turns = max_turns
+        self.token_budget = token_budget
+        self.summary_tokens = summary_tokens
+        self.answer_tokens = answer_tokens
+        self.count_tokens = count_tokens or estimate_tokens
+        self.summary = ""
+        self.turns: List[Turn] = []
+        self.summarized_turns = 0
+
+    def history(self) -> List[Turn]:
+        """Histórico para a cadeia de QA: o resumo (como uma troca) seguido das trocas recentes."""
+        if not self.summary:
+            return list(self.turns)
+        return [(SUMMARY_LABEL, self.summary)] + self.turns
+
+    def tokens(self) -> int:
+        """Tokens do histórico enviado à cadeia."""
+        return sum(self.count_tokens(question) + self.count_tokens(answer) for question, answer in self.history())
+
+    def add_turn(self, question: str, answer: str, trace: Optional[Trace] = None):
+        """Registra uma troca e, se a janela ou o orçamento estourarem, resume as mais antigas."""
+        answer_tokens = self.count_tokens(answer)
+        if answer_tokens > self.answer_tokens:
+            # O início da resposta basta para a reformulação entender a que a próxima pergunta se refere
+            answer = answer[:len(answer) * self.answer_tokens // answer_tokens].rstrip() + " [...]"
+        self.turns.append((question, answer))
+
+        overflow = max(len(self.turns) - self.max_turns, 0)
+        recent_tokens = [self.count_tokens(q) + self.count_tokens(a) for q, a in self.turns]
+        budget = self.token_budget - min(self.count_tokens(self.summary), self.summary_tokens)
+        while overflow < len(self.turns) - 1 and sum(recent_tokens[overflow:]) > budget:
+            overflow += 1
+        if not overflow:
+            return
+
+        folded, self.turns = self.turns[:overflow], self.turns[overflow:]
+        trace = trace or Trace("chat_memory")
+        with trace.span("summarize", turns=len(folded)) as span:
+            summary = None
+            if self.summarize_fn is not None:
+                try:
+                    summary = self.summarize_fn(self.summary, folded).strip()
+                    span["tokens"] = self.count_tokens(summary) + sum(
+                        self.count_tokens(q) + self.count_tokens(a) for q, a in folded
+                    )
+                except Exception as e:
+                    logger.error(f"Erro ao resumir o histórico da conversa: {e}")
+            if not summary:
+                span["fallback"] = True
+                questions = "; ".join(question.strip() for question, _ in folded)
+                summary = f"{self.summary}; {questions}" if self.summary else f"Perguntas anteriores: {questions}"
+            self.summary = _clip(summary, self.summary_tokens, self.count_tokens)
+        self.summarized_turns += len(folded)
+        logger.info(f"{len(folded)} troca(s) incorporada(s) ao resumo da conversa ({self.summarized_turns} no total)")
+
+    def clear(self):
+        self.summary = ""
+        self.turns = []
+        self.summarized_turns = 0
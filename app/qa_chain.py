@@ -0,0 +1,373 @@
+import time
+import asyncio
+import logging
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from langchain_core.documents import Document
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import PromptTemplate, format_document
+
+from app.answer_cache import SemanticAnswerCache
+from app.context import ContextBuilder
+from app.rewrite import QuestionRewriter
+from ingest.tracing import Trace, estimate_tokens, export_trace
+
+# Configuração de logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Mesmo formato de `create_stuff_documents_chain`: o conteúdo de cada documento, separados por linha em branco
+DOCUMENT_PROMPT = PromptTemplate.from_template("{page_content}")
+DOCUMENT_SEPARATOR = "\n\n"
+
+
+def _usage_attributes(message, prompt_text: str, answer: str) -> Dict[str, Any]:
+    """Tokens do prompt e da resposta, informados pelo modelo ou estimados."""
+    usage = getattr(message, "usage_metadata", None)
+    if usage:
+        return {"prompt_tokens": usage["input_tokens"], "completion_tokens": usage["output_tokens"]}
+    return {
+        "prompt_tokens": estimate_tokens(prompt_text),
+        "completion_tokens": estimate_tokens(answer),
+        "tokens_estimated": True
+    }
+
+
+class QAChain:
+    """Cadeia de QA em estágios: reformulação da pergunta, busca e resposta.
+
+    Mantém a mesma interface de `create_retrieval_chain` (`invoke` recebe
+    "input" e "chat_history" e retorna "answer" e "context"), mas expõe cada
+    estágio para que a pergunta reformulada possa ser consultada no cache
+    semântico de respostas antes da busca e da chamada ao LLM. Cada estágio
+    é medido em um `Trace` (retornado em "trace" e exportado ao final, a não
+    ser que o chamador forneça o próprio trace para completar e exportar).
+
+    Com `context_builder`, os chunks recuperados passam por um estágio que une
+    os sobrepostos, remove texto repetido e limita o contexto ao orçamento de
+    tokens do modelo; "context" passa a conter os trechos enviados ao LLM.
+    """
+
+    def __init__(
+        self,
+        llm,
+        vectorstore,
+        question_prompt,
+        qa_prompt,
+        k: int = 4,
+        answer_cache: Optional[SemanticAnswerCache] = None,
+        context_builder: Optional[ContextBuilder] = None,
+        summary_prompt=None
+    ):
+        self.llm = llm
+        self.vectorstore = vectorstore
+        self.k = k
+        self.answer_cache = answer_cache
+        self.context_builder = context_builder
+        self.qa_prompt = qa_prompt
+        self.rephrase_chain = question_prompt | llm | StrOutputParser()
+        self.summary_chain = summary_prompt | llm | StrOutputParser() if summary_prompt is not None else None
+        self.rewriter = QuestionRewriter(self._llm_rephrase)
+
+    def _llm_rephrase(self, question: str, chat_history: List[Any]) -> str:
+        return self.rephrase_chain.invoke({"input": question, "chat_history": chat_history})
+    
+    async def _allm_rephrase(self, question: str, chat_history: List[Any]) -> str:
+        return await self.rephrase_chain.ainvoke({"input": question, "chat_history": chat_history})
+
+    def rephrase(self, question: str, chat_history: List[Any]) -> Tuple[str, str]:
+        """Reformula a pergunta para ser independente do histórico.
+
+        Retorna (pergunta, modo); o LLM só é chamado quando a pergunta parece
+        depender da conversa e a reformulação não está memoizada.
+        """
+        return self.rewriter.rewrite(question, chat_history)
+
+    def summarize(self, summary: str, turns: List[Tuple[str, str]]) -> str:
+        """Atualiza o resumo da conversa com as trocas que saem da memória (ver app/memory.py)."""
+        if self.summary_chain is None:
+            raise ValueError("Cadeia sem prompt de resumo")
+        formatted_turns = "\n".join(f"Usuário: {question}\nAssistente: {answer}" for question, answer in turns)
+        return self.summary_chain.invoke({"summary": summary or "(vazio)", "turns": formatted_turns})
+
+    def embed_question(self, question: str) -> List[float]:
+        return self.vectorstore.embeddings.embed_query(question)
+
+    def retrieve(
+        self,
+        question: str,
+        embedding: Optional[List[float]] = None,
+        modules: Optional[List[str]] = None
+    ) -> List[Document]:
+        """Busca os `k` chunks mais similares (reaproveitando o embedding já calculado).
+
+        `modules` restringe a busca a esses módulos; em um índice dividido por
+        módulo, sem filtro, os shards são escolhidos pelo centróide.
+        """
+        if embedding is None:
+            embedding = self.embed_question(question)
+        if hasattr(self.vectorstore, "select_shards"):
+            return self.vectorstore.similarity_search_by_vector(embedding, k=self.k, modules=modules)
+        search_filter = {"module": {"$in": list(modules)}} if modules else None
+        return self.vectorstore.similarity_search_by_vector(embedding, k=self.k, filter=search_filter)
+
+    def list_modules(self) -> List[str]:
+        """Módulos disponíveis para filtrar a busca."""
+        if hasattr(self.vectorstore, "list_modules"):
+            return self.vectorstore.list_modules()
+        metadatas = self.vectorstore.get(include=["metadatas"])["metadatas"]
+        return sorted({metadata["module"] for metadata in metadatas if "module" in metadata})
+
+    def build_context(self, documents: List[Document], trace: Optional[Trace] = None) -> List[Document]:
+        """Monta o contexto do prompt a partir dos chunks recuperados (sem `context_builder`, usa-os como estão)."""
+        if self.context_builder is None:
+            return documents
+        trace = trace or Trace("qa")
+        with trace.span("context") as span:
+            context, stats = self.context_builder.build(documents)
+            span.update(stats)
+        return context
+
+    def build_prompt(self, question: str, context: List[Document]):
+        """Monta o prompt de resposta com os documentos recuperados."""
+        formatted_context = DOCUMENT_SEPARATOR.join(format_document(doc, DOCUMENT_PROMPT) for doc in context)
+        return self.qa_prompt.invoke({"input": question, "context": formatted_context})
+    
+    def _llm_answer(self, span: Dict[str, Any], message, prompt) -> str:
+        """Extrai o texto da resposta e registra o uso de tokens no span do LLM."""
+        answer = StrOutputParser().invoke(message)
+        span.update(_usage_attributes(message, prompt.to_string(), answer))
+        return answer
+    
+    def answer(self, question: str, context: List[Document], trace: Optional[Trace] = None) -> str:
+        """Gera a resposta a partir dos documentos recuperados."""
+        trace = trace or Trace("qa")
+        with trace.span("prompt", documents=len(context)):
+            prompt = self.build_prompt(question, context)
+        with trace.span("llm") as span:
+            return self._llm_answer(span, self.llm.invoke(prompt), prompt)
+    
+    async def aanswer(self, question: str, context: List[Document], trace: Optional[Trace] = None) -> str:
+        """Versão assíncrona de `answer` (só a chamada ao LLM é assíncrona)."""
+        trace = trace or Trace("qa")
+        with trace.span("prompt", documents=len(context)):
+            prompt = self.build_prompt(question, context)
+        with trace.span("llm") as span:
+            return self._llm_answer(span, await self.llm.ainvoke(prompt), prompt)
+    
+    @staticmethod
+    def _record_rephrase(span: Dict[str, Any], question: str, standalone_question: str, rewrite_mode: str):
+        span["mode"] = rewrite_mode
+        if rewrite_mode == "llm":
+            span["tokens"] = estimate_tokens(question) + estimate_tokens(standalone_question)
+    
+    def _lookup(
+        self,
+        inputs: Dict[str, Any],
+        use_cache: bool,
+        standalone_question: str,
+        rewrite_mode: str,
+        embedding: List[float],
+        trace: Trace
+    ) -> Dict[str, Any]:
+        """Consulta o cache semântico e reúne o estado usado pelos passos seguintes."""
+        # Respostas filtradas por módulo não entram no cache, que é por pergunta
+        cache = self.answer_cache if use_cache and not inputs.get("modules") else None
+        cached = None
+        if cache is not None:
+            with trace.span("cache_lookup") as span:
+                cached = cache.lookup(embedding)
+                span["hit"] = cached is not None
+        
+        return {
+            "standalone_question": standalone_question,
+            "rewrite_mode": rewrite_mode,
+            "embedding": embedding,
+            "cache": cache,
+            "cached": cached
+        }
+    
+    def _prepare(self, inputs: Dict[str, Any], use_cache: bool, trace: Trace) -> Dict[str, Any]:
+        """Reformula a pergunta, calcula o embedding e consulta o cache semântico."""
+        question = inputs["input"]
+        
+        with trace.span("rephrase") as span:
+            standalone_question, rewrite_mode = self.rephrase(question, inputs.get("chat_history", []))
+            self._record_rephrase(span, question, standalone_question, rewrite_mode)
+        
+        with trace.span("embed_query", tokens=estimate_tokens(standalone_question)):
+            embedding = self.embed_question(standalone_question)
+        
+        return self._lookup(inputs, use_cache, standalone_question, rewrite_mode, embedding, trace)
+    
+    async def _aprepare(self, inputs: Dict[str, Any], use_cache: bool, trace: Trace) -> Dict[str, Any]:
+        """Versão assíncrona de `_prepare`: reformulação pela API assíncrona do LLM, embedding em thread."""
+        question = inputs["input"]
+        
+        with trace.span("rephrase") as span:
+            standalone_question, rewrite_mode = await self.rewriter.arewrite(
+                question, inputs.get("chat_history", []), self._allm_rephrase
+            )
+            self._record_rephrase(span, question, standalone_question, rewrite_mode)
+        
+        with trace.span("embed_query", tokens=estimate_tokens(standalone_question)):
+            embedding = await asyncio.to_thread(self.embed_question, standalone_question)
+        
+        return self._lookup(inputs, use_cache, standalone_question, rewrite_mode, embedding, trace)
+    
+    @staticmethod
+    def _cached_result(inputs: Dict[str, Any], state: Dict[str, Any], trace: Trace) -> Dict[str, Any]:
+        cached = state["cached"]
+        logger.info(f"Resposta do cache semântico (similaridade {cached['similarity']:.3f})")
+        return {
+            **inputs,
+            "standalone_question": state["standalone_question"],
+            "rewrite_mode": state["rewrite_mode"],
+            "answer": cached["answer"],
+            "context": cached["context"],
+            "cache_hit": True,
+            "cache_similarity": cached["similarity"],
+            "trace": trace
+        }
+    
+    @staticmethod
+    def _result(
+        inputs: Dict[str, Any],
+        state: Dict[str, Any],
+        answer: str,
+        context: List[Document],
+        trace: Trace
+    ) -> Dict[str, Any]:
+        """Guarda a resposta no cache (quando habilitado) e monta o resultado de `invoke`."""
+        if state["cache"] is not None:
+            state["cache"].store(state["embedding"], state["standalone_question"], answer, context)
+        return {
+            **inputs,
+            "standalone_question": state["standalone_question"],
+            "rewrite_mode": state["rewrite_mode"],
+            "answer": answer,
+            "context": context,
+            "cache_hit": False,
+            "trace": trace
+        }
+    
+    def invoke(
+        self,
+        inputs: Dict[str, Any],
+        use_cache: bool = True,
+        trace: Optional[Trace] = None
+    ) -> Dict[str, Any]:
+        """Executa a cadeia completa, consultando o cache semântico quando habilitado."""
+        owns_trace = trace is None
+        trace = trace or Trace("qa")
+        
+        try:
+            state = self._prepare(inputs, use_cache, trace)
+            if state["cached"] is not None:
+                return self._cached_result(inputs, state, trace)
+            
+            with trace.span("retrieve", k=self.k):
+                context = self.retrieve(state["standalone_question"], state["embedding"], inputs.get("modules"))
+            context = self.build_context(context, trace)
+            answer = self.answer(inputs["input"], context, trace)
+            return self._result(inputs, state, answer, context, trace)
+        finally:
+            if owns_trace:
+                export_trace(trace)
+    
+    async def ainvoke(
+        self,
+        inputs: Dict[str, Any],
+        use_cache: bool = True,
+        trace: Optional[Trace] = None
+    ) -> Dict[str, Any]:
+        """Versão assíncrona de `invoke`, para executar várias perguntas em paralelo.
+        
+        Os mesmos passos de `invoke`; as chamadas ao LLM usam a API assíncrona
+        do modelo e embedding e busca, síncronos no vectorstore, rodam em
+        threads do executor padrão.
+        """
+        owns_trace = trace is None
+        trace = trace or Trace("qa")
+        
+        try:
+            state = await self._aprepare(inputs, use_cache, trace)
+            if state["cached"] is not None:
+                return self._cached_result(inputs, state, trace)
+            
+            with trace.span("retrieve", k=self.k):
+                context = await asyncio.to_thread(
+                    self.retrieve, state["standalone_question"], state["embedding"], inputs.get("modules")
+                )
+            context = self.build_context(context, trace)
+            answer = await self.aanswer(inputs["input"], context, trace)
+            return self._result(inputs, state, answer, context, trace)
+        finally:
+            if owns_trace:
+                export_trace(trace)
+    
+    def stream(
+        self,
+        inputs: Dict[str, Any],
+        use_cache: bool = True,
+        trace: Optional[Trace] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """Executa a cadeia emitindo a resposta token a token.
+        
+        Primeiro emite um item com "context", "standalone_question",
+        "cache_hit" e "trace"; depois itens {"answer": <trecho>} à medida que o
+        LLM gera o texto. Uma resposta do cache é emitida em um único trecho.
+        """
+        owns_trace = trace is None
+        trace = trace or Trace("qa")
+        question = inputs["input"]
+        
+        try:
+            state = self._prepare(inputs, use_cache, trace)
+            standalone_question = state["standalone_question"]
+            cached = state["cached"]
+            
+            if cached is not None:
+                yield {
+                    "standalone_question": standalone_question,
+                    "rewrite_mode": state["rewrite_mode"],
+                    "context": cached["context"],
+                    "cache_hit": True,
+                    "cache_similarity": cached["similarity"],
+                    "trace": trace
+                }
+                yield {"answer": cached["answer"]}
+                return
+            
+            with trace.span("retrieve", k=self.k):
+                context = self.retrieve(standalone_question, state["embedding"], inputs.get("modules"))
+            context = self.build_context(context, trace)
+            yield {
+                "standalone_question": standalone_question,
+                "rewrite_mode": state["rewrite_mode"],
+                "context": context,
+                "cache_hit": False,
+                "trace": trace
+            }
+            
+            with trace.span("prompt", documents=len(context)):
+                prompt = self.build_prompt(question, context)
+            
+            parts = []
+            message = None
+            with trace.span("llm", streamed=True) as span:
+                start = time.perf_counter()
+                for chunk in self.llm.stream(prompt):
+                    if message is None:
+                        span["first_token_ms"] = round((time.perf_counter() - start) * 1000, 3)
+                    message = chunk if message is None else message + chunk
+                    if chunk.content:
+                        parts.append(chunk.content)
+                        yield {"answer": chunk.content}
+                span.update(_usage_attributes(message, prompt.to_string(), "".join(parts)))
+            
+            if state["cache"] is not None:
+                state["cache"].store(state["embedding"], standalone_question, "".join(parts), context)
+        finally:
+            if owns_trace:
+                export_trace(trace)
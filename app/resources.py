@@ -0,0 +1,275 @@
+import os
+import sys
+import hashlib
+import threading
+import logging
+from typing import Any, Callable, Dict, Optional, Tuple
+
+# Adiciona o diretório do projeto ao PATH para importações relativas
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ingest.ingest_pdf import (
+    PDFProcessor,
+    DEFAULT_HF_MODEL,
+    create_embeddings,
+    detect_backend,
+    open_vectorstore,
+    release_vectorstore
+)
+from ingest.catalog import CATALOG_FILE, SourceCatalog
+from ingest.dedup import DEDUP_FILE, ChunkDeduplicator
+from ingest.index_versions import resolve_index
+from ingest.sharded_store import is_sharded_index
+from ingest.jobs import JobQueue
+
+# Configuração de logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class ResourceRegistry:
+    """Registro de recursos do processo, compartilhado por todas as sessões do Streamlit.
+
+    Cada recurso é criado uma única vez por chave; sessões concorrentes que pedem
+    a mesma chave esperam a primeira construção em vez de duplicá-la.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._resources: Dict[Tuple, Any] = {}
+        self._key_locks: Dict[Tuple, threading.Lock] = {}
+
+    def get_or_create(self, key: Tuple, factory: Callable[[], Any]) -> Any:
+        """Retorna o recurso da chave, criando-o com `factory` se necessário."""
+        resource = self._resources.get(key)
+        if resource is not None:
+            return resource
+
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            resource = self._resources.get(key)
+            if resource is None:
+                resource = factory()
+                self._resources[key] = resource
+                logger.info(f"Recurso criado no registro: {key[0]}")
+        return resource
+
+    def invalidate(self, predicate: Callable[[Tuple], bool]) -> int:
+        """Remove os recursos cujas chaves satisfazem `predicate`."""
+        with self._lock:
+            keys = [key for key in self._resources if predicate(key)]
+            for key in keys:
+                del self._resources[key]
+                self._key_locks.pop(key, None)
+        return len(keys)
+
+    def clear(self):
+        """Remove todos os recursos."""
+        self.invalidate(lambda key: True)
+
+
+registry = ResourceRegistry()
+
+
+def hash_api_key(api_key: Optional[str]) -> str:
+    """Retorna um hash curto da API key para uso em chaves (nunca a chave em claro)."""
+    if not api_key:
+        return ""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+
+
+def _normalize_dir(persist_directory: str) -> str:
+    return os.path.abspath(persist_directory)
+
+
+def _embeddings_key(
+    embedding_model_type: str,
+    openai_api_key: Optional[str],
+    hf_model_name: str
+) -> Tuple:
+    embedding_model_type = embedding_model_type.lower()
+    if embedding_model_type == "openai":
+        return ("embeddings", embedding_model_type, "openai", hash_api_key(openai_api_key))
+    return ("embeddings", embedding_model_type, hf_model_name, "")
+
+
+def get_embeddings(
+    embedding_model_type: str = "huggingface",
+    openai_api_key: Optional[str] = None,
+    hf_model_name: str = DEFAULT_HF_MODEL
+):
+    """Retorna o modelo de embeddings já carregado para a configuração."""
+    key = _embeddings_key(embedding_model_type, openai_api_key, hf_model_name)
+    return registry.get_or_create(
+        key,
+        lambda: create_embeddings(embedding_model_type, openai_api_key, hf_model_name)
+    )
+
+
+def get_vectorstore(
+    embedding_model_type: str = "huggingface",
+    openai_api_key: Optional[str] = None,
+    hf_model_name: str = DEFAULT_HF_MODEL,
+    persist_directory: str = "data/index",
+    shard_by_module: Optional[bool] = None,
+    vector_backend: Optional[str] = None,
+    quantization: Optional[str] = None
+):
+    """Retorna o handle do vectorstore compartilhado para o índice e o modelo de embeddings.
+    
+    `shard_by_module=None` e `vector_backend=None` seguem o formato do índice
+    existente (coleção única ou uma coleção por módulo; Chroma ou NumPy). Em
+    índices com versões, abre a versão ativa (a chave muda quando ela muda).
+    """
+    persist_directory = resolve_index(persist_directory)
+    if shard_by_module is None:
+        shard_by_module = is_sharded_index(persist_directory)
+    vector_backend = vector_backend or detect_backend(persist_directory)
+    embeddings_key = _embeddings_key(embedding_model_type, openai_api_key, hf_model_name)
+    key = ("vectorstore",) + embeddings_key[1:] + (
+        _normalize_dir(persist_directory),
+        shard_by_module,
+        vector_backend,
+        quantization
+    )
+    return registry.get_or_create(
+        key,
+        lambda: open_vectorstore(
+            persist_directory,
+            get_embeddings(embedding_model_type, openai_api_key, hf_model_name),
+            shard_by_module,
+            vector_backend,
+            quantization
+        )
+    )
+
+
+def get_processor(
+    embedding_model_type: str = "huggingface",
+    openai_api_key: Optional[str] = None,
+    hf_model_name: str = DEFAULT_HF_MODEL,
+    persist_directory: str = "data/index",
+    chunk_size: int = 1000,
+    chunk_overlap: int = 200,
+    extraction_workers: int = 1,
+    batch_size: int = 64,
+    shard_by_module: Optional[bool] = None,
+    vector_backend: Optional[str] = None,
+    quantization: Optional[str] = None
+) -> PDFProcessor:
+    """Cria um PDFProcessor leve que reutiliza o modelo de embeddings e o Chroma compartilhados."""
+    persist_directory = resolve_index(persist_directory)
+    return PDFProcessor(
+        embedding_model_type=embedding_model_type,
+        openai_api_key=openai_api_key,
+        hf_model_name=hf_model_name,
+        persist_directory=persist_directory,
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        extraction_workers=extraction_workers,
+        batch_size=batch_size,
+        embeddings=get_embeddings(embedding_model_type, openai_api_key, hf_model_name),
+        db=get_vectorstore(
+            embedding_model_type,
+            openai_api_key,
+            hf_model_name,
+            persist_directory,
+            shard_by_module,
+            vector_backend,
+            quantization
+        )
+    )
+
+
+def get_qa_chain(
+    api_key: Optional[str],
+    model_name: str,
+    embedding_model: str,
+    factory: Callable[[], Any],
+    persist_directory: str = "data/index",
+    hf_model_name: str = DEFAULT_HF_MODEL
+):
+    """Retorna a cadeia de QA pronta para a configuração, construindo-a com `factory` na primeira vez."""
+    persist_directory = resolve_index(persist_directory)
+    embeddings_key = _embeddings_key(
+        embedding_model,
+        api_key if embedding_model == "openai" else None,
+        hf_model_name
+    )
+    key = ("chain",) + embeddings_key[1:] + (
+        _normalize_dir(persist_directory),
+        is_sharded_index(persist_directory),
+        detect_backend(persist_directory),
+        model_name,
+        hash_api_key(api_key)
+    )
+    return registry.get_or_create(key, factory)
+
+
+def invalidate_index(persist_directory: str = "data/index") -> int:
+    """Descarta handles do Chroma e cadeias de QA que apontam para o índice.
+
+    Deve ser chamado quando o diretório do índice é removido ou recriado; os
+    modelos de embeddings continuam carregados.
+    """
+    persist_directory = _normalize_dir(persist_directory)
+    removed = registry.invalidate(
+        lambda key: key[0] in ("vectorstore", "chain") and persist_directory in key
+    )
+    release_vectorstore(persist_directory)
+    logger.info(f"Invalidados {removed} recursos do índice {persist_directory}")
+    return removed
+
+
+def get_job_queue() -> JobQueue:
+    """Fila de jobs de ingestão do processo (único escritor do índice, compartilhado entre sessões)."""
+    return registry.get_or_create(("jobs",), JobQueue)
+
+
+def _catalog(persist_directory: str) -> Optional[SourceCatalog]:
+    """Catálogo do índice, se já existir (sem criar o diretório do índice)."""
+    if not os.path.exists(os.path.join(persist_directory, CATALOG_FILE)):
+        return None
+    catalog = SourceCatalog(persist_directory)
+    return None if catalog.is_empty() else catalog
+
+
+def _index_exists(persist_directory: str) -> bool:
+    return os.path.isdir(persist_directory) and any(os.listdir(persist_directory))
+
+
+def list_loaded_sources(persist_directory: str = "data/index", embedding_model_type: str = "huggingface"):
+    """Fontes indexadas, lidas do catálogo sem carregar o modelo de embeddings nem o Chroma.
+
+    Índices criados antes do catálogo caem no PDFProcessor, que o reconstrói
+    a partir do vectorstore na primeira vez.
+    """
+    persist_directory = resolve_index(persist_directory)
+    catalog = _catalog(persist_directory)
+    if catalog is not None:
+        return catalog.list_sources()
+    if not _index_exists(persist_directory):
+        return []
+    return get_processor(embedding_model_type=embedding_model_type, persist_directory=persist_directory).get_loaded_sources()
+
+
+def list_indexed_modules(persist_directory: str = "data/index", embedding_model_type: str = "huggingface"):
+    """Módulos presentes no índice, lidos do catálogo (mesma regra de `list_loaded_sources`)."""
+    persist_directory = resolve_index(persist_directory)
+    catalog = _catalog(persist_directory)
+    if catalog is not None:
+        return catalog.list_modules()
+    if not _index_exists(persist_directory):
+        return []
+    return get_processor(embedding_model_type=embedding_model_type, persist_directory=persist_directory).list_modules()
+
+
+def get_duplicate_references(ids, persist_directory: str = "data/index"):
+    """Páginas de outras fontes com o mesmo texto de cada chunk (duplicatas vinculadas na ingestão)."""
+    ids = [chunk_id for chunk_id in ids if chunk_id]
+    persist_directory = resolve_index(persist_directory)
+    if not ids or not os.path.exists(os.path.join(persist_directory, DEDUP_FILE)):
+        return {}
+    return ChunkDeduplicator(persist_directory).references(ids)
@@ -0,0 +1,119 @@
+import os
+import sys
+import time
+import importlib
+import threading
+import logging
+from types import ModuleType
+from typing import Any, Dict, Optional
+
+# Adiciona o diretório do projeto ao PATH para importações relativas
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ingest.tracing import Trace, export_trace
+
+# Configuração de logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Desative com INVEST_GURU_WARMUP=0 (ex.: em máquinas sem memória para o modelo local)
+WARMUP_ENABLED = os.getenv("INVEST_GURU_WARMUP", "1") != "0"
+
+
+class StartupReport:
+    """Tempos de inicialização do processo do Streamlit (importações e aquecimento).
+
+    Vive enquanto o processo estiver de pé (este módulo fica em `sys.modules`
+    entre os reruns); o trace "startup" é exportado uma única vez, quando o
+    aquecimento termina e as importações já foram medidas, de modo que
+    regressões aparecem em `spans.jsonl` e em `metrics.prom`.
+    """
+
+    def __init__(self):
+        self.trace = Trace("startup", pid=os.getpid())
+        self.warmup_thread: Optional[threading.Thread] = None
+        self.warmup_error: Optional[str] = None
+        self._warmup_done = threading.Event()
+        self._exported = False
+        self._lock = threading.Lock()
+
+    def lazy_import(self, module_name: str) -> ModuleType:
+        """Importa o módulo, medindo o tempo apenas na primeira vez em que é carregado."""
+        module = sys.modules.get(module_name)
+        if module is not None:
+            return module
+        start = time.perf_counter()
+        module = importlib.import_module(module_name)
+        self.trace.record(f"import:{module_name}", time.perf_counter() - start)
+        return module
+
+    def start_warmup(
+        self,
+        embedding_model_type: str = "huggingface",
+        persist_directory: str = "data/index"
+    ) -> bool:
+        """Carrega em segundo plano o modelo de embeddings e abre o índice (uma vez por processo)."""
+        with self._lock:
+            if self.warmup_thread is not None or not WARMUP_ENABLED:
+                return False
+            self.warmup_thread = threading.Thread(
+                target=self._warmup,
+                args=(embedding_model_type, persist_directory),
+                name="warmup",
+                daemon=True
+            )
+            self.warmup_thread.start()
+        return True
+
+    def _warmup(self, embedding_model_type: str, persist_directory: str):
+        try:
+            resources = self.lazy_import("app.resources")
+            with self.trace.span("warmup:embeddings", model=embedding_model_type):
+                embeddings = resources.get_embeddings(embedding_model_type)
+                # A primeira consulta inicializa o tokenizer e os pesos do modelo
+                embeddings.embed_query("aquecimento")
+            if os.path.isdir(persist_directory) and os.listdir(persist_directory):
+                with self.trace.span("warmup:vectorstore"):
+                    resources.get_vectorstore(embedding_model_type, persist_directory=persist_directory)
+            logger.info("Aquecimento concluído: modelo de embeddings e índice carregados")
+        except Exception as e:
+            logger.error(f"Erro no aquecimento: {e}")
+            self.warmup_error = str(e)
+        finally:
+            self._warmup_done.set()
+
+    @property
+    def warmup_done(self) -> bool:
+        return self._warmup_done.is_set()
+
+    def summary(self) -> Dict[str, Any]:
+        """Segundos gastos em importações e no aquecimento até agora."""
+        spans = self.trace.breakdown()
+        return {
+            "imports_seconds": sum(span["duration_ms"] for span in spans if span["name"].startswith("import:")) / 1000,
+            "warmup_seconds": sum(span["duration_ms"] for span in spans if span["name"].startswith("warmup:")) / 1000,
+            "warmup_status": (
+                "disabled" if self.warmup_thread is None
+                else "failed" if self.warmup_error
+                else "done" if self.warmup_done
+                else "running"
+            )
+        }
+
+    def export_once(self):
+        """Exporta o trace de inicialização quando o aquecimento termina (ou se não houver aquecimento)."""
+        if self.warmup_thread is not None and not self.warmup_done:
+            return
+        with self._lock:
+            if self._exported:
+                return
+            self._exported = True
+        self.trace.finish(warmup=self.warmup_thread is not None, warmup_error=self.warmup_error)
+        export_trace(self.trace)
+        logger.info(
+            f"Inicialização: importações {self.summary()['imports_seconds']:.2f}s, "
+            f"aquecimento {self.summary()['warmup_seconds']:.2f}s"
+        )
+
+
+report = StartupReport()
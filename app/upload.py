@@ -7,8 +7,13 @@ import logging
 # Adiciona o diretório do projeto ao PATH para importações relativas
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from app.utils import save_uploaded_file
-from ingest.ingest_pdf import PDFProcessor
+from app.utils import save_uploaded_file, format_timings
+from app.resources import get_processor, get_job_queue, invalidate_index, list_loaded_sources
+from ingest.jobs import IngestJob, JobCancelled, QUEUED, RUNNING, DONE, FAILED, CANCELLED
+from ingest.ingest_pdf import VECTOR_BACKENDS, detect_backend
+from ingest.index_versions import IndexVersions, resolve_index
+from ingest.numpy_store import QUANTIZATIONS, index_quantization
+from ingest.sharded_store import is_sharded_index
 
 # Configuração de logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -57,6 +62,25 @@ def upload_section():
                 step=50,
                 help="Quantidade de sobreposição entre chunks"
             )
+            
+            extraction_workers = st.number_input(
+                "Processos de Extração",
+                min_value=1,
+                max_value=os.cpu_count() or 1,
+                value=1,
+                step=1,
+                key="extraction_workers",
+                help="Processos usados para extrair o texto dos PDFs (arquivos e faixas de páginas em paralelo)"
+            )
+            
+            batch_size = st.number_input(
+                "Lote de Embeddings",
+                min_value=8,
+                max_value=1024,
+                value=64,
+                step=8,
+                help="Chunks por lote de embeddings; cada lote é gravado no índice assim que fica pronto"
+            )
     
     # Upload de PDF
     uploaded_file = st.file_uploader(
@@ -74,46 +98,153 @@ def upload_section():
             process_btn = st.button("Processar PDF", type="primary", use_container_width=True)
         
         if process_btn:
-            with st.spinner("Processando o arquivo PDF..."):
-                try:
-                    # Salvar o arquivo enviado
-                    file_path = save_uploaded_file(uploaded_file)
-                    
-                    if file_path:
-                        # Inicializar o processador com as configurações selecionadas
-                        processor = PDFProcessor(
-                            embedding_model_type=embedding_model,
+            try:
+                # Salvar o arquivo enviado
+                file_path = save_uploaded_file(uploaded_file)
+                
+                if file_path:
+                    # O processamento roda na fila de jobs; a página não fica bloqueada
+                    job = get_job_queue().submit(
+                        "upload",
+                        f"Processar {os.path.basename(file_path)}",
+                        lambda job: _process_pdf_job(
+                            job,
+                            file_path,
+                            embedding_model=embedding_model,
                             openai_api_key=openai_api_key,
                             chunk_size=chunk_size,
-                            chunk_overlap=chunk_overlap
+                            chunk_overlap=chunk_overlap,
+                            extraction_workers=extraction_workers,
+                            batch_size=batch_size
                         )
-                        
-                        # Processar o PDF
-                        num_chunks = processor.process_pdf(file_path)
-                        
-                        if num_chunks > 0:
-                            st.success(f"✅ Arquivo processado com sucesso! {num_chunks} chunks adicionados.")
-                            st.session_state.document_processed = True
-                        else:
-                            st.warning("⚠️ Nenhum conteúdo foi extraído do PDF.")
-                    else:
-                        st.error("❌ Falha ao salvar o arquivo.")
-                
-                except Exception as e:
-                    logger.error(f"Erro ao processar o PDF: {e}")
-                    st.error(f"❌ Erro ao processar o PDF: {str(e)}")
+                    )
+                    st.info(f"📥 Arquivo na fila de processamento (job `{job.id}`). Acompanhe abaixo.")
+                else:
+                    st.error("❌ Falha ao salvar o arquivo.")
+            
+            except Exception as e:
+                logger.error(f"Erro ao enfileirar o PDF: {e}")
+                st.error(f"❌ Erro ao processar o PDF: {str(e)}")
+    
+    jobs_section()
+
+
+def _process_pdf_job(job: IngestJob, file_path: str, embedding_model: str, openai_api_key, **processor_options) -> str:
+    """Job de upload: processa um PDF e retorna o resumo exibido no painel de jobs."""
+    processor = get_processor(
+        embedding_model_type=embedding_model,
+        openai_api_key=openai_api_key,
+        **processor_options
+    )
+    
+    try:
+        num_chunks = processor.process_pdf(file_path, progress_callback=job.progress_callback)
+    except JobCancelled:
+        # Remover os lotes já gravados do arquivo interrompido
+        processor.delete_by_source(os.path.basename(file_path))
+        raise
+    
+    if num_chunks == 0:
+        return "⚠️ Nenhum conteúdo foi extraído do PDF."
+    
+    summary = f"✅ Arquivo processado com sucesso! {num_chunks} chunks adicionados."
+    
+    # Tempo de cada estágio (rodam em paralelo, a soma pode passar do total)
+    if processor.last_trace is not None:
+        trace = processor.last_trace
+        summary += f"\n\nEtapas: {format_timings(trace.breakdown(), trace.duration_ms)}"
+    
+    # Estatísticas do cache de embeddings (acumuladas no processo)
+    if hasattr(processor.embeddings, "stats"):
+        stats = processor.embeddings.stats()
+        summary += (
+            f"\n\nCache de embeddings: {stats['hits']} acertos, {stats['misses']} calculados "
+            f"({stats['hit_rate']:.0%}) · {stats['entries']} vetores, {stats['size_mb']:.1f} MB"
+        )
+    return summary
+
+
+# Descrição das situações dos jobs (ver ingest/jobs.py)
+JOB_STATUS_LABELS = {
+    QUEUED: "⏳ Na fila",
+    RUNNING: "⚙️ Processando",
+    DONE: "✅ Concluído",
+    FAILED: "❌ Erro",
+    CANCELLED: "🚫 Cancelado"
+}
+
+
+def _render_jobs():
+    jobs = get_job_queue().list()
+    
+    # Quando um job acompanhado termina, recarregar a página inteira (lista de documentos, status)
+    active_ids = {job.id for job in jobs if not job.finished}
+    finished_since_last_run = st.session_state.get("active_job_ids", set()) - active_ids
+    st.session_state["active_job_ids"] = active_ids
+    if finished_since_last_run:
+        st.rerun()
+    
+    if not jobs:
+        st.caption("Nenhum processamento nesta sessão do servidor.")
+        return
+    
+    for job in jobs[:10]:
+        with st.container(border=True):
+            col1, col2 = st.columns([4, 1])
+            with col1:
+                st.markdown(f"**{job.description}** · `{job.id}` · {JOB_STATUS_LABELS.get(job.status, job.status)}")
+                if job.status == RUNNING:
+                    st.progress(
+                        job.fraction,
+                        text=f"Páginas lidas: {job.pages_done}/{job.pages_total} · Chunks gravados: {job.chunks_written}"
+                    )
+                elif job.status == DONE and job.result:
+                    st.markdown(job.result)
+                elif job.status == FAILED:
+                    st.error(job.error)
+            with col2:
+                if not job.finished and not job.cancel_requested:
+                    if st.button("Cancelar", key=f"cancel_job_{job.id}"):
+                        get_job_queue().cancel(job.id)
+                        st.rerun()
+                elif job.cancel_requested and not job.finished:
+                    st.caption("Cancelando...")
+
+
+def _follow_job(job: IngestJob):
+    """Acompanha um job enfileirado depois do painel já desenhado nesta execução.
+
+    O painel só é atualizado periodicamente se havia jobs ativos quando foi
+    registrado; recarregar a página o registra de novo, já com o job.
+    """
+    st.session_state["active_job_ids"] = st.session_state.get("active_job_ids", set()) | {job.id}
+    st.rerun()
+
+
+def jobs_section():
+    """Painel com a fila de processamento, atualizado periodicamente enquanto há jobs ativos."""
+    st.subheader("🗂️ Fila de Processamento")
+    
+    if hasattr(st, "fragment"):
+        # Só o painel é reexecutado a cada intervalo, não a página inteira
+        run_every = 2 if get_job_queue().active() else None
+        st.fragment(run_every=run_every)(_render_jobs)()
+    else:
+        _render_jobs()
+        if get_job_queue().active() and st.button("🔄 Atualizar"):
+            st.rerun()
+
 
 def document_management_section():
     """Componente para gerenciar documentos carregados."""
     st.header("📚 Documentos Carregados")
     
-    # Cria uma instância do processador para obter a lista de documentos
+    # Lista os documentos do índice
     try:
         embedding_model = "huggingface"  # Padrão para não precisar de API key
-        processor = PDFProcessor(embedding_model_type=embedding_model)
         
-        # Obter lista de documentos carregados
-        loaded_docs = processor.get_loaded_sources()
+        # Obter lista de documentos carregados (do catálogo, sem carregar o modelo de embeddings)
+        loaded_docs = list_loaded_sources(embedding_model_type=embedding_model)
         
         if not loaded_docs:
             st.info("Nenhum documento carregado ainda. Faça upload de PDFs na seção acima.")
@@ -125,58 +256,162 @@ def document_management_section():
                     "name": "Nome do Arquivo",
                     "module": "Módulo",
                     "pages": "Páginas",
-                    "chunk_count": "Chunks"
+                    "chunk_count": "Chunks",
+                    "hash": None,
+                    "ingested_at": "Indexado em"
                 },
                 use_container_width=True
             )
             
-            # Seleção de documento para remover
-            selected_doc = st.selectbox(
-                "Selecione um documento para remover",
+            # Seleção de documentos (ou de um módulo inteiro) para remover
+            selected_docs = st.multiselect(
+                "Selecione documentos para remover",
                 options=[doc["name"] for doc in loaded_docs],
-                key="document_to_remove"
+                key="documents_to_remove"
+            )
+            modules = sorted({doc["module"] for doc in loaded_docs if doc["module"]})
+            selected_module = st.selectbox(
+                "Ou remova todos os documentos de um módulo",
+                options=[""] + modules,
+                format_func=lambda module: module or "—",
+                key="module_to_remove"
             )
             
-            if st.button("🗑️ Remover Documento", type="secondary"):
-                with st.spinner(f"Removendo {selected_doc}..."):
-                    removed_count = processor.delete_by_source(selected_doc)
-                    if removed_count > 0:
-                        st.success(f"✅ Documento {selected_doc} removido com sucesso!")
-                        st.rerun()  # Recarregar a página para atualizar a lista
-                    else:
-                        st.error(f"❌ Não foi possível remover o documento {selected_doc}.")
+            if st.button("🗑️ Remover Documentos", type="secondary", disabled=not (selected_docs or selected_module)):
+                # A remoção também passa pelo escritor único, depois dos jobs já na fila; o
+                # resultado (ou o erro) aparece no painel de jobs, que recarrega a lista ao terminar
+                job = get_job_queue().submit(
+                    "delete",
+                    "Remover " + ", ".join(selected_docs + ([f"módulo {selected_module}"] if selected_module else [])),
+                    lambda job: _delete_job(embedding_model, selected_docs, selected_module or None)
+                )
+                _follow_job(job)
     
     except Exception as e:
         logger.error(f"Erro ao gerenciar documentos: {e}")
         st.error(f"❌ Erro ao carregar documentos: {str(e)}")
         
+    full_rebuild = st.checkbox(
+        "Reconstruir o índice do zero",
+        value=False,
+        help=(
+            "Reprocessa todos os PDFs em uma nova versão do índice, ativada só depois de validada; "
+            "as consultas continuam usando a versão atual até lá. Necessário ao trocar o modelo de embeddings."
+        )
+    )
+    
+    versions = IndexVersions("data/index")
+    active_version = versions.active()
+    if active_version:
+        st.caption(f"Versão ativa do índice: `{active_version}` · {len(versions.list_versions())} versão(ões) mantida(s)")
+    
+    active_index = resolve_index("data/index")
+    current_backend = detect_backend(active_index)
+    vector_backend = st.selectbox(
+        "Backend do índice",
+        options=list(VECTOR_BACKENDS),
+        index=VECTOR_BACKENDS.index(current_backend),
+        format_func=lambda backend: {"chroma": "Chroma", "numpy": "NumPy (arquivos mapeados em memória)"}[backend],
+        help="Trocar o backend recria o índice do zero."
+    )
+    
+    quantization = None
+    currently_sharded = is_sharded_index(active_index)
+    shard_by_module = False
+    if vector_backend == "numpy":
+        quantization = st.selectbox(
+            "Quantização da busca",
+            options=list(QUANTIZATIONS),
+            index=QUANTIZATIONS.index(index_quantization(active_index) or "none"),
+            format_func=lambda option: {"none": "Nenhuma (float32)", "float16": "float16 (2x menos memória)", "int8": "int8 (4x menos memória)"}[option],
+            help=(
+                "A busca varre a matriz quantizada e reordena os melhores candidatos com os vetores exatos. "
+                "Trocar a quantização reescreve os arquivos do índice na reindexação."
+            )
+        )
+    else:
+        shard_by_module = st.checkbox(
+            "Índice separado por módulo",
+            value=currently_sharded,
+            help="Guarda uma coleção por módulo e consulta apenas os módulos relevantes a cada pergunta."
+        )
+    
     # Botão para processar todos os PDFs no diretório
     if st.button("🔄 Reindexar Todos os PDFs"):
-        with st.spinner("Reindexando todos os documentos..."):
-            try:
-                # Verificar se o diretório de PDFs existe
-                pdf_dir = Path("data/pdfs")
-                
-                if not pdf_dir.exists() or not any(pdf_dir.glob("*.pdf")):
-                    st.warning("Nenhum PDF encontrado na pasta data/pdfs.")
-                else:
-                    # Recriar o vectorstore do zero
-                    import shutil
-                    index_dir = Path("data/index")
-                    if index_dir.exists():
-                        shutil.rmtree(index_dir)
-                    
-                    # Inicializar o processador e processar o diretório
-                    processor = PDFProcessor(embedding_model_type=embedding_model)
-                    results = processor.process_directory(str(pdf_dir))
-                    
-                    if results:
-                        total_chunks = sum(results.values())
-                        st.success(f"✅ Reindexação concluída! {len(results)} PDFs processados com {total_chunks} chunks.")
-                        st.rerun()  # Recarregar a página para atualizar a lista
-                    else:
-                        st.warning("⚠️ Nenhum documento foi processado.")
+        try:
+            # Verificar se o diretório de PDFs existe
+            pdf_dir = Path("data/pdfs")
             
-            except Exception as e:
-                logger.error(f"Erro na reindexação: {e}")
-                st.error(f"❌ Erro ao reindexar documentos: {str(e)}") 
\ No newline at end of file
+            if not pdf_dir.exists() or not any(pdf_dir.glob("*.pdf")):
+                st.warning("Nenhum PDF encontrado na pasta data/pdfs.")
+            else:
+                # Voltar para a coleção única ou trocar de backend exige recriar o índice
+                rebuild = full_rebuild or (currently_sharded and not shard_by_module) or vector_backend != current_backend
+                extraction_workers = st.session_state.get("extraction_workers", 1)
+                job = get_job_queue().submit(
+                    "reindex",
+                    "Reindexar todos os PDFs" + (" (do zero)" if rebuild else ""),
+                    lambda job: _reindex_job(
+                        job,
+                        pdf_dir,
+                        rebuild=rebuild,
+                        embedding_model=embedding_model,
+                        extraction_workers=extraction_workers,
+                        shard_by_module=shard_by_module,
+                        vector_backend=vector_backend,
+                        quantization=quantization
+                    )
+                )
+                _follow_job(job)
+        
+        except Exception as e:
+            logger.error(f"Erro na reindexação: {e}")
+            st.error(f"❌ Erro ao reindexar documentos: {str(e)}")
+
+
+def _delete_job(embedding_model: str, source_names, module) -> str:
+    """Job de remoção: retorna o resumo exibido no painel de jobs (um erro marca o job como falho)."""
+    counts = get_processor(embedding_model_type=embedding_model).delete_sources(source_names, module=module)
+    removed = {name: count for name, count in counts.items() if count > 0}
+    if not removed:
+        return "⚠️ Nenhum chunk encontrado para os documentos selecionados."
+    return (
+        f"✅ {len(removed)} documento(s) removido(s) "
+        f"({sum(removed.values())} chunks): {', '.join(sorted(removed))}"
+    )
+
+
+def _reindex_job(job: IngestJob, pdf_dir: Path, rebuild: bool, embedding_model: str, **processor_options) -> str:
+    """Job de reindexação: sincroniza o índice com a pasta de PDFs (ou o recria em uma nova versão)."""
+    if rebuild:
+        # Reconstruir em uma versão nova; as sessões seguem na ativa até a troca do ponteiro
+        def build(directory: str):
+            processor = get_processor(embedding_model_type=embedding_model, persist_directory=directory, **processor_options)
+            return processor, processor.sync_directory(str(pdf_dir), progress_callback=job.progress_callback)
+        
+        rebuilt = IndexVersions("data/index").rebuild(build, before_remove=invalidate_index)
+        results, validation = rebuilt["results"], rebuilt["validation"]
+        return (
+            f"✅ Índice reconstruído na versão `{rebuilt['version']}`: {len(results['added'])} PDFs, "
+            f"{validation['chunks']} chunks. Validação: {validation['sample_queries']} consultas de amostra "
+            f"({validation['sample_hit_rate']:.0%} encontraram a própria fonte). "
+            f"As próximas perguntas já usam a nova versão"
+            + (f"; {len(rebuilt['removed'])} versão(ões) antiga(s) removida(s)." if rebuilt["removed"] else ".")
+        )
+    
+    # Reindexar apenas o que mudou desde a última indexação
+    processor = get_processor(embedding_model_type=embedding_model, **processor_options)
+    quantization = processor_options.get("quantization")
+    if quantization and processor.backend == "numpy":
+        # Abrir o índice não o converte; a troca de quantização é feita aqui, explicitamente
+        processor.db.requantize(quantization)
+    results = processor.sync_directory(str(pdf_dir), progress_callback=job.progress_callback)
+    
+    processed = {**results["added"], **results["changed"]}
+    total_chunks = sum(processed.values())
+    return (
+        f"✅ Reindexação concluída! {len(results['added'])} novos, "
+        f"{len(results['changed'])} alterados e {len(results['removed'])} removidos "
+        f"({total_chunks} chunks adicionados). "
+        f"{len(results['skipped'])} PDFs sem alterações foram ignorados."
+    )
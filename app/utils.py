@@ -31,21 +31,77 @@ def save_uploaded_file(uploaded_file) -> Optional[str]:
         st.error(f"Erro ao salvar o arquivo: {e}")
         return None
 
-def format_sources(sources: List[Dict[str, Any]]) -> str:
-    """Formata as fontes de uma resposta para exibição."""
+def _page_label(metadata: Dict[str, Any]) -> str:
+    page_num = metadata.get("page", "N/A")
+    if metadata.get("page_end"):
+        # Chunk que atravessa páginas
+        page_num = f"{page_num}–{metadata['page_end']}"
+    return str(page_num)
+
+def format_sources(
+    sources: List[Dict[str, Any]],
+    references: Optional[Dict[str, List[Dict[str, Any]]]] = None,
+    max_references: int = 3
+) -> str:
+    """Formata as fontes de uma resposta para exibição.
+    
+    `references` (id do chunk -> metadados) lista outras páginas com o mesmo
+    texto, vinculadas como duplicatas na ingestão.
+    """
     formatted_sources = []
     
     for i, source in enumerate(sources, 1):
         metadata = source.metadata
         source_name = metadata.get("source", "Desconhecido")
-        page_num = metadata.get("page", "N/A")
         module = metadata.get("module", "Desconhecido")
         
-        formatted_source = f"{i}. **{source_name}** (Pág. {page_num}, {module})"
+        formatted_source = f"{i}. **{source_name}** (Pág. {_page_label(metadata)}, {module})"
+        duplicates = (references or {}).get(getattr(source, "id", None), [])
+        if duplicates:
+            listed = ", ".join(
+                f"{duplicate.get('source', 'Desconhecido')} (Pág. {_page_label(duplicate)})"
+                for duplicate in duplicates[:max_references]
+            )
+            if len(duplicates) > max_references:
+                listed += f" e mais {len(duplicates) - max_references}"
+            formatted_source += f" — também em: {listed}"
         formatted_sources.append(formatted_source)
     
     return "\n".join(formatted_sources)
 
+# Nomes das etapas medidas (ver ingest/tracing.py) para exibição
+STAGE_LABELS = {
+    "rephrase": "reformulação",
+    "embed_query": "embedding da pergunta",
+    "cache_lookup": "cache",
+    "retrieve": "busca",
+    "context": "contexto",
+    "prompt": "montagem do prompt",
+    "llm": "LLM",
+    "format_sources": "fontes",
+    "extraction": "extração",
+    "chunking": "chunks",
+    "embedding": "embeddings",
+    "write": "gravação"
+}
+
+def format_timings(spans: List[Dict[str, Any]], total_ms: Optional[float] = None) -> str:
+    """Formata a duração de cada etapa de um trace em uma linha."""
+    parts = []
+    for span in spans:
+        label = STAGE_LABELS.get(span["name"], span["name"])
+        part = f"{label} {span['duration_ms'] / 1000:.2f}s"
+        tokens = span["attributes"].get("tokens") or (
+            span["attributes"].get("prompt_tokens", 0) + span["attributes"].get("completion_tokens", 0)
+        )
+        if tokens:
+            part += f" ({tokens} tokens)"
+        parts.append(part)
+    text = " · ".join(parts)
+    if total_ms is not None:
+        text += f" · total {total_ms / 1000:.2f}s"
+    return text
+
 def get_llm_model(model_name: str, api_key: Optional[str] = None):
     """Retorna o modelo LLM adequado com base no nome."""
     from langchain_openai import ChatOpenAI
@@ -71,5 +127,9 @@ def initialize_session_state():
     if "chat_history" not in st.session_state:
         st.session_state.chat_history = []
     
+    if "chat_memory" not in st.session_state:
+        from app.memory import ConversationMemory
+        st.session_state.chat_memory = ConversationMemory()
+    
     if "document_processed" not in st.session_state:
         st.session_state.document_processed = False 
\ No newline at end of file
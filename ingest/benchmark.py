@@ -0,0 +1,388 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+import fitz  # PyMuPDF
+from langchain_core.embeddings import DeterministicFakeEmbedding
+import logging
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Adiciona o diretório do projeto ao PATH para importações relativas
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ingest.ingest_pdf import VECTOR_BACKENDS, PDFProcessor
+from ingest.numpy_store import QUANTIZATIONS
+from ingest.dedup import DEFAULT_THRESHOLD
+from ingest.tracing import percentile
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+DEFAULT_OUTPUT_DIR = "data/benchmarks"
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Módulos importados pelo Streamlit antes da primeira renderização das abas
+STARTUP_MODULES = ["app.utils", "app.startup", "app.chat", "app.upload"]
+# Dependências que não devem ser carregadas na inicialização (só sob demanda)
+HEAVY_MODULES = ["chromadb", "fitz", "langchain_openai", "langchain_huggingface", "torch", "sentence_transformers"]
+
+_STARTUP_SCRIPT = """
+import sys, json, time, importlib
+sys.path.insert(0, {project!r})
+timings = {{}}
+for name in {modules!r}:
+    start = time.perf_counter()
+    importlib.import_module(name)
+    timings[name] = time.perf_counter() - start
+print(json.dumps({{"timings": timings, "heavy": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+# Vocabulário para gerar texto sintético sobre finanças em português
+SUBJECTS = [
+    "O Tesouro Selic", "O CDB pós-fixado", "A LCI", "O fundo imobiliário", "A ação preferencial",
+    "O índice Ibovespa", "A debênture incentivada", "O fundo multimercado", "A carteira de renda fixa",
+    "O investidor conservador", "A taxa DI", "O dividend yield", "A marcação a mercado", "O ETF de índice"
+]
+VERBS = [
+    "acompanha", "remunera", "protege", "reduz", "aumenta", "depende de", "é afetado por",
+    "apresenta", "compensa", "supera", "reflete", "sofre com"
+]
+OBJECTS = [
+    "a inflação medida pelo IPCA", "a volatilidade do mercado", "o risco de crédito do emissor",
+    "a liquidez diária", "o imposto de renda regressivo", "a taxa de administração",
+    "o prazo de vencimento", "a garantia do FGC", "os juros compostos no longo prazo",
+    "a diversificação da carteira", "o custo de oportunidade", "a política monetária do Copom"
+]
+CLOSINGS = [
+    "em períodos de alta dos juros", "para o pequeno investidor", "segundo o prospecto",
+    "no relatório trimestral", "quando comparado ao benchmark", "em cenários de estresse",
+    "ao longo de cinco anos", "antes do vencimento"
+]
+
+
+def synthetic_sentence(rng: random.Random) -> str:
+    return f"{rng.choice(SUBJECTS)} {rng.choice(VERBS)} {rng.choice(OBJECTS)} {rng.choice(CLOSINGS)}."
+
+
+def synthetic_text(rng: random.Random, length: int) -> str:
+    """Texto sintético com aproximadamente `length` caracteres."""
+    sentences, size = [], 0
+    while size < length:
+        sentence = synthetic_sentence(rng)
+        sentences.append(sentence)
+        size += len(sentence) + 1
+    return " ".join(sentences)
+
+
+def generate_pdf(path: str, pages: int, rng: random.Random, chars_per_page: int = 2500):
+    """Gera um PDF sintético com `pages` páginas de texto."""
+    document = fitz.open()
+    try:
+        for _ in range(pages):
+            page = document.new_page()
+            page.insert_textbox(page.rect + (50, 50, -50, -50), synthetic_text(rng, chars_per_page), fontsize=9)
+        document.save(path)
+    finally:
+        document.close()
+
+
+def generate_corpus(directory: str, documents: int, pages: int, seed: int = 42) -> List[str]:
+    """Gera `documents` PDFs com `pages` páginas cada, distribuídos em módulos."""
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for i in range(documents):
+        path = os.path.join(directory, f"Módulo {i % 5 + 1} - Documento {i + 1}.pdf")
+        generate_pdf(path, pages, rng)
+        paths.append(path)
+    return paths
+
+
+def peak_rss_mb(who: str = "self") -> Optional[float]:
+    """Pico de memória residente do processo ("self") ou dos processos filhos já encerrados ("children")."""
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN if who == "children" else resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss é em KB no Linux e em bytes no macOS
+    divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return round(usage / divisor, 1)
+
+
+def directory_size_mb(directory: str) -> float:
+    total = 0
+    for root, _, files in os.walk(directory):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return round(total / (1024 * 1024), 2)
+
+
+def _rate(count: int, seconds: float) -> float:
+    return round(count / seconds, 1) if seconds > 0 else 0.0
+
+
+def benchmark_ingestion(processor: PDFProcessor, pdf_paths: List[str]) -> Dict[str, Any]:
+    """Mede extração, divisão em chunks, embeddings e gravação no vectorstore."""
+    start = time.perf_counter()
+    pages_text = []
+    for path in pdf_paths:
+        pages_text.extend(processor.extract_text_from_pdf(path))
+    extraction_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    chunks = processor.chunk_texts(pages_text)
+    chunking_time = time.perf_counter() - start
+
+    texts = [chunk["content"] for chunk in chunks]
+    start = time.perf_counter()
+    for i in range(0, len(texts), processor.batch_size):
+        processor.embed_texts(texts[i:i + processor.batch_size])
+    embedding_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    indexed = processor.add_to_vectorstore(chunks)
+    indexing_time = time.perf_counter() - start
+
+    return {
+        "documents": len(pdf_paths),
+        "pages": len(pages_text),
+        "chunks": len(chunks),
+        "avg_chunk_chars": round(sum(len(text) for text in texts) / len(texts), 1) if texts else 0.0,
+        "extraction_seconds": round(extraction_time, 3),
+        "chunking_seconds": round(chunking_time, 3),
+        "embedding_seconds": round(embedding_time, 3),
+        "indexing_seconds": round(indexing_time, 3),
+        "pages_per_second": _rate(len(pages_text), extraction_time),
+        "chunks_per_second": _rate(len(chunks), chunking_time),
+        "embeddings_per_second": _rate(len(texts), embedding_time),
+        "indexed_chunks_per_second": _rate(len(chunks), indexing_time),
+        "duplicate_chunks": len(chunks) - indexed,
+        "index_size_mb": directory_size_mb(processor.persist_directory),
+        "peak_rss_mb": peak_rss_mb()
+    }
+
+
+def benchmark_startup(runs: int = 3) -> Dict[str, Any]:
+    """Mede, em processos novos, o tempo de importação dos módulos da interface.
+
+    Cada módulo é importado em sequência (o tempo de um não inclui o que os
+    anteriores já carregaram); `heavy_modules_loaded` lista as dependências
+    pesadas que entraram na inicialização e deveria ficar vazia.
+    """
+    script = _STARTUP_SCRIPT.format(project=PROJECT_DIR, modules=STARTUP_MODULES, heavy=HEAVY_MODULES)
+    samples: Dict[str, List[float]] = {name: [] for name in STARTUP_MODULES}
+    totals = []
+    heavy = set()
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", script],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=PROJECT_DIR
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        for name, seconds in result["timings"].items():
+            samples[name].append(seconds)
+        totals.append(sum(result["timings"].values()))
+        heavy.update(result["heavy"])
+    return {
+        "runs": runs,
+        "import_seconds": {name: round(percentile(values, 50), 3) for name, values in samples.items()},
+        "total_import_seconds": round(percentile(totals, 50), 3),
+        "heavy_modules_loaded": sorted(heavy)
+    }
+
+
+def benchmark_retrieval(
+    processor: PDFProcessor,
+    sizes: List[int],
+    queries: int = 200,
+    k: int = 4,
+    seed: int = 42
+) -> List[Dict[str, Any]]:
+    """Mede a latência de busca com o índice crescendo até cada tamanho (em chunks)."""
+    rng = random.Random(seed)
+    questions = [synthetic_sentence(rng) for _ in range(queries)]
+    results = []
+    indexed = 0
+
+    def synthetic_chunks(count: int, offset: int):
+        for i in range(count):
+            yield {
+                "content": synthetic_text(rng, processor.chunk_size),
+                "metadata": {
+                    "source": f"sintetico-{(offset + i) // 100}.pdf",
+                    "module": f"Módulo {(offset + i) % 5 + 1}",
+                    "page": (offset + i) % 100 + 1
+                }
+            }
+
+    for size in sorted(sizes):
+        # Completar o índice com chunks sintéticos até o tamanho pedido
+        start = time.perf_counter()
+        indexed += processor.add_to_vectorstore(synthetic_chunks(size - indexed, indexed))
+        indexing_time = time.perf_counter() - start
+
+        # Aquecimento antes das medições
+        for question in questions[:5]:
+            processor.db.similarity_search(question, k=k)
+
+        latencies = []
+        for question in questions:
+            start = time.perf_counter()
+            processor.db.similarity_search(question, k=k)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+        result = {
+            "chunks": indexed,
+            "queries": len(latencies),
+            "k": k,
+            "indexing_seconds": round(indexing_time, 3),
+            "p50_ms": round(percentile(latencies, 50), 3),
+            "p95_ms": round(percentile(latencies, 95), 3),
+            "p99_ms": round(percentile(latencies, 99), 3),
+            "mean_ms": round(sum(latencies) / len(latencies), 3),
+            "index_size_mb": directory_size_mb(processor.persist_directory),
+            "peak_rss_mb": peak_rss_mb()
+        }
+        logger.info(f"Busca com {indexed} chunks: p50 {result['p50_ms']} ms, p95 {result['p95_ms']} ms, p99 {result['p99_ms']} ms")
+        results.append(result)
+
+    return results
+
+
+def run_benchmark(
+    documents: int = 10,
+    pages: int = 20,
+    sizes: Optional[List[int]] = None,
+    queries: int = 200,
+    chunk_size: int = 1000,
+    chunk_overlap: int = 200,
+    batch_size: int = 64,
+    extraction_workers: int = 1,
+    embedding_size: int = 384,
+    shard_by_module: bool = False,
+    vector_backend: str = "chroma",
+    quantization: Optional[str] = None,
+    work_dir: Optional[str] = None,
+    seed: int = 42
+) -> Dict[str, Any]:
+    """Executa o benchmark completo, sem rede, e retorna os resultados."""
+    sizes = sizes or [1000, 10000, 100000]
+    keep_work_dir = work_dir is not None
+    work_dir = work_dir or tempfile.mkdtemp(prefix="invest-guru-bench-")
+    embeddings = DeterministicFakeEmbedding(size=embedding_size)
+
+    def make_processor(name: str, dedup: bool = True) -> PDFProcessor:
+        return PDFProcessor(
+            persist_directory=os.path.join(work_dir, name),
+            embeddings=embeddings,
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            batch_size=batch_size,
+            extraction_workers=extraction_workers,
+            shard_by_module=shard_by_module,
+            vector_backend=vector_backend,
+            quantization=quantization,
+            dedup_threshold=DEFAULT_THRESHOLD if dedup else None
+        )
+
+    try:
+        logger.info(f"Gerando {documents} PDFs sintéticos com {pages} páginas em {work_dir}")
+        pdf_paths = generate_corpus(os.path.join(work_dir, "pdfs"), documents, pages, seed)
+
+        ingestion = benchmark_ingestion(make_processor("index-ingestion"), pdf_paths)
+        # O índice da busca deve ter exatamente `sizes` chunks: sem deduplicação
+        retrieval = benchmark_retrieval(make_processor("index-retrieval", dedup=False), sizes, queries, seed=seed)
+        startup = benchmark_startup()
+    finally:
+        if not keep_work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {
+            "documents": documents,
+            "pages_per_document": pages,
+            "sizes": sizes,
+            "queries": queries,
+            "chunk_size": chunk_size,
+            "chunk_overlap": chunk_overlap,
+            "batch_size": batch_size,
+            "extraction_workers": extraction_workers,
+            "embedding_size": embedding_size,
+            "shard_by_module": shard_by_module,
+            "vector_backend": vector_backend,
+            "quantization": quantization,
+            "seed": seed
+        },
+        "ingestion": ingestion,
+        "retrieval": retrieval,
+        "startup": startup,
+        "peak_rss_mb": peak_rss_mb(),
+        "children_peak_rss_mb": peak_rss_mb("children")
+    }
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Benchmark offline de ingestão e busca com PDFs sintéticos")
+    parser.add_argument("--documents", type=int, default=10, help="Número de PDFs sintéticos")
+    parser.add_argument("--pages", type=int, default=20, help="Páginas por PDF")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="Tamanhos do índice (em chunks) para medir a busca")
+    parser.add_argument("--queries", type=int, default=200, help="Consultas por tamanho de índice")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--chunk-overlap", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--extraction-workers", type=int, default=1)
+    parser.add_argument("--embedding-size", type=int, default=384)
+    parser.add_argument("--shard-by-module", action="store_true", help="Usar uma coleção por módulo")
+    parser.add_argument("--vector-backend", choices=VECTOR_BACKENDS, default="chroma", help="Backend do índice")
+    parser.add_argument("--quantization", choices=QUANTIZATIONS, default=None, help="Quantização no backend numpy")
+    parser.add_argument("--work-dir", help="Diretório de trabalho a manter após a execução (padrão: temporário)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help=f"Arquivo JSON de saída (padrão: {DEFAULT_OUTPUT_DIR}/benchmark-<data>.json)")
+    args = parser.parse_args(argv)
+
+    results = run_benchmark(
+        documents=args.documents,
+        pages=args.pages,
+        sizes=[int(size) for size in args.sizes.split(",") if size.strip()],
+        queries=args.queries,
+        chunk_size=args.chunk_size,
+        chunk_overlap=args.chunk_overlap,
+        batch_size=args.batch_size,
+        extraction_workers=args.extraction_workers,
+        embedding_size=args.embedding_size,
+        shard_by_module=args.shard_by_module,
+        vector_backend=args.vector_backend,
+        quantization=args.quantization,
+        work_dir=args.work_dir,
+        seed=args.seed
+    )
+
+    output = args.output or os.path.join(DEFAULT_OUTPUT_DIR, f"benchmark-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"Resultados salvos em {output}")
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+import os
+import sqlite3
+import threading
+import logging
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+CATALOG_FILE = "catalog.sqlite"
+
+_catalog_lock = threading.Lock()
+
+
+class SourceCatalog:
+    """Catálogo persistente (SQLite) das fontes indexadas, ao lado do índice.
+
+    Guarda por fonte o módulo, número de páginas e de chunks, hash do arquivo
+    e data de indexação, além do id de cada chunk e das páginas cobertas por
+    eles. Mantido a cada gravação e remoção, evita varrer todos os metadados
+    do vectorstore para listar os documentos carregados. As contagens são
+    incrementais: cada lote soma os seus chunks e páginas novas, e só uma
+    remoção recalcula as páginas das fontes afetadas.
+    """
+
+    def __init__(self, persist_directory: str):
+        self.path = os.path.join(persist_directory, CATALOG_FILE)
+        os.makedirs(persist_directory, exist_ok=True)
+        with self._connect() as conn:
+            has_pages = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'pages'"
+            ).fetchone() is not None
+            conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS sources (
+                    name TEXT PRIMARY KEY,
+                    module TEXT,
+                    page_count INTEGER NOT NULL DEFAULT 0,
+                    chunk_count INTEGER NOT NULL DEFAULT 0,
+                    hash TEXT,
+                    ingested_at TEXT
+                );
+                CREATE TABLE IF NOT EXISTS chunks (
+                    id TEXT PRIMARY KEY,
+                    source TEXT NOT NULL,
+                    page INTEGER
+                );
+                CREATE INDEX IF NOT EXISTS idx_chunks_source ON chunks (source);
+                CREATE TABLE IF NOT EXISTS pages (
+                    source TEXT NOT NULL,
+                    page INTEGER NOT NULL,
+                    PRIMARY KEY (source, page)
+                );
+                """
+            )
+            # Catálogos anteriores aos chunks que atravessam páginas: sem a página final
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(chunks)")}
+            if "page_end" not in columns:
+                conn.execute("ALTER TABLE chunks ADD COLUMN page_end INTEGER")
+            if not has_pages:
+                # Catálogos anteriores à tabela de páginas: preenchida uma vez a partir dos chunks
+                sources = [row[0] for row in conn.execute("SELECT name FROM sources")]
+                self._rebuild_pages(conn, sources)
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    def _rebuild_pages(self, conn: sqlite3.Connection, sources: Iterable[str]):
+        """Recalcula, no SQLite, as páginas cobertas e as contagens das fontes (depois de remoções)."""
+        for source in sources:
+            conn.execute("DELETE FROM pages WHERE source = ?", (source,))
+            # Cada chunk cobre as páginas de `page` a `page_end`
+            conn.execute(
+                """
+                WITH RECURSIVE covered(page, page_end) AS (
+                    SELECT page, MAX(COALESCE(page_end, page), page) FROM chunks
+                    WHERE source = ? AND page IS NOT NULL
+                    UNION
+                    SELECT page + 1, page_end FROM covered WHERE page < page_end
+                )
+                INSERT OR IGNORE INTO pages (source, page) SELECT ?, page FROM covered
+                """,
+                (source, source)
+            )
+            conn.execute(
+                "UPDATE sources SET "
+                "chunk_count = (SELECT COUNT(*) FROM chunks WHERE source = ?), "
+                "page_count = (SELECT COUNT(*) FROM pages WHERE source = ?) "
+                "WHERE name = ?",
+                (source, source, source)
+            )
+
+    def add_chunks(self, ids: List[str], metadatas: List[Dict[str, Any]]):
+        """Registra chunks gravados no índice (chamado a cada lote)."""
+        now = datetime.now().isoformat(timespec="seconds")
+        rows = [
+            (chunk_id, metadata.get("source", "Desconhecido"), metadata.get("page"), metadata.get("page_end"))
+            for chunk_id, metadata in zip(ids, metadatas)
+        ]
+        modules = {}
+        for metadata in metadatas:
+            modules.setdefault(metadata.get("source", "Desconhecido"), metadata.get("module"))
+        # Páginas cobertas pelo lote, por fonte (um chunk pode ir de `page` a `page_end`)
+        pages: Dict[str, set] = {}
+        for _, source, page, page_end in rows:
+            if page is not None:
+                pages.setdefault(source, set()).update(range(page, max(page_end or page, page) + 1))
+
+        with _catalog_lock, self._connect() as conn:
+            for source, module in modules.items():
+                conn.execute(
+                    "INSERT INTO sources (name, module, ingested_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT(name) DO UPDATE SET module = excluded.module, ingested_at = excluded.ingested_at",
+                    (source, module, now)
+                )
+            # Ids já registrados (regravados) não contam de novo
+            new_chunks: Dict[str, int] = {}
+            for i in range(0, len(rows), 500):
+                part = rows[i:i + 500]
+                existing = {row[0] for row in conn.execute(
+                    f"SELECT id FROM chunks WHERE id IN ({','.join('?' * len(part))})", [row[0] for row in part]
+                )}
+                for chunk_id, source, _, _ in part:
+                    if chunk_id not in existing:
+                        existing.add(chunk_id)
+                        new_chunks[source] = new_chunks.get(source, 0) + 1
+            conn.executemany("INSERT OR REPLACE INTO chunks (id, source, page, page_end) VALUES (?, ?, ?, ?)", rows)
+            for source in modules:
+                before = conn.total_changes
+                conn.executemany(
+                    "INSERT OR IGNORE INTO pages (source, page) VALUES (?, ?)",
+                    [(source, page) for page in sorted(pages.get(source, ()))]
+                )
+                conn.execute(
+                    "UPDATE sources SET chunk_count = chunk_count + ?, page_count = page_count + ? WHERE name = ?",
+                    (new_chunks.get(source, 0), conn.total_changes - before, source)
+                )
+
+    def set_hash(self, source: str, content_hash: str):
+        """Registra o hash do arquivo de uma fonte já indexada."""
+        with _catalog_lock, self._connect() as conn:
+            conn.execute("UPDATE sources SET hash = ? WHERE name = ?", (content_hash, source))
+
+    def chunk_ids(self, source: str) -> List[str]:
+        """Ids dos chunks de uma fonte."""
+        with self._connect() as conn:
+            return [row[0] for row in conn.execute("SELECT id FROM chunks WHERE source = ?", (source,))]
+
+    def remove_chunks(self, ids: List[str]):
+        """Remove chunks do catálogo (e fontes que ficaram sem chunks)."""
+        if not ids:
+            return
+        with _catalog_lock, self._connect() as conn:
+            affected = set()
+            for i in range(0, len(ids), 500):
+                part = ids[i:i + 500]
+                placeholders = ",".join("?" * len(part))
+                affected.update(row[0] for row in conn.execute(
+                    f"SELECT DISTINCT source FROM chunks WHERE id IN ({placeholders})", part
+                ))
+                conn.execute(f"DELETE FROM chunks WHERE id IN ({placeholders})", part)
+            self._rebuild_pages(conn, affected)
+            conn.execute("DELETE FROM pages WHERE source IN (SELECT name FROM sources WHERE chunk_count = 0)")
+            conn.execute("DELETE FROM sources WHERE chunk_count = 0")
+
+    def remove_source(self, source: str):
+        """Remove uma fonte e seus chunks do catálogo."""
+        with _catalog_lock, self._connect() as conn:
+            conn.execute("DELETE FROM chunks WHERE source = ?", (source,))
+            conn.execute("DELETE FROM pages WHERE source = ?", (source,))
+            conn.execute("DELETE FROM sources WHERE name = ?", (source,))
+
+    def list_sources(self) -> List[Dict[str, Any]]:
+        """Lista as fontes com módulo, páginas, chunks, hash e data de indexação."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT name, module, page_count, chunk_count, hash, ingested_at FROM sources ORDER BY name"
+            ).fetchall()
+        return [
+            {
+                "name": name,
+                "module": module,
+                "pages": page_count,
+                "chunk_count": chunk_count,
+                "hash": content_hash,
+                "ingested_at": ingested_at
+            }
+            for name, module, page_count, chunk_count, content_hash, ingested_at in rows
+        ]
+
+    def list_modules(self) -> List[str]:
+        """Módulos com pelo menos uma fonte no catálogo."""
+        with self._connect() as conn:
+            return [row[0] for row in conn.execute(
+                "SELECT DISTINCT module FROM sources WHERE module IS NOT NULL ORDER BY module"
+            )]
+
+    def sources_in_module(self, module: str) -> List[str]:
+        """Nomes das fontes de um módulo."""
+        with self._connect() as conn:
+            return [row[0] for row in conn.execute(
+                "SELECT name FROM sources WHERE module = ? ORDER BY name", (module,)
+            )]
+
+    def is_empty(self) -> bool:
+        with self._connect() as conn:
+            return conn.execute("SELECT 1 FROM sources LIMIT 1").fetchone() is None
+
+    def rebuild(self, ids: List[str], metadatas: List[Dict[str, Any]], hashes: Optional[Dict[str, str]] = None):
+        """Recria o catálogo a partir dos ids e metadados do índice (migração de índices antigos)."""
+        with _catalog_lock, self._connect() as conn:
+            conn.execute("DELETE FROM chunks")
+            conn.execute("DELETE FROM sources")
+        self.add_chunks(ids, metadatas)
+        for source, content_hash in (hashes or {}).items():
+            self.set_hash(source, content_hash)
+        logger.info(f"Catálogo de fontes recriado com {len(ids)} chunks")
@@ -0,0 +1,113 @@
+import time
+import bisect
+import logging
+from typing import TYPE_CHECKING, Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from ingest.tracing import Trace
+
+if TYPE_CHECKING:
+    from langchain_text_splitters import TextSplitter
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Separador entre páginas no texto concatenado (tratado como quebra de parágrafo pelo splitter)
+PAGE_SEPARATOR = "\n\n"
+
+
+class DocumentChunker:
+    """Divide o texto de um documento inteiro em chunks, em vez de página a página.
+
+    As páginas de uma mesma fonte são concatenadas em um buffer e divididas
+    de uma vez; cada chunk é localizado no buffer e seu deslocamento é
+    convertido de volta em página (`page`) e, se atravessar páginas, em
+    página final (`page_end`). Assim páginas curtas não viram chunks pequenos
+    e não há um objeto por chunk intermediário.
+
+    Para não materializar o documento, o buffer é dividido sempre que passa de
+    `window` caracteres: os chunks completos são emitidos e o texto a partir
+    do último chunk volta para o buffer, de modo que a divisão continua do
+    ponto em que parou.
+    """
+
+    def __init__(self, text_splitter: "TextSplitter", chunk_size: int, window: Optional[int] = None):
+        self.text_splitter = text_splitter
+        self.window = window or 16 * chunk_size
+
+    def iter_chunks(self, pages_text: Iterable[Dict[str, Any]], trace: Optional[Trace] = None) -> Iterator[Dict[str, Any]]:
+        """Gera os chunks das páginas à medida que elas chegam (uma fonte por vez)."""
+        parts: List[str] = []
+        length = 0
+        # Início de cada página no buffer e seus metadados
+        page_starts: List[int] = []
+        page_metadata: List[Dict[str, Any]] = []
+
+        def flush(final: bool) -> Iterator[Dict[str, Any]]:
+            nonlocal parts, length, page_starts, page_metadata
+            text = "".join(parts)
+            start = time.perf_counter()
+            located = self._locate(text, self.text_splitter.split_text(text))
+            if not final and len(located) > 1:
+                # O último chunk pode continuar na próxima página: volta para o buffer
+                keep_from = located[-1][0]
+                located = located[:-1]
+            else:
+                keep_from = len(text)
+            chunks = [self._chunk(content, offset, page_starts, page_metadata) for offset, content in located]
+            if trace is not None:
+                trace.record("chunking", time.perf_counter() - start, items=len(chunks))
+            yield from chunks
+
+            # Manter o texto restante e as páginas que ele ainda alcança
+            first = max(bisect.bisect_right(page_starts, keep_from) - 1, 0)
+            page_starts = [max(page_start - keep_from, 0) for page_start in page_starts[first:]]
+            page_metadata = page_metadata[first:]
+            parts = [text[keep_from:]]
+            length = len(parts[0])
+            if final or not length:
+                parts, length, page_starts, page_metadata = [], 0, [], []
+
+        for page in pages_text:
+            metadata = page["metadata"]
+            if page_metadata and metadata.get("source") != page_metadata[-1].get("source"):
+                yield from flush(final=True)
+            if length:
+                parts.append(PAGE_SEPARATOR)
+                length += len(PAGE_SEPARATOR)
+            page_starts.append(length)
+            page_metadata.append(metadata)
+            parts.append(page["content"])
+            length += len(page["content"])
+            if length >= self.window:
+                yield from flush(final=False)
+
+        if length:
+            yield from flush(final=True)
+
+    @staticmethod
+    def _locate(text: str, contents: List[str]) -> List[Tuple[int, str]]:
+        """Posição de cada chunk no texto; os chunks vêm em ordem e podem se sobrepor."""
+        located = []
+        cursor = 0
+        for content in contents:
+            offset = text.find(content, cursor)
+            if offset < 0:
+                offset = cursor
+            located.append((offset, content))
+            cursor = offset + 1
+        return located
+
+    @staticmethod
+    def _chunk(
+        content: str,
+        offset: int,
+        page_starts: List[int],
+        page_metadata: List[Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        first = max(bisect.bisect_right(page_starts, offset) - 1, 0)
+        last = max(bisect.bisect_right(page_starts, offset + len(content) - 1) - 1, first)
+        metadata = dict(page_metadata[first])
+        if last > first:
+            metadata["page_end"] = page_metadata[last]["page"]
+        return {"content": content, "metadata": metadata}
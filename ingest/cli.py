@@ -0,0 +1,339 @@
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+import logging
+
+# Adiciona o diretório do projeto ao PATH para importações relativas
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ingest.ingest_pdf import DEFAULT_HF_MODEL, VECTOR_BACKENDS, PDFProcessor, detect_backend, release_vectorstore
+from ingest.index_versions import DEFAULT_KEEP_VERSIONS, IndexVersions, resolve_index
+from ingest.numpy_store import QUANTIZATIONS, index_quantization
+from ingest.sharded_store import is_sharded_index
+from ingest.dedup import DEDUP_SCOPES, DEFAULT_THRESHOLD
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def collect_pdfs(sources: List[str], recursive: bool = False) -> Tuple[Dict[str, str], List[str]]:
+    """Expande diretórios, globs e arquivos em {nome da fonte: caminho}.
+
+    As fontes são identificadas pelo nome do arquivo (como no índice); nomes
+    repetidos em diretórios diferentes ficam com o primeiro encontrado e são
+    devolvidos na lista de duplicados.
+    """
+    pdf_paths: Dict[str, str] = {}
+    duplicates: List[str] = []
+
+    for source in sources:
+        if os.path.isdir(source):
+            pattern = os.path.join(source, "**", "*") if recursive else os.path.join(source, "*")
+            candidates = glob.glob(pattern, recursive=recursive)
+        else:
+            candidates = glob.glob(source, recursive=True) or [source]
+
+        for path in sorted(candidates):
+            if not os.path.isfile(path) or not path.lower().endswith(".pdf"):
+                continue
+            name = os.path.basename(path)
+            if name in pdf_paths:
+                if os.path.abspath(pdf_paths[name]) != os.path.abspath(path):
+                    duplicates.append(path)
+                continue
+            pdf_paths[name] = path
+
+    return dict(sorted(pdf_paths.items())), duplicates
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Ingestão de PDFs em lote, sem interface, retomável a partir do manifesto do índice."
+    )
+    parser.add_argument("sources", nargs="*", default=["data/pdfs"], help="Diretórios, globs ou arquivos PDF (padrão: data/pdfs)")
+    parser.add_argument("-r", "--recursive", action="store_true", help="Percorrer subdiretórios")
+    parser.add_argument("--persist-directory", default="data/index", help="Diretório do índice")
+    parser.add_argument("--embedding-model", choices=["huggingface", "openai"], default="huggingface")
+    parser.add_argument("--hf-model", default=DEFAULT_HF_MODEL, help="Modelo do HuggingFace")
+    parser.add_argument("--openai-api-key", default=None, help="Chave da OpenAI (padrão: OPENAI_API_KEY)")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--chunk-overlap", type=int, default=200)
+    parser.add_argument("--extraction-workers", type=int, default=1, help="Processos de extração")
+    parser.add_argument("--pages-per-task", type=int, default=32, help="Páginas por tarefa de extração")
+    parser.add_argument("--batch-size", type=int, default=64, help="Chunks por lote de embeddings")
+    parser.add_argument("--queue-size", type=int, default=4, help="Lotes em espera entre estágios")
+    parser.add_argument(
+        "--embedding-workers",
+        type=int,
+        default=1,
+        help="Processos do modelo local de embeddings (0: um para cada dois núcleos)"
+    )
+    parser.add_argument(
+        "--embedding-batch-size",
+        type=int,
+        default=None,
+        help="Textos por passada do modelo em cada processo (padrão: calibrado na primeira chamada)"
+    )
+    parser.add_argument(
+        "--openai-concurrency",
+        type=int,
+        default=None,
+        help="Requisições simultâneas de embeddings da OpenAI (padrão: INVEST_GURU_OPENAI_CONCURRENCY, ou 4)"
+    )
+    parser.add_argument(
+        "--shard-by-module",
+        action=argparse.BooleanOptionalAction,
+        default=None,
+        help="Uma coleção por módulo (padrão: o formato atual do índice)"
+    )
+    parser.add_argument(
+        "--vector-backend",
+        choices=VECTOR_BACKENDS,
+        default=None,
+        help="Backend do índice (padrão: o do índice existente, ou chroma)"
+    )
+    parser.add_argument(
+        "--quantization",
+        choices=QUANTIZATIONS,
+        default=None,
+        help="Quantização da busca no backend numpy (padrão: a do índice existente, ou none); um índice existente é convertido"
+    )
+    parser.add_argument(
+        "--dedup-threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help="Similaridade (Jaccard estimado) a partir da qual um chunk é duplicata de outro já indexado"
+    )
+    parser.add_argument("--no-dedup", action="store_true", help="Embeddar e gravar também os chunks duplicados")
+    parser.add_argument(
+        "--dedup-scope",
+        choices=DEDUP_SCOPES,
+        default="module",
+        help="Procurar duplicatas só no mesmo módulo (padrão, mantém o filtro por módulo exato) ou em todo o índice"
+    )
+    parser.add_argument("--prune", action="store_true", help="Remover do índice fontes que não estão nas entradas")
+    parser.add_argument("--force", action="store_true", help="Reprocessar também os arquivos já indexados")
+    parser.add_argument(
+        "--rebuild",
+        action="store_true",
+        help="Reconstruir o índice em uma nova versão, ativada só depois de validada (sem interromper as consultas)"
+    )
+    parser.add_argument(
+        "--keep-versions",
+        type=int,
+        default=DEFAULT_KEEP_VERSIONS,
+        help="Versões do índice mantidas após uma reconstrução, incluindo a ativa"
+    )
+    parser.add_argument("--fail-fast", action="store_true", help="Parar no primeiro arquivo com erro")
+    parser.add_argument("--dry-run", action="store_true", help="Só mostrar o que seria feito")
+    parser.add_argument("--summary", help="Arquivo JSON com o resumo da execução ('-' para a saída padrão)")
+    parser.add_argument("-q", "--quiet", action="store_true", help="Sem progresso no terminal")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    if args.quiet:
+        logging.getLogger().setLevel(logging.WARNING)
+
+    def echo(message: str):
+        if not args.quiet:
+            # Apaga a linha de progresso de páginas, se houver
+            prefix = "\r\x1b[K" if sys.stderr.isatty() else ""
+            print(prefix + message, file=sys.stderr, flush=True)
+
+    pdf_paths, duplicates = collect_pdfs(args.sources, args.recursive)
+    for path in duplicates:
+        echo(f"! Ignorado (nome repetido): {path}")
+    if not pdf_paths:
+        echo("Nenhum PDF encontrado nas entradas informadas.")
+        return 2
+
+    openai_api_key = args.openai_api_key or os.getenv("OPENAI_API_KEY")
+    if args.embedding_model == "openai" and not openai_api_key:
+        echo("A chave da OpenAI é necessária para embeddings da OpenAI (--openai-api-key ou OPENAI_API_KEY).")
+        return 2
+
+    processor_options = dict(
+        embedding_model_type=args.embedding_model,
+        openai_api_key=openai_api_key,
+        hf_model_name=args.hf_model,
+        chunk_size=args.chunk_size,
+        chunk_overlap=args.chunk_overlap,
+        extraction_workers=args.extraction_workers,
+        pages_per_task=args.pages_per_task,
+        batch_size=args.batch_size,
+        queue_size=args.queue_size,
+        shard_by_module=args.shard_by_module,
+        vector_backend=args.vector_backend,
+        quantization=args.quantization,
+        dedup_threshold=None if args.no_dedup else args.dedup_threshold,
+        dedup_scope=args.dedup_scope,
+        embedding_workers=args.embedding_workers,
+        embedding_batch_size=args.embedding_batch_size,
+        openai_concurrency=args.openai_concurrency
+    )
+    if args.rebuild:
+        # A versão nova começa vazia: sem a opção explícita, segue o formato do índice ativo
+        active_index = resolve_index(args.persist_directory)
+        if processor_options["vector_backend"] is None:
+            processor_options["vector_backend"] = detect_backend(active_index)
+        if processor_options["shard_by_module"] is None:
+            processor_options["shard_by_module"] = is_sharded_index(active_index)
+        if processor_options["quantization"] is None:
+            processor_options["quantization"] = index_quantization(active_index)
+    processor = PDFProcessor(persist_directory=args.persist_directory, **processor_options)
+    if args.quantization and processor.backend == "numpy" and not args.rebuild and not args.dry_run:
+        # Abrir o índice não o converte; a troca de quantização pedida é feita aqui, explicitamente
+        if processor.db.quantization != args.quantization:
+            echo(f"Convertendo a quantização do índice de '{processor.db.quantization}' para '{args.quantization}'")
+        processor.db.requantize(args.quantization)
+    # Pool local ou cliente da OpenAI, dentro do cache de embeddings
+    embedder = getattr(processor.embeddings, "embeddings", processor.embeddings)
+    if not hasattr(embedder, "close"):
+        embedder = None
+
+    plan = processor.manifest.plan(pdf_paths, processor.index_params())
+    pending = len(pdf_paths) if args.force or args.rebuild else len(plan.added) + len(plan.changed)
+    if args.rebuild:
+        echo(f"{len(pdf_paths)} PDFs: reconstrução em uma nova versão do índice")
+    else:
+        echo(
+            f"{len(pdf_paths)} PDFs: {len(plan.added)} novos, {len(plan.changed)} alterados, "
+            f"{len(plan.unchanged)} já indexados" + (f", {len(plan.removed)} a remover" if args.prune else "")
+        )
+    if args.dry_run:
+        summary = {
+            "dry_run": True,
+            "added": sorted(plan.added),
+            "changed": sorted(plan.changed),
+            "unchanged": plan.unchanged,
+            "removed": plan.removed if args.prune else []
+        }
+        _write_summary(summary, args.summary)
+        return 0
+
+    started_at = datetime.now()
+    start = time.perf_counter()
+    done = [0]
+
+    def on_file(source: str, status: str, result: Any):
+        if status in ("added", "changed", "failed"):
+            done[0] += 1
+        if status == "failed":
+            echo(f"[{done[0]}/{pending}] ✗ {source}: {result}")
+        elif status in ("added", "changed"):
+            echo(f"[{done[0]}/{pending}] ✓ {source}: {result} chunks")
+        elif status == "removed":
+            echo(f"- {source}: {result} chunks removidos")
+
+    def on_progress(pages_done: int, pages_total: int, chunks_written: int):
+        if not args.quiet and sys.stderr.isatty():
+            print(f"\r  páginas {pages_done}/{pages_total} · chunks {chunks_written}", end="", file=sys.stderr, flush=True)
+
+    def build(directory: str):
+        # Mesmo modelo de embeddings, índice vazio na versão nova
+        staged = PDFProcessor(persist_directory=directory, embeddings=processor.embeddings, **processor_options)
+        return staged, staged.sync_paths(
+            pdf_paths,
+            continue_on_error=not args.fail_fast,
+            on_file=on_file,
+            progress_callback=on_progress
+        )
+
+    interrupted = False
+    rebuilt = None
+    try:
+        if args.rebuild:
+            rebuilt = IndexVersions(args.persist_directory).rebuild(
+                build,
+                keep=args.keep_versions,
+                before_remove=release_vectorstore
+            )
+            processor, results = rebuilt["processor"], rebuilt["results"]
+        else:
+            results = processor.sync_paths(
+                pdf_paths,
+                prune=args.prune,
+                force=args.force,
+                continue_on_error=not args.fail_fast,
+                on_file=on_file,
+                progress_callback=on_progress,
+                plan=plan
+            )
+    except KeyboardInterrupt:
+        # Arquivos já concluídos estão no manifesto; a próxima execução continua dali
+        interrupted = True
+        results = None
+        if args.rebuild:
+            echo("\nInterrompido. A nova versão foi descartada; o índice ativo não mudou.")
+        else:
+            echo("\nInterrompido. Execute novamente para continuar de onde parou.")
+    except Exception as e:
+        logger.error(f"Erro na ingestão: {e}")
+        results = {"error": str(e)}
+    finally:
+        if embedder is not None:
+            embedder.close()
+
+    summary = {
+        "started_at": started_at.isoformat(timespec="seconds"),
+        "finished_at": datetime.now().isoformat(timespec="seconds"),
+        "duration_seconds": round(time.perf_counter() - start, 3),
+        "persist_directory": args.persist_directory,
+        "params": processor.index_params(),
+        "interrupted": interrupted,
+        "results": results
+    }
+    if rebuilt is not None:
+        summary["index_version"] = {key: rebuilt[key] for key in ("version", "previous", "validation", "removed")}
+    if embedder is not None:
+        summary["embeddings"] = embedder.stats()
+    if results and "error" not in results:
+        dedup_stats = processor.deduplicator.stats()
+        summary["totals"] = {
+            "files": len(pdf_paths),
+            "added": len(results["added"]),
+            "changed": len(results["changed"]),
+            "removed": len(results["removed"]),
+            "skipped": len(results["skipped"]),
+            "failed": len(results["failed"]),
+            "chunks_added": sum(results["added"].values()) + sum(results["changed"].values()),
+            "duplicates_linked": dedup_stats["exact"] + dedup_stats["near"]
+        }
+        echo(
+            f"Concluído em {summary['duration_seconds']:.1f}s: {summary['totals']['chunks_added']} chunks de "
+            f"{summary['totals']['added'] + summary['totals']['changed']} arquivos, "
+            f"{summary['totals']['failed']} com erro, {summary['totals']['duplicates_linked']} duplicatas vinculadas"
+        )
+    _write_summary(summary, args.summary)
+
+    if interrupted:
+        return 130
+    if not results or "error" in results or results["failed"]:
+        return 1
+    return 0
+
+
+def _write_summary(summary: Dict[str, Any], destination: Optional[str]):
+    text = json.dumps(summary, ensure_ascii=False, indent=2)
+    if destination and destination != "-":
+        os.makedirs(os.path.dirname(destination) or ".", exist_ok=True)
+        with open(destination, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,351 @@
+import os
+import re
+import json
+import time
+import uuid
+import zlib
+import sqlite3
+import hashlib
+import threading
+import logging
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from ingest.tracing import Trace
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+DEDUP_FILE = "dedup.sqlite"
+
+# Similaridade de Jaccard (estimada pelo MinHash) a partir da qual um chunk é duplicata
+DEFAULT_THRESHOLD = 0.9
+
+# "module": só há duplicata dentro do mesmo módulo (o filtro por módulo continua exato);
+# "index": em todo o índice
+DEDUP_SCOPES = ("module", "index")
+
+# Assinatura MinHash: NUM_PERM permutações, divididas em BANDS faixas para o LSH.
+# Com 16 faixas de 4 linhas, pares com Jaccard >= 0,8 viram candidatos com probabilidade > 99%.
+NUM_PERM = 64
+BANDS = 16
+SHINGLE_WORDS = 5
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64(0xFFFFFFFF)
+_rng = np.random.RandomState(1)
+_PERM_A = _rng.randint(1, (1 << 61) - 1, size=NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.randint(0, (1 << 61) - 1, size=NUM_PERM, dtype=np.uint64)
+
+_NON_WORD = re.compile(r"\W+")
+
+_dedup_lock = threading.Lock()
+
+
+def normalize_text(text: str) -> str:
+    """Texto em minúsculas, só com palavras (ignora pontuação, espaços e quebras de linha)."""
+    return _NON_WORD.sub(" ", text.lower()).strip()
+
+
+def exact_hash(normalized: str) -> str:
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+
+def minhash(normalized: str) -> np.ndarray:
+    """Assinatura MinHash (uint32) dos shingles de SHINGLE_WORDS palavras do texto."""
+    words = normalized.split()
+    size = min(SHINGLE_WORDS, len(words)) or 1
+    shingles = {" ".join(words[i:i + size]) for i in range(max(len(words) - size + 1, 1))}
+    hashes = np.fromiter((zlib.crc32(shingle.encode("utf-8")) for shingle in shingles), dtype=np.uint64, count=len(shingles))
+    with np.errstate(over="ignore"):
+        permuted = (np.outer(hashes, _PERM_A) + _PERM_B) % _MERSENNE_PRIME & _MAX_HASH
+    return permuted.min(axis=0).astype(np.uint32)
+
+
+def _buckets(signature: np.ndarray, scope_key: str) -> List[Tuple[int, int]]:
+    """(faixa, bucket) de cada faixa da assinatura; o escopo entra no hash do bucket."""
+    rows = NUM_PERM // BANDS
+    salt = scope_key.encode("utf-8")
+    return [
+        (band, int.from_bytes(
+            hashlib.blake2b(salt + signature[band * rows:(band + 1) * rows].tobytes(), digest_size=8).digest(),
+            "little",
+            signed=True
+        ))
+        for band in range(BANDS)
+    ]
+
+
+class ChunkDeduplicator:
+    """Detecção de chunks duplicados ou quase duplicados na ingestão.
+
+    Cada chunk novo é comparado, pelo hash do texto normalizado e por MinHash
+    com LSH, com as assinaturas já gravadas em um índice SQLite ao lado do
+    vectorstore. Uma duplicata (cabeçalho, aviso legal ou slide repetido) não
+    é embeddada nem gravada: vira um vínculo para o chunk canônico que guarda
+    a sua fonte e página, de modo que nenhuma referência se perde.
+
+    Os chunks aceitos ficam pendentes em memória até `commit` (chamado depois
+    da gravação no vectorstore), para que o índice nunca aponte para um chunk
+    que não chegou a ser gravado.
+    """
+
+    def __init__(self, persist_directory: str, threshold: float = DEFAULT_THRESHOLD, scope: str = "module"):
+        if scope not in DEDUP_SCOPES:
+            raise ValueError(f"Escopo de deduplicação '{scope}' não suportado (use {', '.join(DEDUP_SCOPES)})")
+        self.path = os.path.join(persist_directory, DEDUP_FILE)
+        self.threshold = threshold
+        self.scope = scope
+        self._lock = threading.Lock()
+        # Chunks aceitos e ainda não gravados: id -> (fonte, escopo, hash, assinatura, buckets)
+        self._pending: Dict[str, Tuple[str, str, str, np.ndarray, List[Tuple[int, int]]]] = {}
+        self._pending_exact: Dict[Tuple[str, str], str] = {}
+        self._pending_buckets: Dict[Tuple[int, int], List[str]] = {}
+        # Vínculos cujo chunk canônico ainda está pendente
+        self._pending_links: Dict[str, List[Tuple]] = {}
+        self._counts = {"checked": 0, "exact": 0, "near": 0}
+
+        os.makedirs(persist_directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS signatures (
+                    id TEXT PRIMARY KEY,
+                    source TEXT NOT NULL,
+                    scope_key TEXT NOT NULL,
+                    exact TEXT NOT NULL,
+                    minhash BLOB NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_signatures_exact ON signatures (exact, scope_key);
+                CREATE INDEX IF NOT EXISTS idx_signatures_source ON signatures (source);
+                CREATE TABLE IF NOT EXISTS bands (
+                    band INTEGER NOT NULL,
+                    bucket INTEGER NOT NULL,
+                    id TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_bands_bucket ON bands (band, bucket);
+                CREATE INDEX IF NOT EXISTS idx_bands_id ON bands (id);
+                CREATE TABLE IF NOT EXISTS links (
+                    id TEXT PRIMARY KEY,
+                    canonical_id TEXT NOT NULL,
+                    source TEXT NOT NULL,
+                    metadata TEXT NOT NULL,
+                    similarity REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_links_canonical ON links (canonical_id);
+                CREATE INDEX IF NOT EXISTS idx_links_source ON links (source);
+                """
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    def _scope_key(self, metadata: Dict[str, Any]) -> str:
+        return str(metadata.get("module", "")) if self.scope == "module" else ""
+
+    def _find(
+        self,
+        conn: sqlite3.Connection,
+        exact: str,
+        signature: np.ndarray,
+        buckets: List[Tuple[int, int]],
+        scope_key: str
+    ) -> Optional[Tuple[str, float]]:
+        """Chunk canônico (id, similaridade) para a assinatura, entre os gravados e os pendentes."""
+        canonical_id = self._pending_exact.get((scope_key, exact))
+        if canonical_id is not None:
+            return canonical_id, 1.0
+
+        row = conn.execute(
+            "SELECT id FROM signatures WHERE exact = ? AND scope_key = ? LIMIT 1", (exact, scope_key)
+        ).fetchone()
+        if row is not None:
+            return row[0], 1.0
+        condition = " OR ".join("(band = ? AND bucket = ?)" for _ in buckets)
+        params = [value for bucket in buckets for value in bucket]
+        candidates = {
+            candidate_id: np.frombuffer(blob, dtype=np.uint32)
+            for candidate_id, blob in conn.execute(
+                "SELECT s.id, s.minhash FROM signatures s "
+                f"JOIN (SELECT DISTINCT id FROM bands WHERE {condition}) b ON b.id = s.id",
+                params
+            )
+        }
+
+        for bucket in buckets:
+            for candidate_id in self._pending_buckets.get(bucket, ()):
+                candidates[candidate_id] = self._pending[candidate_id][3]
+
+        best = None
+        for candidate_id, candidate in candidates.items():
+            similarity = float(np.mean(candidate == signature))
+            if similarity >= self.threshold and (best is None or similarity > best[1]):
+                best = (candidate_id, similarity)
+        return best
+
+    def filter(
+        self,
+        chunks: Iterable[Dict[str, Any]],
+        on_duplicates: Optional[Callable[[List[Dict[str, Any]]], None]] = None,
+        trace: Optional[Trace] = None,
+        batch_size: int = 64
+    ) -> Iterator[Dict[str, Any]]:
+        """Repassa só os chunks inéditos, cada um com um "id" definido aqui.
+
+        As duplicatas são vinculadas ao chunk canônico e passadas a
+        `on_duplicates` (com "id" próprio e "duplicate_of") em lotes de até
+        `batch_size`, por exemplo para registrar as páginas no catálogo em uma
+        transação por lote. Uma única conexão ao SQLite é usada na execução.
+        """
+        conn = self._connect()
+        duplicates: List[Dict[str, Any]] = []
+        # Vínculos para chunks canônicos já gravados, gravados junto com o lote de duplicatas
+        links: List[Tuple] = []
+
+        def flush():
+            if links:
+                with _dedup_lock, conn:
+                    conn.executemany("INSERT OR REPLACE INTO links VALUES (?, ?, ?, ?, ?)", links)
+                links.clear()
+            if duplicates and on_duplicates:
+                on_duplicates(list(duplicates))
+            duplicates.clear()
+
+        try:
+            for chunk in chunks:
+                start = time.perf_counter()
+                chunk.setdefault("id", str(uuid.uuid4()))
+                metadata = chunk["metadata"]
+                normalized = normalize_text(chunk["content"])
+                exact = exact_hash(normalized)
+                signature = minhash(normalized)
+                scope_key = self._scope_key(metadata)
+                buckets = _buckets(signature, scope_key)
+
+                with self._lock:
+                    self._counts["checked"] += 1
+                    found = self._find(conn, exact, signature, buckets, scope_key)
+                    if found is None:
+                        self._pending[chunk["id"]] = (metadata.get("source", "Desconhecido"), scope_key, exact, signature, buckets)
+                        self._pending_exact.setdefault((scope_key, exact), chunk["id"])
+                        for bucket in buckets:
+                            self._pending_buckets.setdefault(bucket, []).append(chunk["id"])
+                    else:
+                        canonical_id, similarity = found
+                        self._counts["exact" if similarity == 1.0 else "near"] += 1
+                        link = (chunk["id"], canonical_id, metadata.get("source", "Desconhecido"), json.dumps(metadata), similarity)
+                        if canonical_id in self._pending:
+                            self._pending_links.setdefault(canonical_id, []).append(link)
+                        else:
+                            links.append(link)
+
+                if trace is not None:
+                    trace.record("dedup", time.perf_counter() - start, items=1, duplicates=int(found is not None))
+                if found is None:
+                    yield chunk
+                else:
+                    chunk["duplicate_of"] = found[0]
+                    duplicates.append(chunk)
+                    if len(duplicates) >= batch_size:
+                        flush()
+            flush()
+        finally:
+            conn.close()
+
+    def commit(self, ids: List[str]):
+        """Grava as assinaturas (e vínculos pendentes) dos chunks já gravados no vectorstore."""
+        with self._lock:
+            pending = [(chunk_id, self._pending.pop(chunk_id)) for chunk_id in ids if chunk_id in self._pending]
+            links = [link for chunk_id, _ in pending for link in self._pending_links.pop(chunk_id, [])]
+            for chunk_id, (_, scope_key, exact, _, buckets) in pending:
+                if self._pending_exact.get((scope_key, exact)) == chunk_id:
+                    del self._pending_exact[(scope_key, exact)]
+                for bucket in buckets:
+                    self._pending_buckets[bucket].remove(chunk_id)
+                    if not self._pending_buckets[bucket]:
+                        del self._pending_buckets[bucket]
+
+            with _dedup_lock, self._connect() as conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO signatures VALUES (?, ?, ?, ?, ?)",
+                    [
+                        (chunk_id, source, scope_key, exact, signature.tobytes())
+                        for chunk_id, (source, scope_key, exact, signature, _) in pending
+                    ]
+                )
+                conn.executemany(
+                    "INSERT INTO bands VALUES (?, ?, ?)",
+                    [(band, bucket, chunk_id) for chunk_id, entry in pending for band, bucket in entry[4]]
+                )
+                conn.executemany("INSERT OR REPLACE INTO links VALUES (?, ?, ?, ?, ?)", links)
+
+    def discard_pending(self):
+        """Esquece chunks aceitos que não chegaram a ser gravados (ingestão interrompida)."""
+        with self._lock:
+            if self._pending:
+                logger.warning(f"Descartadas {len(self._pending)} assinaturas de chunks não gravados")
+            self._pending.clear()
+            self._pending_exact.clear()
+            self._pending_buckets.clear()
+            self._pending_links.clear()
+
+    def orphaned_links(self, source: str) -> Dict[str, List[Dict[str, Any]]]:
+        """Vínculos de outras fontes cujo chunk canônico pertence a `source` (canônico -> vínculos)."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT l.canonical_id, l.id, l.source, l.metadata FROM links l "
+                "JOIN signatures s ON s.id = l.canonical_id "
+                "WHERE s.source = ? AND l.source != ? ORDER BY l.rowid",
+                (source, source)
+            ).fetchall()
+        orphaned: Dict[str, List[Dict[str, Any]]] = {}
+        for canonical_id, link_id, link_source, metadata in rows:
+            orphaned.setdefault(canonical_id, []).append({"id": link_id, "source": link_source, "metadata": json.loads(metadata)})
+        return orphaned
+
+    def promote(self, canonical_id: str, link: Dict[str, Any]):
+        """Torna o vínculo `link` o novo chunk canônico (o vectorstore já o gravou com o id do vínculo)."""
+        with _dedup_lock, self._connect() as conn:
+            conn.execute(
+                "UPDATE signatures SET id = ?, source = ?, scope_key = ? WHERE id = ?",
+                (link["id"], link["source"], self._scope_key(link["metadata"]), canonical_id)
+            )
+            conn.execute("UPDATE bands SET id = ? WHERE id = ?", (link["id"], canonical_id))
+            conn.execute("DELETE FROM links WHERE id = ?", (link["id"],))
+            conn.execute("UPDATE links SET canonical_id = ? WHERE canonical_id = ?", (link["id"], canonical_id))
+
+    def remove_source(self, source: str):
+        """Remove assinaturas e vínculos de uma fonte (depois de `promote` para os vínculos de outras fontes)."""
+        with _dedup_lock, self._connect() as conn:
+            conn.execute("DELETE FROM links WHERE source = ?", (source,))
+            conn.execute("DELETE FROM bands WHERE id IN (SELECT id FROM signatures WHERE source = ?)", (source,))
+            conn.execute("DELETE FROM signatures WHERE source = ?", (source,))
+
+    def references(self, ids: List[str]) -> Dict[str, List[Dict[str, Any]]]:
+        """Metadados (fonte, página, módulo) das duplicatas vinculadas a cada chunk canônico."""
+        if not ids:
+            return {}
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT canonical_id, metadata FROM links WHERE canonical_id IN ({','.join('?' * len(ids))}) ORDER BY rowid",
+                list(ids)
+            ).fetchall()
+        references: Dict[str, List[Dict[str, Any]]] = {}
+        for canonical_id, metadata in rows:
+            references.setdefault(canonical_id, []).append(json.loads(metadata))
+        return references
+
+    def link_count(self) -> int:
+        """Duplicatas vinculadas no índice (chunks no catálogo que não foram gravados)."""
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM links").fetchone()[0]
+
+    def stats(self) -> Dict[str, Any]:
+        """Chunks verificados nesta instância e duplicatas encontradas (exatas e aproximadas)."""
+        with self._lock:
+            counts = dict(self._counts)
+        duplicates = counts["exact"] + counts["near"]
+        counts["duplicate_rate"] = duplicates / counts["checked"] if counts["checked"] else 0.0
+        return counts
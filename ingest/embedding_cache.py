@@ -0,0 +1,198 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+import logging
+from array import array
+from typing import Dict, List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_PATH = "data/cache/embeddings.sqlite"
+
+# Limite de variáveis por consulta do SQLite
+_SQL_BATCH = 500
+
+
+def text_hash(text: str) -> str:
+    """SHA-256 do texto do chunk."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class CachedEmbeddings(Embeddings):
+    """Cache persistente (SQLite) de embeddings de documentos.
+
+    A chave é (modelo, sha256 do texto): o mesmo chunk não é recalculado ao
+    mudar parâmetros de chunking, reindexar ou reenviar um PDF renomeado.
+    Os vetores são guardados em float32 e, quando o arquivo passa de
+    `max_bytes`, as entradas menos usadas recentemente são descartadas.
+    Embeddings de consultas não passam pelo cache.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        model_id: str,
+        cache_path: str = DEFAULT_CACHE_PATH,
+        max_bytes: int = 512 * 1024 * 1024
+    ):
+        self.embeddings = embeddings
+        self.model_id = model_id
+        self.cache_path = cache_path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(cache_path, check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON embeddings (last_access)")
+        self._conn.commit()
+        self._size = self._conn.execute(
+            "SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings"
+        ).fetchone()[0]
+
+    def _lookup(self, hashes: List[str]) -> Dict[str, List[float]]:
+        found = {}
+        for i in range(0, len(hashes), _SQL_BATCH):
+            part = hashes[i:i + _SQL_BATCH]
+            placeholders = ",".join("?" * len(part))
+            rows = self._conn.execute(
+                f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                [self.model_id, *part]
+            ).fetchall()
+            for key, blob in rows:
+                found[key] = array("f", blob).tolist()
+        if found:
+            now = time.time()
+            self._conn.executemany(
+                "UPDATE embeddings SET last_access = ? WHERE model = ? AND text_hash = ?",
+                [(now, self.model_id, key) for key in found]
+            )
+        return found
+
+    def _store(self, vectors: Dict[str, List[float]]):
+        now = time.time()
+        rows = [(self.model_id, key, array("f", vector).tobytes(), now) for key, vector in vectors.items()]
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO embeddings (model, text_hash, vector, last_access) VALUES (?, ?, ?, ?)",
+            rows
+        )
+        self._size += sum(len(row[2]) for row in rows)
+        if self._size > self.max_bytes:
+            self._evict()
+
+    def _evict(self):
+        # Remove as entradas menos usadas até ficar em 90% do limite
+        target = int(self.max_bytes * 0.9)
+        while self._size > target:
+            rows = self._conn.execute(
+                "SELECT rowid, LENGTH(vector) FROM embeddings ORDER BY last_access LIMIT ?",
+                (_SQL_BATCH,)
+            ).fetchall()
+            if not rows:
+                self._size = 0
+                break
+            to_delete = []
+            for rowid, size in rows:
+                to_delete.append((rowid,))
+                self._size -= size
+                if self._size <= target:
+                    break
+            self._conn.executemany("DELETE FROM embeddings WHERE rowid = ?", to_delete)
+            self.evictions += len(to_delete)
+        logger.info(f"Cache de embeddings reduzido para {self._size / 1024 / 1024:.1f} MB")
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Retorna os embeddings dos textos, calculando apenas os que não estão no cache."""
+        hashes = [text_hash(text) for text in texts]
+
+        with self._lock:
+            cached = self._lookup(list(set(hashes)))
+            self._conn.commit()
+
+        # Textos repetidos no mesmo lote são calculados uma única vez
+        missing = {}
+        for key, text in zip(hashes, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+
+        computed = {}
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+            with self._lock:
+                self._store(computed)
+                self._conn.commit()
+
+        hits = sum(1 for key in hashes if key in cached)
+        with self._lock:
+            self.hits += hits
+            self.misses += len(hashes) - hits
+
+        return [cached[key] if key in cached else computed[key] for key in hashes]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embeddings.embed_query(text)
+
+    @property
+    def workers(self) -> int:
+        """Lotes que o modelo envolvido atende em paralelo (processos locais ou requisições), para dimensionar a ingestão."""
+        return getattr(self.embeddings, "workers", 1)
+
+    def stats(self) -> Dict[str, float]:
+        """Estatísticas de uso do cache."""
+        with self._lock:
+            entries = self._conn.execute(
+                "SELECT COUNT(*) FROM embeddings WHERE model = ?", (self.model_id,)
+            ).fetchone()[0]
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "evictions": self.evictions,
+                "entries": entries,
+                "size_mb": self._size / 1024 / 1024
+            }
+
+    def clear(self, model_only: bool = True):
+        """Remove as entradas do modelo atual (ou de todos os modelos)."""
+        with self._lock:
+            if model_only:
+                self._conn.execute("DELETE FROM embeddings WHERE model = ?", (self.model_id,))
+            else:
+                self._conn.execute("DELETE FROM embeddings")
+            self._conn.commit()
+            self._size = self._conn.execute(
+                "SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings"
+            ).fetchone()[0]
+
+
+def cached_embeddings(
+    embeddings: Embeddings,
+    model_id: str,
+    cache_path: Optional[str] = DEFAULT_CACHE_PATH,
+    max_bytes: int = 512 * 1024 * 1024
+) -> Embeddings:
+    """Envolve `embeddings` no cache persistente; `cache_path=None` desativa o cache."""
+    if not cache_path:
+        return embeddings
+    return CachedEmbeddings(embeddings, model_id, cache_path, max_bytes)
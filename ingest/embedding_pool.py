@@ -0,0 +1,265 @@
+import os
+import time
+import atexit
+import threading
+import multiprocessing
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Tamanhos de lote testados na calibração, em ordem crescente
+CALIBRATION_BATCH_SIZES = (8, 16, 32, 64, 128)
+# Textos usados na calibração, para qualquer tamanho da primeira chamada (os dela, repetidos
+# se forem poucos): o maior lote passa ao menos duas vezes pelo modelo
+CALIBRATION_TEXTS = 2 * CALIBRATION_BATCH_SIZES[-1]
+# Diferença máxima aceita em relação ao caminho de um processo (HuggingFaceEmbeddings); acima
+# disso o cache e o índice, que usam o mesmo identificador de modelo, misturariam vetores diferentes
+VERIFY_TOLERANCE = 1e-4
+# A calibração para quando a vazão cai abaixo desta fração da melhor
+CALIBRATION_TOLERANCE = 0.9
+
+# Lote escolhido e vazões medidas por (modelo, threads por worker), reaproveitados por outros pools do processo
+_calibrated: Dict[Tuple[str, int], Tuple[int, Dict[int, float]]] = {}
+
+# Modelo carregado em cada processo worker
+_model = None
+
+
+def _load_model(model_name: str, model_kwargs: Dict[str, Any], threads: Optional[int] = None):
+    if threads:
+        import torch
+        torch.set_num_threads(threads)
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_name, **model_kwargs)
+
+
+def _init_worker(model_name: str, model_kwargs: Dict[str, Any], threads: int):
+    global _model
+    _model = _load_model(model_name, model_kwargs, threads)
+
+
+def _encode_with(model, texts: List[str], batch_size: int, encode_kwargs: Dict[str, Any]) -> Tuple[np.ndarray, int, float]:
+    start = time.perf_counter()
+    vectors = model.encode(texts, batch_size=batch_size, show_progress_bar=False, **encode_kwargs)
+    return np.asarray(vectors), os.getpid(), time.perf_counter() - start
+
+
+def _encode(texts: List[str], batch_size: int, encode_kwargs: Dict[str, Any]) -> Tuple[np.ndarray, int, float]:
+    """Tarefa executada no worker: um lote de até `batch_size` textos, em uma única passada do modelo."""
+    return _encode_with(_model, texts, batch_size, encode_kwargs)
+
+
+class LocalEmbeddingPool(Embeddings):
+    """Embeddings do sentence-transformers calculados em um pool de processos.
+
+    Cada worker carrega o modelo uma vez (com `threads_per_worker` threads do
+    torch) e recebe lotes de até `batch_size` textos; os lotes de uma chamada
+    são distribuídos entre os workers e remontados na ordem de entrada. Sem
+    `batch_size`, ele é escolhido na primeira chamada por uma calibração curta
+    (vazão de cada tamanho em CALIBRATION_BATCH_SIZES sobre os primeiros
+    textos).
+
+    O texto é preparado como no `HuggingFaceEmbeddings` (quebras de linha
+    viram espaço) e o identificador do modelo é o mesmo, de modo que o cache
+    de embeddings e o manifesto do índice continuam valendo. Com `verify`, os
+    textos da primeira chamada também são calculados pelo caminho de um
+    processo (`HuggingFaceEmbeddings.embed_documents`, com o lote padrão dele)
+    e comparados: vetores idênticos só são garantidos com o mesmo lote (o
+    preenchimento dos textos de um lote muda os últimos bits), então a
+    diferença máxima é registrada e, acima de VERIFY_TOLERANCE, a chamada
+    falha. `embed_query` usa o mesmo `HuggingFaceEmbeddings`.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        workers: int = 0,
+        batch_size: Optional[int] = None,
+        threads_per_worker: Optional[int] = None,
+        model_kwargs: Optional[Dict[str, Any]] = None,
+        encode_kwargs: Optional[Dict[str, Any]] = None,
+        verify: bool = True
+    ):
+        cpus = os.cpu_count() or 1
+        self.model_name = model_name
+        # 0: um worker para cada dois núcleos
+        self.workers = workers if workers > 0 else max(1, cpus // 2)
+        self.threads_per_worker = threads_per_worker or max(1, cpus // self.workers)
+        self.batch_size = batch_size
+        self.model_kwargs = model_kwargs or {}
+        self.encode_kwargs = encode_kwargs or {}
+        self.verify = verify
+        self.model_id = f"HuggingFaceEmbeddings:{model_name}"
+        self.calibration: Dict[int, float] = {}
+        self.verified: Optional[bool] = None
+        self.max_abs_diff: Optional[float] = None
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._local_model = None
+        self._reference = None
+        self._lock = threading.Lock()
+        self._calibration_lock = threading.Lock()
+        self._worker_stats: Dict[int, Dict[str, float]] = {}
+        self._texts = 0
+        self._seconds = 0.0
+
+    def _pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                logger.info(
+                    f"Iniciando {self.workers} workers de embeddings ({self.model_name}, "
+                    f"{self.threads_per_worker} thread(s) cada)"
+                )
+                # "spawn": o torch não é seguro após fork
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(self.model_name, self.model_kwargs, self.threads_per_worker)
+                )
+                atexit.register(self.close)
+            return self._executor
+
+    def _local(self):
+        with self._lock:
+            if self._local_model is None:
+                self._local_model = _load_model(self.model_name, self.model_kwargs)
+            return self._local_model
+
+    def _single_process(self):
+        """O caminho de um processo (`create_embeddings` com um worker), usado como referência."""
+        with self._lock:
+            if self._reference is None:
+                from langchain_huggingface import HuggingFaceEmbeddings
+                self._reference = HuggingFaceEmbeddings(
+                    model_name=self.model_name, model_kwargs=self.model_kwargs, encode_kwargs=self.encode_kwargs
+                )
+            return self._reference
+
+    def _run(self, batches: List[List[str]], batch_size: int) -> List[Tuple[np.ndarray, int, float]]:
+        if self.workers == 1:
+            model = self._local()
+            return [_encode_with(model, batch, batch_size, self.encode_kwargs) for batch in batches]
+        return list(self._pool().map(_encode, batches, repeat(batch_size), repeat(self.encode_kwargs)))
+
+    def _calibrate(self, texts: List[str]) -> int:
+        """Escolhe o lote de maior vazão sobre CALIBRATION_TEXTS textos (uma vez por modelo e configuração)."""
+        key = (self.model_name, self.threads_per_worker)
+        if key in _calibrated:
+            best, self.calibration = _calibrated[key]
+            return best
+        # Amostra de tamanho fixo, mesmo que a chamada traga poucos textos (ex.: um lote da ingestão)
+        sample = (texts * (CALIBRATION_TEXTS // len(texts) + 1))[:CALIBRATION_TEXTS]
+        # Aquecimento: a primeira passada inclui alocações e inicialização do modelo
+        self._run([sample[:CALIBRATION_BATCH_SIZES[0]]], CALIBRATION_BATCH_SIZES[0])
+        best = CALIBRATION_BATCH_SIZES[0]
+        for batch_size in CALIBRATION_BATCH_SIZES:
+            # Um único worker por vez, para medir a vazão de um processo
+            start = time.perf_counter()
+            for i in range(0, len(sample), batch_size):
+                self._run([sample[i:i + batch_size]], batch_size)
+            self.calibration[batch_size] = len(sample) / (time.perf_counter() - start)
+            if self.calibration[batch_size] > self.calibration[best]:
+                best = batch_size
+            elif self.calibration[batch_size] < self.calibration[best] * CALIBRATION_TOLERANCE:
+                break
+        _calibrated[key] = (best, self.calibration)
+        logger.info(
+            "Calibração de lote dos embeddings: "
+            + ", ".join(f"{size}: {rate:.0f} textos/s" for size, rate in self.calibration.items())
+            + f" -> lote {best}"
+        )
+        return best
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Calcula os embeddings distribuindo lotes de `batch_size` textos entre os workers."""
+        if not texts:
+            return []
+        texts = [text.replace("\n", " ") for text in texts]
+        if self.batch_size is None:
+            # Chamadas concorrentes esperam a calibração da primeira
+            with self._calibration_lock:
+                if self.batch_size is None:
+                    self.batch_size = self._calibrate(texts)
+        batch_size = self.batch_size
+
+        start = time.perf_counter()
+        batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+        results = self._run(batches, batch_size)
+        elapsed = time.perf_counter() - start
+
+        with self._lock:
+            self._texts += len(texts)
+            self._seconds += elapsed
+            for batch, (_, pid, seconds) in zip(batches, results):
+                stats = self._worker_stats.setdefault(pid, {"texts": 0, "seconds": 0.0})
+                stats["texts"] += len(batch)
+                stats["seconds"] += seconds
+            verify = self.verify and self.verified is None
+            if verify:
+                self.verified = False
+
+        vectors = np.concatenate([vectors for vectors, _, _ in results])
+        if verify:
+            reference = np.asarray(self._single_process().embed_documents(texts), dtype=vectors.dtype)
+            self.max_abs_diff = float(np.max(np.abs(reference - vectors))) if reference.size else 0.0
+            self.verified = bool(np.array_equal(reference, vectors))
+            if self.max_abs_diff > VERIFY_TOLERANCE:
+                raise ValueError(
+                    f"Embeddings do pool diferem do HuggingFaceEmbeddings (diferença máxima {self.max_abs_diff:.2e}); "
+                    "use um único worker ou outro identificador de modelo"
+                )
+            if not self.verified:
+                logger.warning(
+                    f"Embeddings do pool diferem do HuggingFaceEmbeddings nos últimos bits "
+                    f"(lote {batch_size}, diferença máxima {self.max_abs_diff:.2e})"
+                )
+
+        return vectors.tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._single_process().embed_query(text)
+
+    def stats(self) -> Dict[str, Any]:
+        """Lote escolhido, calibração, verificação e vazão total e por worker."""
+        with self._lock:
+            per_worker = [
+                {
+                    "pid": pid,
+                    "texts": stats["texts"],
+                    "seconds": round(stats["seconds"], 3),
+                    "texts_per_second": round(stats["texts"] / stats["seconds"], 1) if stats["seconds"] else 0.0
+                }
+                for pid, stats in sorted(self._worker_stats.items())
+            ]
+            return {
+                "workers": self.workers,
+                "threads_per_worker": self.threads_per_worker,
+                "batch_size": self.batch_size,
+                "calibration": {size: round(rate, 1) for size, rate in self.calibration.items()},
+                "verified_identical": self.verified,
+                "max_abs_diff": self.max_abs_diff,
+                "texts": self._texts,
+                "texts_per_second": round(self._texts / self._seconds, 1) if self._seconds else 0.0,
+                "per_worker": per_worker
+            }
+
+    def close(self):
+        """Encerra os workers, registrando a vazão de cada um."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is None:
+            return
+        executor.shutdown(wait=True)
+        for worker in self.stats()["per_worker"]:
+            logger.info(
+                f"Worker de embeddings {worker['pid']}: {worker['texts']} textos, "
+                f"{worker['texts_per_second']} textos/s"
+            )
@@ -0,0 +1,353 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import logging
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Ponteiro (JSON) para a versão ativa, dentro do diretório raiz do índice
+ACTIVE_FILE = "ACTIVE"
+# Versões completas do índice: <raiz>/versions/<versão>/
+VERSIONS_DIR = "versions"
+# Situação de cada versão (staging, active, retired), dentro do diretório da versão
+VERSION_INFO_FILE = "version.json"
+# Nome dado ao índice gravado direto na raiz (criado antes das versões)
+LEGACY_VERSION = "legacy"
+
+# Versões mantidas pela retenção, incluindo a ativa (a anterior serve para voltar atrás)
+DEFAULT_KEEP_VERSIONS = 2
+# Versões desativadas há menos que isso não são apagadas: sessões podem estar no meio de uma consulta
+DEFAULT_GRACE_SECONDS = 600
+# Builds interrompidos (processo encerrado no meio) são apagados depois disso
+STALE_STAGING_SECONDS = 24 * 3600
+
+# Validação: chunks consultados e fração deles que deve encontrar a própria fonte
+DEFAULT_SAMPLE_QUERIES = 5
+MIN_SAMPLE_HIT_RATE = 0.8
+
+# Callback chamado antes de apagar o diretório de uma versão (ex.: fechar handles do Chroma)
+RemoveCallback = Callable[[str], Any]
+
+
+def _now() -> str:
+    return datetime.now().isoformat(timespec="seconds")
+
+
+def _age_seconds(timestamp: Optional[str]) -> float:
+    if not timestamp:
+        return float("inf")
+    try:
+        return time.time() - datetime.fromisoformat(timestamp).timestamp()
+    except ValueError:
+        return float("inf")
+
+
+def _write_json(path: str, data: Dict[str, Any]):
+    """Grava o JSON em um arquivo temporário e o troca de uma vez (os.replace é atômico)."""
+    tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path: str) -> Optional[Dict[str, Any]]:
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Arquivo inválido em {path}, ignorando: {e}")
+        return None
+
+
+def resolve_index(persist_directory: str) -> str:
+    """Diretório do índice ativo: a versão apontada por ACTIVE ou, sem ponteiro, o próprio diretório.
+
+    Chamado a cada uso (abertura do índice, nova pergunta), de modo que,
+    depois da troca do ponteiro, as sessões passam para a nova versão na
+    próxima consulta. Um diretório de versão (sem ACTIVE) resolve para ele mesmo.
+    """
+    version = IndexVersions(persist_directory).active()
+    if version is None:
+        return persist_directory
+    return os.path.join(persist_directory, VERSIONS_DIR, version)
+
+
+class IndexVersions:
+    """Versões de um índice e o ponteiro para a ativa.
+
+    Uma reconstrução é feita em uma versão nova (`stage`), fora do caminho das
+    consultas; depois de validada, `activate` troca o ponteiro ACTIVE de uma
+    só vez e a versão anterior é aposentada. `apply_retention` apaga as
+    versões aposentadas além das `keep` mais recentes (incluindo o índice
+    antigo na raiz, se houver), respeitando um prazo para as consultas em
+    andamento terminarem.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.active_path = os.path.join(root, ACTIVE_FILE)
+        self.versions_path = os.path.join(root, VERSIONS_DIR)
+
+    def pointer(self) -> Optional[Dict[str, Any]]:
+        """Conteúdo do ponteiro ACTIVE (versão, quando foi ativada, validação)."""
+        return _read_json(self.active_path)
+
+    def active(self) -> Optional[str]:
+        """Versão ativa, ou None se o índice ainda não usa versões."""
+        pointer = self.pointer()
+        version = pointer.get("version") if pointer else None
+        if version and not os.path.isdir(self.directory(version)):
+            logger.error(f"Versão ativa do índice não encontrada: {self.directory(version)}")
+            return None
+        return version
+
+    def directory(self, version: str) -> str:
+        return os.path.join(self.versions_path, version)
+
+    def info(self, version: str) -> Dict[str, Any]:
+        return _read_json(os.path.join(self.directory(version), VERSION_INFO_FILE)) or {"version": version}
+
+    def _set_info(self, version: str, **values: Any):
+        info = self.info(version)
+        info.update(values)
+        _write_json(os.path.join(self.directory(version), VERSION_INFO_FILE), info)
+
+    def list_versions(self) -> List[Dict[str, Any]]:
+        """Versões existentes, da mais recente para a mais antiga."""
+        if not os.path.isdir(self.versions_path):
+            return []
+        versions = [
+            self.info(name)
+            for name in os.listdir(self.versions_path)
+            if os.path.isdir(self.directory(name))
+        ]
+        return sorted(versions, key=lambda info: info["version"], reverse=True)
+
+    def _legacy_entries(self) -> List[str]:
+        """Arquivos do índice antigo, gravado direto na raiz."""
+        if not os.path.isdir(self.root):
+            return []
+        return [
+            name for name in os.listdir(self.root)
+            if name not in (ACTIVE_FILE, VERSIONS_DIR) and not name.startswith(f"{ACTIVE_FILE}.")
+        ]
+
+    def stage(self) -> Tuple[str, str]:
+        """Cria o diretório de uma nova versão (ainda não ativa) e retorna (versão, diretório)."""
+        # Nomes em ordem cronológica (a retenção ordena as versões pelo nome)
+        version = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+        directory = self.directory(version)
+        os.makedirs(directory)
+        self._set_info(version, status="staging", created_at=_now())
+        logger.info(f"Nova versão do índice em preparação: {directory}")
+        return version, directory
+
+    def activate(self, version: str, validation: Optional[Dict[str, Any]] = None) -> Optional[str]:
+        """Troca o ponteiro para `version` e aposenta a versão anterior (retornada)."""
+        pointer = self.pointer() or {}
+        previous = self.active()
+        legacy_retired_at = pointer.get("legacy_retired_at")
+        if previous is None and legacy_retired_at is None and self._legacy_entries():
+            legacy_retired_at = _now()
+
+        self._set_info(version, status="active", activated_at=_now(), validation=validation)
+        _write_json(self.active_path, {
+            "version": version,
+            "activated_at": _now(),
+            "previous": previous,
+            "legacy_retired_at": legacy_retired_at
+        })
+        if previous and previous != version:
+            try:
+                self._set_info(previous, status="retired", retired_at=_now())
+            except OSError as e:
+                # O ponteiro já foi trocado; a retenção trata a versão como um build abandonado
+                logger.error(f"Erro ao aposentar a versão {previous} do índice: {e}")
+        logger.info(f"Versão ativa do índice: {version}" + (f" (anterior: {previous})" if previous else ""))
+        return previous
+
+    def _remove(self, directory: str, before_remove: Optional[RemoveCallback]) -> bool:
+        try:
+            if before_remove:
+                before_remove(directory)
+            shutil.rmtree(directory)
+            return True
+        except Exception as e:
+            # Arquivos ainda abertos (Windows): fica para a próxima retenção
+            logger.error(f"Erro ao remover a versão do índice {directory}: {e}")
+            return False
+
+    def discard(self, version: str, before_remove: Optional[RemoveCallback] = None):
+        """Apaga uma versão que não chegou a ser ativada (build com erro ou reprovado)."""
+        if version == self.active():
+            raise ValueError(f"A versão {version} está ativa e não pode ser descartada")
+        if self._remove(self.directory(version), before_remove):
+            logger.info(f"Versão do índice descartada: {version}")
+
+    def apply_retention(
+        self,
+        keep: int = DEFAULT_KEEP_VERSIONS,
+        grace_seconds: float = DEFAULT_GRACE_SECONDS,
+        before_remove: Optional[RemoveCallback] = None
+    ) -> List[str]:
+        """Apaga versões aposentadas além das `keep` mais recentes e builds abandonados; retorna as removidas."""
+        active = self.active()
+        if active is None:
+            return []
+        removed = []
+        kept = 1
+        for info in self.list_versions():
+            version = info["version"]
+            if version == active:
+                continue
+            status = info.get("status")
+            if status == "retired":
+                if kept < keep or _age_seconds(info.get("retired_at")) < grace_seconds:
+                    kept += 1
+                    continue
+            elif _age_seconds(info.get("created_at")) < STALE_STAGING_SECONDS:
+                # Em preparação (possivelmente por outro processo)
+                continue
+            if self._remove(self.directory(version), before_remove):
+                removed.append(version)
+
+        legacy = self._legacy_entries()
+        legacy_retired_at = (self.pointer() or {}).get("legacy_retired_at")
+        if legacy and kept >= keep and _age_seconds(legacy_retired_at) >= grace_seconds:
+            if before_remove:
+                before_remove(self.root)
+            failed = False
+            for name in legacy:
+                path = os.path.join(self.root, name)
+                try:
+                    if os.path.isdir(path):
+                        shutil.rmtree(path)
+                    else:
+                        os.remove(path)
+                except OSError as e:
+                    logger.error(f"Erro ao remover o índice antigo ({path}): {e}")
+                    failed = True
+            if not failed:
+                removed.append(LEGACY_VERSION)
+
+        if removed:
+            logger.info(f"Retenção do índice: {len(removed)} versão(ões) removida(s): {', '.join(removed)}")
+        return removed
+
+    def rebuild(
+        self,
+        build: Callable[[str], Tuple[Any, Dict[str, Any]]],
+        keep: int = DEFAULT_KEEP_VERSIONS,
+        grace_seconds: float = DEFAULT_GRACE_SECONDS,
+        before_remove: Optional[RemoveCallback] = None,
+        sample_queries: int = DEFAULT_SAMPLE_QUERIES
+    ) -> Dict[str, Any]:
+        """Reconstrói o índice em uma nova versão, valida, ativa e aplica a retenção.
+
+        `build(diretório)` indexa os documentos na versão nova e retorna
+        (PDFProcessor, resultado do sync). Se o build falhar (ou for
+        cancelado) ou a validação reprovar, a versão é descartada e a ativa
+        continua servindo as consultas.
+        """
+        version, directory = self.stage()
+        try:
+            processor, results = build(directory)
+            validation = validate_index(processor, results, sample_queries)
+            if not validation["ok"]:
+                raise ValueError("Validação do novo índice falhou: " + "; ".join(validation["problems"]))
+            previous = self.activate(version, validation)
+        except BaseException:
+            self.discard(version, before_remove)
+            raise
+        removed = self.apply_retention(keep, grace_seconds, before_remove)
+        return {
+            "version": version,
+            "directory": directory,
+            "processor": processor,
+            "previous": previous,
+            "results": results,
+            "validation": validation,
+            "removed": removed
+        }
+
+
+def validate_index(
+    processor,
+    results: Optional[Dict[str, Any]] = None,
+    sample_queries: int = DEFAULT_SAMPLE_QUERIES,
+    k: int = 5
+) -> Dict[str, Any]:
+    """Confere um índice recém-construído antes de ativá-lo.
+
+    - nenhum arquivo com erro no sync (a versão nova ficaria sem ele);
+    - contagem de chunks: o catálogo bate com os chunks gravados mais as
+      duplicatas vinculadas, e nenhum chunk gravado está fora do catálogo;
+    - consultas de amostra: o texto de chunks de fontes diferentes, usado como
+      pergunta, deve trazer a própria fonte entre os `k` primeiros resultados
+      (confere embeddings, gravação e busca de ponta a ponta).
+    """
+    problems = []
+    failed = (results or {}).get("failed") or {}
+    if failed:
+        problems.append(f"{len(failed)} arquivo(s) com erro: {', '.join(sorted(failed))}")
+
+    sources = processor.catalog.list_sources()
+    catalog_ids = {chunk_id for source in sources for chunk_id in processor.catalog.chunk_ids(source["name"])}
+    stored_ids = set(processor.db.get(include=[])["ids"])
+    linked = processor.deduplicator.link_count()
+    if not stored_ids:
+        problems.append("nenhum chunk gravado")
+    outside = stored_ids - catalog_ids
+    if outside:
+        problems.append(f"{len(outside)} chunk(s) gravado(s) fora do catálogo")
+    if len(catalog_ids) != len(stored_ids) + linked:
+        problems.append(
+            f"catálogo com {len(catalog_ids)} chunks, índice com {len(stored_ids)} gravados "
+            f"e {linked} duplicatas vinculadas"
+        )
+
+    # Um chunk gravado de cada fonte, espalhando a amostra pelas fontes
+    sample_ids = []
+    if sources and sample_queries > 0:
+        step = max(1, len(sources) // sample_queries)
+        for source in sources[::step][:sample_queries]:
+            stored = [chunk_id for chunk_id in processor.catalog.chunk_ids(source["name"]) if chunk_id in stored_ids]
+            if stored:
+                sample_ids.append(stored[len(stored) // 2])
+    hits = 0
+    if sample_ids:
+        sample = processor.db.get(ids=sample_ids, include=["documents", "metadatas"])
+        for text, metadata in zip(sample["documents"], sample["metadatas"]):
+            found = processor.db.similarity_search(text, k=k)
+            if any(doc.metadata.get("source") == metadata.get("source") for doc in found):
+                hits += 1
+    hit_rate = hits / len(sample_ids) if sample_ids else 0.0
+    if sample_ids and hit_rate < MIN_SAMPLE_HIT_RATE:
+        problems.append(f"consultas de amostra encontraram a própria fonte em {hit_rate:.0%} dos casos")
+
+    validation = {
+        "ok": not problems,
+        "problems": problems,
+        "sources": len(sources),
+        "chunks": len(stored_ids),
+        "linked_duplicates": linked,
+        "sample_queries": len(sample_ids),
+        "sample_hit_rate": round(hit_rate, 3),
+        "validated_at": _now()
+    }
+    if problems:
+        logger.error(f"Validação do índice reprovada: {'; '.join(problems)}")
+    else:
+        logger.info(
+            f"Validação do índice aprovada: {len(sources)} fontes, {len(stored_ids)} chunks, "
+            f"{hits}/{len(sample_ids)} consultas de amostra"
+        )
+    return validation
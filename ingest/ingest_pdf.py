@@ -1,221 +1,808 @@
 import os
-import fitz  # PyMuPDF
-from typing import List, Dict, Any, Optional
+import sys
+from typing import List, Dict, Any, Optional, Callable, Iterable, Iterator, Tuple
 import re
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_chroma import Chroma
-from langchain_openai import OpenAIEmbeddings
-from langchain_huggingface import HuggingFaceEmbeddings
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
 import logging
 
+# Adiciona o diretório do projeto ao PATH para importações relativas
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ingest.manifest import IndexManifest, SyncPlan, file_hash
+from ingest.catalog import SourceCatalog
+from ingest.chunker import DocumentChunker
+from ingest.dedup import DEFAULT_THRESHOLD, ChunkDeduplicator
+from ingest.embedding_cache import DEFAULT_CACHE_PATH, cached_embeddings
+from ingest.index_versions import resolve_index
+from ingest.pipeline import IngestPipeline, PageCounter, ProgressCallback
+from ingest.sharded_store import ShardedVectorStore, is_sharded_index
+from ingest.numpy_store import NumpyVectorStore, is_numpy_index
+from ingest.tracing import Trace, estimate_tokens, export_trace
+
 # Configurar logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+DEFAULT_HF_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+# Backends de vectorstore: Chroma (padrão) ou matriz NumPy mapeada em memória
+VECTOR_BACKENDS = ("chroma", "numpy")
+
+
+INDEX_VERSION_FILE = "index_version"
+
+
+def read_index_version(persist_directory: str) -> str:
+    """Versão atual do índice (muda a cada gravação ou remoção de chunks)."""
+    try:
+        with open(os.path.join(persist_directory, INDEX_VERSION_FILE), "r") as f:
+            return f.read().strip()
+    except OSError:
+        return ""
+
+
+def bump_index_version(persist_directory: str) -> str:
+    """Marca o índice como alterado, invalidando caches que dependem do seu conteúdo."""
+    version = str(time.time_ns())
+    os.makedirs(persist_directory, exist_ok=True)
+    tmp_path = os.path.join(persist_directory, f"{INDEX_VERSION_FILE}.tmp")
+    with open(tmp_path, "w") as f:
+        f.write(version)
+    os.replace(tmp_path, os.path.join(persist_directory, INDEX_VERSION_FILE))
+    return version
+
+
+def describe_embeddings(embeddings) -> str:
+    """Identificador estável do modelo de embeddings (classe + nome do modelo)."""
+    model_id = getattr(embeddings, "model_id", None)
+    if model_id:
+        return model_id
+    model = getattr(embeddings, "model_name", None) or getattr(embeddings, "model", None)
+    return f"{type(embeddings).__name__}:{model}"
+
+
+def create_embeddings(
+    embedding_model_type: str = "openai",
+    openai_api_key: Optional[str] = None,
+    hf_model_name: str = DEFAULT_HF_MODEL,
+    cache_path: Optional[str] = DEFAULT_CACHE_PATH,
+    embedding_workers: Optional[int] = None,
+    embedding_batch_size: Optional[int] = None,
+    openai_concurrency: Optional[int] = None
+):
+    """Cria o modelo de embeddings (OpenAI ou HuggingFace), com cache persistente por chunk.
+    
+    As bibliotecas de cada provedor (e, no HuggingFace, o torch) só são
+    importadas aqui, quando o modelo é de fato necessário. Na OpenAI,
+    `openai_concurrency` (padrão: INVEST_GURU_OPENAI_CONCURRENCY, ou 4) é o
+    número de requisições simultâneas (ver ingest/openai_embeddings.py). No
+    HuggingFace, `embedding_workers` diferente de 1 (padrão:
+    INVEST_GURU_EMBEDDING_WORKERS, ou 1; 0 escolhe pelo número de núcleos) usa
+    um pool de processos com lote calibrado (ver ingest/embedding_pool.py).
+    """
+    if embedding_model_type.lower() == "openai":
+        if not openai_api_key:
+            raise ValueError("OpenAI API key é necessária para embeddings da OpenAI")
+        from ingest.openai_embeddings import DEFAULT_CONCURRENCY, OpenAIEmbeddingClient
+        if openai_concurrency is None:
+            openai_concurrency = int(os.getenv("INVEST_GURU_OPENAI_CONCURRENCY", str(DEFAULT_CONCURRENCY)))
+        embeddings = OpenAIEmbeddingClient(openai_api_key, concurrency=openai_concurrency)
+        logger.info(f"Usando embeddings da OpenAI ({embeddings.workers} requisições simultâneas)")
+    else:
+        if embedding_workers is None:
+            embedding_workers = int(os.getenv("INVEST_GURU_EMBEDDING_WORKERS", "1"))
+        if embedding_workers != 1:
+            from ingest.embedding_pool import LocalEmbeddingPool
+            embeddings = LocalEmbeddingPool(hf_model_name, embedding_workers, embedding_batch_size)
+            logger.info(f"Usando embeddings do HuggingFace: {hf_model_name} ({embeddings.workers} workers)")
+        else:
+            from langchain_huggingface import HuggingFaceEmbeddings
+            encode_kwargs = {"batch_size": embedding_batch_size} if embedding_batch_size else {}
+            embeddings = HuggingFaceEmbeddings(model_name=hf_model_name, encode_kwargs=encode_kwargs)
+            logger.info(f"Usando embeddings do HuggingFace: {hf_model_name}")
+    return cached_embeddings(embeddings, describe_embeddings(embeddings), cache_path)
+
+
+def detect_backend(persist_directory: str) -> str:
+    """Backend do índice existente no diretório ("chroma" se ainda não houver índice)."""
+    return "numpy" if is_numpy_index(persist_directory) else "chroma"
+
+
+def open_vectorstore(
+    persist_directory: str,
+    embeddings,
+    shard_by_module: Optional[bool] = None,
+    backend: Optional[str] = None,
+    quantization: Optional[str] = None
+):
+    """Abre (ou cria) o vectorstore no diretório indicado.
+    
+    `backend=None` segue o índice existente. No Chroma, com `shard_by_module`
+    (ou, se None, quando o índice já foi criado assim) retorna um
+    ShardedVectorStore com uma coleção por módulo. O backend "numpy" guarda a
+    matriz de embeddings em arquivos mapeados em memória, com `quantization`
+    opcional ("float16" ou "int8") na varredura.
+    """
+    exists = os.path.exists(persist_directory)
+    backend = backend or detect_backend(persist_directory)
+    if backend not in VECTOR_BACKENDS:
+        raise ValueError(f"Backend de vectorstore '{backend}' não suportado (use {', '.join(VECTOR_BACKENDS)})")
+    if shard_by_module is None:
+        shard_by_module = is_sharded_index(persist_directory)
+    
+    if backend == "numpy":
+        if shard_by_module:
+            logger.warning("A divisão por módulo só se aplica ao Chroma; ignorada no backend NumPy")
+        db = NumpyVectorStore(persist_directory, embeddings, quantization=quantization)
+    elif shard_by_module:
+        db = ShardedVectorStore(persist_directory=persist_directory, embedding_function=embeddings)
+    else:
+        from langchain_chroma import Chroma
+        db = Chroma(
+            persist_directory=persist_directory,
+            embedding_function=embeddings
+        )
+    if exists:
+        logger.info(f"Vectorstore ({backend}) carregado de {persist_directory}")
+    else:
+        logger.info(f"Novo vectorstore ({backend}) criado em {persist_directory}")
+    return db
+
+
+def upsert_embeddings(db, ids: List[str], vectors: List[List[float]], documents: List[str], metadatas: List[Dict[str, Any]]):
+    """Grava vetores já calculados no vectorstore (coleção única ou por módulo)."""
+    if hasattr(db, "upsert_embeddings"):
+        db.upsert_embeddings(ids=ids, embeddings=vectors, documents=documents, metadatas=metadatas)
+    else:
+        db._collection.upsert(ids=ids, embeddings=vectors, documents=documents, metadatas=metadatas)
+
+
+def release_vectorstore(persist_directory: str):
+    """Libera o cliente Chroma mantido em cache pelo processo para o diretório.
+    
+    O chromadb reutiliza um único sistema por caminho; depois de apagar ou
+    recriar o diretório, o sistema antigo aponta para um SQLite inexistente.
+    A API pública (`clear_system_cache`) descarta os sistemas de todos os
+    caminhos, e um índice ainda aberto passaria a ter dois sistemas (com
+    cópias separadas do HNSW em memória) se fosse reaberto; por isso só o
+    sistema do diretório é removido do cache interno, o que depende da versão
+    fixada em requirements.txt e falha explicitamente se o cache mudar.
+    """
+    if "chromadb" not in sys.modules:
+        # Nenhum cliente Chroma foi aberto neste processo
+        return
+    import chromadb
+    try:
+        from chromadb.api.shared_system_client import SharedSystemClient
+    except ImportError:
+        from chromadb.api.client import SharedSystemClient
+    
+    if not all(
+        isinstance(getattr(SharedSystemClient, name, None), dict)
+        for name in ("_identifier_to_system", "_identifier_to_refcount")
+    ):
+        raise RuntimeError(
+            f"chromadb {chromadb.__version__} não expõe o cache de sistemas esperado; "
+            "use a versão fixada em requirements.txt"
+        )
+    
+    target = os.path.abspath(persist_directory)
+    for identifier in list(SharedSystemClient._identifier_to_system):
+        if identifier and os.path.abspath(identifier) == target:
+            system = SharedSystemClient._identifier_to_system.pop(identifier)
+            SharedSystemClient._identifier_to_refcount.pop(identifier, None)
+            try:
+                system.stop()
+            except Exception as e:
+                logger.warning(f"Erro ao encerrar o cliente Chroma de {persist_directory}: {e}")
+
+
+def module_from_filename(filename: str) -> str:
+    """Determina o módulo ("Módulo N") a partir do nome do arquivo."""
+    # Procura por um número após a palavra "Módulo" ou "MÓDULO"
+    module_match = re.search(r'[Mm][Óó][Dd][Uu][Ll][Oo]\s*(\d+)', filename)
+    module_number = module_match.group(1) if module_match else "Desconhecido"
+    return f"Módulo {module_number}"
+
+
+def iter_page_range(pdf_path: str, start: int = 0, end: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+    """Gera, página a página, o texto das páginas [start, end) de um PDF com metadados."""
+    import fitz  # PyMuPDF
+    
+    filename = os.path.basename(pdf_path)
+    module = module_from_filename(filename)
+    
+    document = fitz.open(pdf_path)
+    
+    try:
+        end = document.page_count if end is None else min(end, document.page_count)
+        for page_num in range(start, end):
+            text = document[page_num].get_text()
+            if text.strip():  # Se a página tem texto
+                yield {
+                    "content": text,
+                    "metadata": {
+                        "source": filename,
+                        "page": page_num + 1,
+                        "module": module
+                    }
+                }
+    finally:
+        document.close()
+
+
+def extract_page_range(pdf_path: str, start: int = 0, end: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Extrai o texto das páginas [start, end) de um PDF com metadados de página e módulo.
+    
+    Função de módulo (e não método) para poder ser executada em processos filhos.
+    """
+    return list(iter_page_range(pdf_path, start, end))
+
+
+def _page_count(pdf_path: str) -> int:
+    import fitz  # PyMuPDF
+    with fitz.open(pdf_path) as document:
+        return document.page_count
+
+
+def iter_extracted_pdfs(
+    pdf_paths: List[str],
+    workers: int = 1,
+    pages_per_task: int = 32,
+    on_error: Optional[Callable[[str, Exception], None]] = None
+) -> Iterator[Tuple[str, List[Dict[str, Any]]]]:
+    """Extrai vários PDFs, em paralelo se `workers` > 1, retornando (caminho, páginas) na ordem de entrada.
+    
+    O trabalho é dividido por arquivo e, em PDFs grandes, por faixas de
+    `pages_per_task` páginas; o resultado é remontado em ordem determinística.
+    Com `on_error`, um PDF que falha é informado a ele e pulado em vez de
+    interromper a extração dos demais.
+    """
+    def failed(pdf_path: str, error: Exception):
+        if on_error is None:
+            raise error
+        on_error(pdf_path, error)
+    
+    if workers <= 1:
+        for pdf_path in pdf_paths:
+            try:
+                pages_text = extract_page_range(pdf_path)
+            except Exception as e:
+                failed(pdf_path, e)
+                continue
+            yield pdf_path, pages_text
+        return
+    
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # Enfileirar todas as faixas de páginas de todos os arquivos
+        futures_by_pdf = []
+        for pdf_path in pdf_paths:
+            try:
+                page_count = _page_count(pdf_path)
+            except Exception as e:
+                failed(pdf_path, e)
+                continue
+            futures = [
+                executor.submit(extract_page_range, pdf_path, start, start + pages_per_task)
+                for start in range(0, page_count, pages_per_task)
+            ]
+            futures_by_pdf.append((pdf_path, futures))
+        
+        # Entregar arquivo a arquivo, enquanto os demais continuam sendo extraídos
+        for pdf_path, futures in futures_by_pdf:
+            pages_text = []
+            try:
+                for future in futures:
+                    pages_text.extend(future.result())
+            except Exception as e:
+                failed(pdf_path, e)
+                continue
+            yield pdf_path, pages_text
+
+
 class PDFProcessor:
     def __init__(
         self, 
         embedding_model_type: str = "openai",
         openai_api_key: Optional[str] = None,
-        hf_model_name: str = "sentence-transformers/all-MiniLM-L6-v2",
+        hf_model_name: str = DEFAULT_HF_MODEL,
         persist_directory: str = "data/index",
         chunk_size: int = 1000,
-        chunk_overlap: int = 200
+        chunk_overlap: int = 200,
+        embeddings=None,
+        db=None,
+        extraction_workers: int = 1,
+        pages_per_task: int = 32,
+        batch_size: int = 64,
+        queue_size: int = 4,
+        shard_by_module: Optional[bool] = None,
+        vector_backend: Optional[str] = None,
+        quantization: Optional[str] = None,
+        dedup_threshold: Optional[float] = DEFAULT_THRESHOLD,
+        dedup_scope: str = "module",
+        embedding_workers: Optional[int] = None,
+        embedding_batch_size: Optional[int] = None,
+        openai_concurrency: Optional[int] = None
     ):
-        self.persist_directory = persist_directory
+        # Com versões (reconstrução sem interrupção), grava na versão ativa
+        self.persist_directory = resolve_index(persist_directory)
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
+        self.extraction_workers = max(1, extraction_workers)
+        self.pages_per_task = pages_per_task
+        self.batch_size = batch_size
+        self.queue_size = queue_size
         
-        # Configurar embeddings
-        if embedding_model_type.lower() == "openai":
-            if not openai_api_key:
-                raise ValueError("OpenAI API key é necessária para embeddings da OpenAI")
-            self.embeddings = OpenAIEmbeddings(api_key=openai_api_key)
-            logger.info("Usando embeddings da OpenAI")
-        else:
-            self.embeddings = HuggingFaceEmbeddings(model_name=hf_model_name)
-            logger.info(f"Usando embeddings do HuggingFace: {hf_model_name}")
+        # Configurar embeddings (reaproveita um modelo já carregado, se fornecido)
+        if embeddings is None:
+            embeddings = create_embeddings(
+                embedding_model_type,
+                openai_api_key,
+                hf_model_name,
+                embedding_workers=embedding_workers,
+                embedding_batch_size=embedding_batch_size,
+                openai_concurrency=openai_concurrency
+            )
+        self.embeddings = embeddings
         
         # Inicializar text splitter
+        from langchain_text_splitters import RecursiveCharacterTextSplitter
         self.text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=self.chunk_size,
             chunk_overlap=self.chunk_overlap,
             length_function=len,
         )
         
+        # Divide cada documento inteiro (e não página a página), mapeando os chunks de volta às páginas
+        self.chunker = DocumentChunker(self.text_splitter, self.chunk_size)
+        
         # Inicializar ou carregar o vectorstore
-        if os.path.exists(self.persist_directory):
-            self.db = Chroma(
-                persist_directory=self.persist_directory, 
-                embedding_function=self.embeddings
-            )
-            logger.info(f"Vectorstore carregado de {self.persist_directory}")
-        else:
-            self.db = Chroma(
-                persist_directory=self.persist_directory, 
-                embedding_function=self.embeddings
-            )
-            logger.info(f"Novo vectorstore criado em {self.persist_directory}")
+        if db is None:
+            db = open_vectorstore(self.persist_directory, self.embeddings, shard_by_module, vector_backend, quantization)
+        self.db = db
+        
+        # Manifesto das fontes indexadas (hash + parâmetros), usado na reindexação incremental
+        self.manifest = IndexManifest(self.persist_directory)
+        
+        # Catálogo das fontes (páginas, chunks, ids), para listar sem varrer o vectorstore
+        self.catalog = SourceCatalog(self.persist_directory)
+        
+        # Assinaturas dos chunks gravados, para não embeddar nem gravar duplicatas
+        # (`dedup_threshold=None` desativa a detecção; vínculos existentes continuam mantidos)
+        self.dedup_enabled = dedup_threshold is not None
+        self.deduplicator = ChunkDeduplicator(self.persist_directory, dedup_threshold or DEFAULT_THRESHOLD, dedup_scope)
+        
+        # Spans da última ingestão (extração, chunking, embeddings, gravação)
+        self.last_trace: Optional[Trace] = None
+    
+    def index_params(self) -> Dict[str, Any]:
+        """Parâmetros que, se alterados, exigem reprocessar uma fonte."""
+        return {
+            "chunk_size": self.chunk_size,
+            "chunk_overlap": self.chunk_overlap,
+            "chunking": "document",
+            "embedding_model": describe_embeddings(self.embeddings),
+            "sharded": self.is_sharded,
+            "backend": self.backend,
+            "dedup": f"{self.deduplicator.scope}:{self.deduplicator.threshold}" if self.dedup_enabled else None
+        }
+    
+    @property
+    def is_sharded(self) -> bool:
+        """Indica se o índice usa uma coleção por módulo."""
+        return isinstance(self.db, ShardedVectorStore)
+    
+    @property
+    def backend(self) -> str:
+        """Backend do vectorstore em uso ("chroma" ou "numpy")."""
+        return "numpy" if isinstance(self.db, NumpyVectorStore) else "chroma"
     
     def extract_text_from_pdf(self, pdf_path: str) -> List[Dict[str, Any]]:
         """Extrai texto de um PDF com metadados de página e módulo."""
         logger.info(f"Extraindo texto de: {pdf_path}")
         
-        # Determinar número do módulo a partir do nome do arquivo
-        filename = os.path.basename(pdf_path)
-        # Procura por um número após a palavra "Módulo" ou "MÓDULO"
-        module_match = re.search(r'[Mm][Óó][Dd][Uu][Ll][Oo]\s*(\d+)', filename)
-        module_number = module_match.group(1) if module_match else "Desconhecido"
-        
-        document = fitz.open(pdf_path)
-        pages_text = []
-        
-        for page_num, page in enumerate(document):
-            text = page.get_text()
-            if text.strip():  # Se a página tem texto
-                pages_text.append({
-                    "content": text,
-                    "metadata": {
-                        "source": filename,
-                        "page": page_num + 1,
-                        "module": f"Módulo {module_number}"
-                    }
-                })
+        if self.extraction_workers > 1 and _page_count(pdf_path) > self.pages_per_task:
+            # PDF grande: dividir as faixas de páginas entre processos
+            _, pages_text = next(iter_extracted_pdfs([pdf_path], self.extraction_workers, self.pages_per_task))
+        else:
+            pages_text = extract_page_range(pdf_path)
         
-        document.close()
-        logger.info(f"Extraídas {len(pages_text)} páginas com texto de {filename}")
+        logger.info(f"Extraídas {len(pages_text)} páginas com texto de {os.path.basename(pdf_path)}")
         return pages_text
     
+    def iter_chunks(self, pages_text: Iterable[Dict[str, Any]], trace: Optional[Trace] = None) -> Iterator[Dict[str, Any]]:
+        """Gera os chunks de cada documento, com metadados de página, à medida que as páginas chegam."""
+        return self.chunker.iter_chunks(pages_text, trace)
+    
     def chunk_texts(self, pages_text: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """Divide o texto em chunks com metadados preservados."""
-        all_chunks = []
-        
-        for page in pages_text:
-            content = page["content"]
-            metadata = page["metadata"]
-            
-            chunks = self.text_splitter.create_documents(
-                texts=[content],
-                metadatas=[metadata]
-            )
-            
-            all_chunks.extend([{
-                "content": chunk.page_content,
-                "metadata": chunk.metadata
-            } for chunk in chunks])
-        
+        all_chunks = list(self.iter_chunks(pages_text))
         logger.info(f"Texto dividido em {len(all_chunks)} chunks")
         return all_chunks
     
-    def add_to_vectorstore(self, chunks: List[Dict[str, Any]]) -> int:
-        """Adiciona chunks ao vectorstore."""
-        texts = [chunk["content"] for chunk in chunks]
+    def dedup_chunks(self, chunks: Iterable[Dict[str, Any]], trace: Optional[Trace] = None) -> Iterable[Dict[str, Any]]:
+        """Descarta chunks duplicados de outros já indexados, registrando suas páginas no catálogo."""
+        if not self.dedup_enabled:
+            return chunks
+        return self.deduplicator.filter(
+            chunks,
+            on_duplicates=lambda duplicates: self.catalog.add_chunks(
+                [chunk["id"] for chunk in duplicates], [chunk["metadata"] for chunk in duplicates]
+            ),
+            trace=trace,
+            batch_size=self.batch_size
+        )
+    
+    def embed_texts(self, texts: List[str]) -> List[List[float]]:
+        """Calcula os embeddings de um lote de textos."""
+        return self.embeddings.embed_documents(texts)
+    
+    def _write_batch(self, chunks: List[Dict[str, Any]], vectors: List[List[float]]) -> List[str]:
+        """Grava um lote de chunks com embeddings já calculados."""
+        ids = [chunk.get("id") or str(uuid.uuid4()) for chunk in chunks]
         metadatas = [chunk["metadata"] for chunk in chunks]
-        
-        ids = self.db.add_texts(
-            texts=texts,
-            metadatas=metadatas
+        upsert_embeddings(
+            self.db,
+            ids,
+            vectors,
+            [chunk["content"] for chunk in chunks],
+            metadatas
+        )
+        self.catalog.add_chunks(ids, metadatas)
+        if self.dedup_enabled:
+            self.deduplicator.commit(ids)
+        return ids
+    
+    def _pipeline(
+        self,
+        progress_callback: Optional[ProgressCallback] = None,
+        trace: Optional[Trace] = None
+    ) -> IngestPipeline:
+        embed_fn, write_fn = self.embed_texts, self._write_batch
+        if trace is not None:
+            embed_fn = trace.wrap(
+                embed_fn,
+                "embedding",
+                lambda texts: {"items": len(texts), "tokens": sum(estimate_tokens(text) for text in texts)}
+            )
+            write_fn = trace.wrap(write_fn, "write", lambda chunks, vectors: {"items": len(chunks)})
+        return IngestPipeline(
+            embed_fn=embed_fn,
+            write_fn=write_fn,
+            batch_size=self.batch_size,
+            queue_size=self.queue_size,
+            progress_callback=progress_callback,
+            # Com um pool de processos ou requisições simultâneas, um lote por worker em andamento
+            embed_concurrency=getattr(self.embeddings, "workers", 1)
         )
+    
+    def add_to_vectorstore(
+        self,
+        chunks: Iterable[Dict[str, Any]],
+        progress_callback: Optional[ProgressCallback] = None
+    ) -> int:
+        """Adiciona chunks ao vectorstore, em lotes de `batch_size`."""
+        trace = Trace("ingest")
+        try:
+            num_added = self._pipeline(progress_callback, trace).run(self.dedup_chunks(chunks, trace))
+            trace.finish(chunks=num_added)
+        finally:
+            self.deduplicator.discard_pending()
+            bump_index_version(self.persist_directory)
+            self.last_trace = trace
+            export_trace(trace)
+        logger.info(f"Adicionados {num_added} chunks ao vectorstore")
+        return num_added
+    
+    def ingest_pages(
+        self,
+        pages_text: Iterable[Dict[str, Any]],
+        pages_total: int = 0,
+        progress_callback: Optional[ProgressCallback] = None,
+        trace: Optional[Trace] = None
+    ) -> int:
+        """Executa o fluxo páginas -> chunks -> embeddings -> vectorstore sem materializar o documento.
         
-        logger.info(f"Adicionados {len(ids)} chunks ao vectorstore")
-        return len(ids)
+        Os tempos de cada estágio são acumulados em `trace` (criado e exportado
+        aqui quando não informado). Como os estágios rodam em paralelo, a soma
+        dos spans pode passar da duração total.
+        """
+        owns_trace = trace is None
+        trace = trace or Trace("ingest")
+        pages = PageCounter(trace.timed(pages_text, "extraction"))
+        try:
+            num_added = self._pipeline(progress_callback, trace).run(
+                self.dedup_chunks(self.iter_chunks(pages, trace), trace),
+                pages_total=pages_total,
+                pages_done=lambda: pages.count
+            )
+            trace.finish(pages=pages.count, chunks=num_added)
+        finally:
+            self.deduplicator.discard_pending()
+            bump_index_version(self.persist_directory)
+            self.last_trace = trace
+            if owns_trace:
+                export_trace(trace)
+        duplicates = trace.spans.get("dedup", {}).get("attributes", {}).get("duplicates", 0)
+        logger.info(
+            f"Adicionados {num_added} chunks ao vectorstore ({pages.count} páginas com texto, "
+            f"{duplicates} duplicatas vinculadas)"
+        )
+        return num_added
     
-    def process_pdf(self, pdf_path: str) -> int:
+    def process_pdf(
+        self,
+        pdf_path: str,
+        content_hash: Optional[str] = None,
+        pages_text: Optional[List[Dict[str, Any]]] = None,
+        progress_callback: Optional[ProgressCallback] = None
+    ) -> int:
         """Processa um PDF do início ao fim, retorna número de chunks adicionados."""
-        pages_text = self.extract_text_from_pdf(pdf_path)
-        chunks = self.chunk_texts(pages_text)
-        num_added = self.add_to_vectorstore(chunks)
+        trace = Trace("ingest", source=os.path.basename(pdf_path))
+        if pages_text is None:
+            pages_total = _page_count(pdf_path)
+            if self.extraction_workers > 1 and pages_total > self.pages_per_task:
+                with trace.span("extraction", parallel=True):
+                    pages_text = self.extract_text_from_pdf(pdf_path)
+            else:
+                # Fluxo contínuo: as páginas são lidas à medida que o pipeline avança
+                logger.info(f"Extraindo texto de: {pdf_path}")
+                pages_text = iter_page_range(pdf_path)
+        else:
+            pages_total = len(pages_text)
+        
+        try:
+            num_added = self.ingest_pages(pages_text, pages_total, progress_callback, trace)
+        finally:
+            export_trace(trace)
+        
+        # Registrar no manifesto para que a reindexação incremental o reconheça
+        content_hash = content_hash or file_hash(pdf_path)
+        self.manifest.record(
+            os.path.basename(pdf_path),
+            content_hash,
+            self.index_params(),
+            num_added
+        )
+        self.catalog.set_hash(os.path.basename(pdf_path), content_hash)
         return num_added
     
     def process_directory(self, directory_path: str) -> Dict[str, int]:
         """Processa todos os PDFs em um diretório."""
         results = {}
         
-        for filename in os.listdir(directory_path):
-            if filename.lower().endswith('.pdf'):
-                pdf_path = os.path.join(directory_path, filename)
-                logger.info(f"Processando {filename}...")
-                num_chunks = self.process_pdf(pdf_path)
-                results[filename] = num_chunks
+        pdf_paths = [
+            os.path.join(directory_path, filename)
+            for filename in sorted(os.listdir(directory_path))
+            if filename.lower().endswith('.pdf')
+        ]
+        
+        # Extração (possivelmente paralela) nos workers; chunking e embeddings no processo atual
+        for pdf_path, pages_text in self._iter_extracted(pdf_paths):
+            filename = os.path.basename(pdf_path)
+            logger.info(f"Processando {filename}...")
+            num_chunks = self.process_pdf(pdf_path, pages_text=pages_text)
+            results[filename] = num_chunks
         
         return results
     
-    def delete_by_source(self, source_name: str) -> int:
-        """Remove documentos do vectorstore baseado no nome do arquivo."""
+    def _iter_extracted(
+        self,
+        pdf_paths: List[str],
+        on_error: Optional[Callable[[str, Exception], None]] = None
+    ) -> Iterator[Tuple[str, List[Dict[str, Any]]]]:
+        logger.info(f"Extraindo {len(pdf_paths)} PDFs com {self.extraction_workers} processo(s)")
+        return iter_extracted_pdfs(pdf_paths, self.extraction_workers, self.pages_per_task, on_error)
+    
+    def sync_directory(
+        self,
+        directory_path: str,
+        progress_callback: Optional[ProgressCallback] = None
+    ) -> Dict[str, Any]:
+        """Reindexa incrementalmente um diretório com base no manifesto.
+        
+        Apenas PDFs novos, alterados (conteúdo ou parâmetros) ou removidos são
+        processados; os demais são ignorados e listados em "skipped".
+        """
+        pdf_paths = {
+            filename: os.path.join(directory_path, filename)
+            for filename in sorted(os.listdir(directory_path))
+            if filename.lower().endswith('.pdf')
+        }
+        return self.sync_paths(pdf_paths, progress_callback=progress_callback)
+    
+    def sync_paths(
+        self,
+        pdf_paths: Dict[str, str],
+        prune: bool = True,
+        force: bool = False,
+        continue_on_error: bool = False,
+        on_file: Optional[Callable[[str, str, Any], None]] = None,
+        progress_callback: Optional[ProgressCallback] = None,
+        plan: Optional[SyncPlan] = None
+    ) -> Dict[str, Any]:
+        """Reindexa incrementalmente os PDFs informados (nome da fonte -> caminho).
+        
+        Cada arquivo é registrado no manifesto assim que termina, que funciona
+        como checkpoint: uma execução interrompida, repetida, pula o que já foi
+        indexado. `prune` remove do índice as fontes que não estão em
+        `pdf_paths`; `force` reprocessa também as inalteradas. Com
+        `continue_on_error`, falhas em um arquivo vão para "failed" e os demais
+        seguem. `on_file(fonte, situação, resultado)` é chamado a cada arquivo.
+        Um `plan` já calculado para os mesmos arquivos evita calcular os hashes de novo.
+        """
+        plan = plan or self.manifest.plan(pdf_paths, self.index_params())
+        if force:
+            plan.changed.update({source: pdf_paths[source] for source in plan.unchanged})
+            plan.unchanged = []
+        
+        results = {
+            "added": {},
+            "changed": {},
+            "removed": {},
+            "skipped": list(plan.unchanged),
+            "failed": {}
+        }
+        
+        def report(source: str, status: str, result: Any):
+            if on_file:
+                on_file(source, status, result)
+        
+        for source in plan.unchanged:
+            report(source, "skipped", None)
+        
+        if prune:
+            for source in plan.removed:
+                results["removed"][source] = self.delete_by_source(source)
+                self.manifest.remove(source)
+                report(source, "removed", results["removed"][source])
+        
+        to_process = {path: ("changed", source) for source, path in plan.changed.items()}
+        to_process.update({path: ("added", source) for source, path in plan.added.items()})
+        
+        def on_error(pdf_path: str, error: Exception):
+            _, source = to_process[pdf_path]
+            logger.error(f"Erro ao extrair {source}: {error}")
+            results["failed"][source] = str(error)
+            report(source, "failed", str(error))
+        
+        extracted = self._iter_extracted(list(to_process), on_error if continue_on_error else None)
+        
+        for pdf_path, pages_text in extracted:
+            kind, source = to_process[pdf_path]
+            try:
+                # Também para novos: remove restos de um índice criado sem manifesto
+                self.delete_by_source(source)
+                logger.info(f"Processando {source}...")
+                results[kind][source] = self.process_pdf(
+                    pdf_path, plan.hashes[source], pages_text, progress_callback
+                )
+            except Exception as e:
+                if not continue_on_error:
+                    raise
+                logger.error(f"Erro ao processar {source}: {e}")
+                results["failed"][source] = str(e)
+                report(source, "failed", str(e))
+                continue
+            report(source, kind, results[kind][source])
+        
+        logger.info(
+            f"Reindexação incremental: {len(results['added'])} novos, "
+            f"{len(results['changed'])} alterados, {len(results['removed'])} removidos, "
+            f"{len(results['skipped'])} sem alterações, {len(results['failed'])} com erro"
+        )
+        return results
+    
+    def _promote_duplicates(self, source_name: str) -> int:
+        """Antes de remover uma fonte, regrava seus chunks que outras fontes usam como canônicos.
+        
+        O chunk passa a pertencer à primeira fonte vinculada (com o id, a página
+        e o módulo dela); as demais duplicatas passam a apontar para ele.
+        """
+        orphaned = self.deduplicator.orphaned_links(source_name)
+        if not orphaned:
+            return 0
+        records = self.db.get(ids=list(orphaned), include=["embeddings", "documents"])
+        links = [orphaned[chunk_id][0] for chunk_id in records["ids"]]
+        upsert_embeddings(
+            self.db,
+            [link["id"] for link in links],
+            [list(vector) for vector in records["embeddings"]],
+            records["documents"],
+            [link["metadata"] for link in links]
+        )
+        for chunk_id, link in zip(records["ids"], links):
+            self.deduplicator.promote(chunk_id, link)
+        logger.info(f"{len(links)} chunks de {source_name} transferidos para fontes com duplicatas")
+        return len(links)
+    
+    def _delete_where(self, where: Dict[str, Any], page_size: int) -> int:
+        """Remove do vectorstore, em páginas de até `page_size` ids, os registros que casam com o filtro."""
+        deleted = 0
+        while True:
+            # Só os ids: documentos e embeddings não são carregados
+            ids = self.db.get(where=where, limit=page_size, include=[])["ids"]
+            if not ids:
+                return deleted
+            self.db.delete(ids=ids)
+            deleted += len(ids)
+    
+    def delete_sources(
+        self,
+        source_names: Optional[List[str]] = None,
+        module: Optional[str] = None,
+        page_size: int = 500
+    ) -> Dict[str, int]:
+        """Remove várias fontes (ou todas as de um módulo) do vectorstore.
+        
+        Retorna o número de chunks removidos por fonte; fontes sem chunks no
+        índice aparecem com 0. Um erro interrompe a remoção e é propagado com
+        o nome da fonte em que ocorreu (as anteriores ficam removidas).
+        """
+        names = list(dict.fromkeys(source_names or []))
+        if module:
+            self._ensure_catalog()
+            names += [name for name in self.catalog.sources_in_module(module) if name not in names]
+        
+        counts = {}
+        failed = False
+        source_name = None
         try:
-            # Consultar os IDs dos documentos com o filtro do nome do arquivo
-            docs_to_delete = self.db.get(
-                where={"source": source_name}
-            )
-            
-            if docs_to_delete and hasattr(docs_to_delete, 'ids') and docs_to_delete.ids:
-                # Remover documentos pelo ID
-                self.db.delete(ids=docs_to_delete.ids)
+            for source_name in names:
+                self._promote_duplicates(source_name)
+                counts[source_name] = self._delete_where({"source": source_name}, page_size)
+                self.manifest.remove(source_name)
+                self.catalog.remove_source(source_name)
+                self.deduplicator.remove_source(source_name)
                 
-                logger.info(f"Removidos {len(docs_to_delete.ids)} documentos de {source_name}")
-                return len(docs_to_delete.ids)
-            else:
-                logger.warning(f"Nenhum documento encontrado para {source_name}")
-                return 0
+                if counts[source_name]:
+                    logger.info(f"Removidos {counts[source_name]} documentos de {source_name}")
+                else:
+                    logger.warning(f"Nenhum documento encontrado para {source_name}")
         except Exception as e:
-            logger.error(f"Erro ao remover documentos: {e}")
-            return 0
+            failed = True
+            logger.error(f"Erro ao remover documentos de {source_name}: {e}")
+            raise RuntimeError(f"Erro ao remover {source_name}: {e}") from e
+        finally:
+            # Mesmo após um erro parte dos chunks pode ter sido removida
+            if failed or any(counts.values()):
+                bump_index_version(self.persist_directory)
+        
+        return counts
+    
+    def delete_by_source(self, source_name: str) -> int:
+        """Remove documentos do vectorstore baseado no nome do arquivo."""
+        return self.delete_sources([source_name]).get(source_name, 0)
+    
+    def list_modules(self) -> List[str]:
+        """Lista os módulos presentes no índice."""
+        if self.is_sharded:
+            return self.db.list_modules()
+        self._ensure_catalog()
+        return self.catalog.list_modules()
+    
+    def _ensure_catalog(self):
+        """Preenche o catálogo a partir do vectorstore em índices criados antes dele (uma única vez)."""
+        if not self.catalog.is_empty() or not self.db.get(limit=1, include=[])["ids"]:
+            return
+        logger.info("Catálogo de fontes vazio; reconstruindo a partir do vectorstore")
+        result = self.db.get(include=["metadatas"])
+        hashes = {name: entry["hash"] for name, entry in self.manifest.load().items()}
+        self.catalog.rebuild(result["ids"], result["metadatas"], hashes)
     
     def get_loaded_sources(self) -> List[Dict[str, Any]]:
         """Retorna uma lista com informações sobre os arquivos carregados."""
         try:
-            all_metadatas = self.db.get()["metadatas"]
-            sources = {}
-            
-            for metadata in all_metadatas:
-                if "source" in metadata and "module" in metadata:
-                    source_name = metadata["source"]
-                    
-                    if source_name not in sources:
-                        sources[source_name] = {
-                            "name": source_name,
-                            "module": metadata["module"],
-                            "pages": set([metadata.get("page", "N/A")]),
-                            "chunk_count": 1
-                        }
-                    else:
-                        sources[source_name]["pages"].add(metadata.get("page", "N/A"))
-                        sources[source_name]["chunk_count"] += 1
-            
-            # Converter para lista e formatar para exibição
-            result = []
-            for source_name, info in sources.items():
-                result.append({
-                    "name": info["name"],
-                    "module": info["module"],
-                    "pages": len(info["pages"]),
-                    "chunk_count": info["chunk_count"]
-                })
-            
-            return result
+            self._ensure_catalog()
+            return self.catalog.list_sources()
         
         except Exception as e:
             logger.error(f"Erro ao obter fontes carregadas: {e}")
             return []
 
 if __name__ == "__main__":
-    # Exemplo de uso
-    from dotenv import load_dotenv
-    load_dotenv()
-    
-    openai_api_key = os.getenv("OPENAI_API_KEY")
-    
-    # Você pode usar embeddings da OpenAI ou do HuggingFace
-    # Para OpenAI:
-    # processor = PDFProcessor(embedding_model_type="openai", openai_api_key=openai_api_key)
-    
-    # Para HuggingFace:
-    processor = PDFProcessor(embedding_model_type="huggingface")
-    
-    # Processar todos os PDFs no diretório
-    results = processor.process_directory("data/pdfs")
-    print(f"Resultados: {results}")
-    
-    # Listar fontes carregadas
-    sources = processor.get_loaded_sources()
-    print(f"Fontes carregadas: {sources}") 
\ No newline at end of file
+    # Mantido por compatibilidade: `python ingest/ingest_pdf.py` equivale ao CLI com os padrões (data/pdfs, HuggingFace)
+    from ingest.cli import main
+    sys.exit(main())
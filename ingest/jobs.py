@@ -0,0 +1,185 @@
+import time
+import uuid
+import queue
+import threading
+import logging
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Situações de um job
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+FINISHED = (DONE, FAILED, CANCELLED)
+
+
+class JobCancelled(Exception):
+    """Levantada dentro de um job quando o cancelamento foi pedido."""
+
+
+class IngestJob:
+    """Um trabalho de escrita no índice (upload, reindexação, remoção).
+
+    A função do job recebe o próprio job e deve repassar
+    `job.progress_callback` ao processador: além de atualizar o progresso,
+    ele interrompe o processamento com `JobCancelled` quando o job é
+    cancelado (o lote em andamento termina de ser gravado antes).
+    """
+
+    def __init__(self, kind: str, description: str, fn: Callable[["IngestJob"], Any]):
+        self.id = uuid.uuid4().hex[:8]
+        self.kind = kind
+        self.description = description
+        self.fn = fn
+        self.status = QUEUED
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.pages_done = 0
+        self.pages_total = 0
+        self.chunks_written = 0
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._cancel = threading.Event()
+        self._finished = threading.Event()
+
+    @property
+    def cancel_requested(self) -> bool:
+        return self._cancel.is_set()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED
+
+    def check_cancelled(self):
+        if self._cancel.is_set():
+            raise JobCancelled(f"Job {self.id} cancelado")
+
+    def progress_callback(self, pages_done: int, pages_total: int, chunks_written: int):
+        """Callback de progresso do PDFProcessor (páginas lidas, total, chunks gravados)."""
+        self.pages_done = pages_done
+        self.pages_total = pages_total
+        self.chunks_written = chunks_written
+        self.check_cancelled()
+
+    @property
+    def fraction(self) -> float:
+        if self.status == DONE:
+            return 1.0
+        return min(self.pages_done / self.pages_total, 1.0) if self.pages_total else 0.0
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Espera o job terminar; retorna False se o tempo acabar antes."""
+        return self._finished.wait(timeout)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "description": self.description,
+            "status": self.status,
+            "pages_done": self.pages_done,
+            "pages_total": self.pages_total,
+            "chunks_written": self.chunks_written,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at
+        }
+
+
+class JobQueue:
+    """Fila local de jobs de ingestão com um único escritor.
+
+    Os jobs rodam um de cada vez, em ordem de chegada, em uma thread própria;
+    como todas as escritas no índice passam por ela, uploads e reindexações de
+    sessões diferentes nunca gravam no mesmo diretório ao mesmo tempo. O
+    histórico guarda os `max_history` jobs mais recentes.
+    """
+
+    def __init__(self, max_history: int = 50):
+        self.max_history = max_history
+        self._queue: "queue.Queue[IngestJob]" = queue.Queue()
+        self._jobs: "OrderedDict[str, IngestJob]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._worker: Optional[threading.Thread] = None
+
+    def submit(self, kind: str, description: str, fn: Callable[[IngestJob], Any]) -> IngestJob:
+        """Enfileira um job e retorna imediatamente."""
+        job = IngestJob(kind, description, fn)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._trim()
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="ingest-writer", daemon=True)
+                self._worker.start()
+        self._queue.put(job)
+        logger.info(f"Job {job.id} enfileirado: {description}")
+        return job
+
+    def get(self, job_id: str) -> Optional[IngestJob]:
+        return self._jobs.get(job_id)
+
+    def list(self) -> List[IngestJob]:
+        """Jobs do mais recente para o mais antigo."""
+        with self._lock:
+            return list(reversed(self._jobs.values()))
+
+    def active(self) -> List[IngestJob]:
+        return [job for job in self.list() if not job.finished]
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancela um job na fila (imediato) ou em execução (no próximo lote gravado)."""
+        job = self._jobs.get(job_id)
+        if job is None or job.finished:
+            return False
+        job._cancel.set()
+        with self._lock:
+            if job.status == QUEUED:
+                self._finish(job, CANCELLED)
+        logger.info(f"Cancelamento do job {job_id} solicitado")
+        return True
+
+    def _trim(self):
+        # Descarta os jobs terminados mais antigos acima do limite do histórico
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        while len(self._jobs) > self.max_history and finished:
+            del self._jobs[finished.pop(0)]
+
+    def _finish(self, job: IngestJob, status: str):
+        job.status = status
+        job.finished_at = time.time()
+        job._finished.set()
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            with self._lock:
+                if job.status != QUEUED:
+                    continue
+                job.status = RUNNING
+                job.started_at = time.time()
+
+            try:
+                job.check_cancelled()
+                job.result = job.fn(job)
+                status = DONE
+            except JobCancelled:
+                status = CANCELLED
+            except Exception as e:
+                logger.error(f"Erro no job {job.id} ({job.description}): {e}")
+                job.error = str(e)
+                status = FAILED
+
+            with self._lock:
+                self._finish(job, status)
+                self._trim()
+            logger.info(f"Job {job.id} terminado: {status}")
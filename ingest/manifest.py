@@ -0,0 +1,108 @@
+import os
+import json
+import hashlib
+import threading
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+_manifest_lock = threading.Lock()
+
+
+def file_hash(path: str, block_size: int = 1 << 20) -> str:
+    """Calcula o SHA-256 do conteúdo de um arquivo, lendo em blocos."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class SyncPlan:
+    """Diferença entre os PDFs de um diretório e o que está no índice."""
+
+    def __init__(self):
+        self.added: Dict[str, str] = {}
+        self.changed: Dict[str, str] = {}
+        self.removed: List[str] = []
+        self.unchanged: List[str] = []
+        self.hashes: Dict[str, str] = {}
+
+    def is_empty(self) -> bool:
+        return not (self.added or self.changed or self.removed)
+
+
+class IndexManifest:
+    """Manifesto persistente (JSON) das fontes indexadas em um diretório de índice.
+
+    Para cada fonte guarda o hash do arquivo, os parâmetros de chunking e o
+    modelo de embeddings usados, permitindo reindexar apenas o que mudou.
+    """
+
+    FILENAME = "manifest.json"
+
+    def __init__(self, persist_directory: str):
+        self.path = os.path.join(persist_directory, self.FILENAME)
+
+    def load(self) -> Dict[str, Dict[str, Any]]:
+        """Lê as entradas do manifesto (vazio se ainda não existir)."""
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f).get("sources", {})
+        except (OSError, ValueError) as e:
+            logger.warning(f"Manifesto inválido em {self.path}, ignorando: {e}")
+            return {}
+
+    def _save(self, sources: Dict[str, Dict[str, Any]]):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": 1, "sources": sources}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def get(self, source: str) -> Optional[Dict[str, Any]]:
+        return self.load().get(source)
+
+    def record(self, source: str, content_hash: str, params: Dict[str, Any], chunk_count: int):
+        """Registra (ou atualiza) uma fonte indexada."""
+        with _manifest_lock:
+            sources = self.load()
+            sources[source] = {
+                "hash": content_hash,
+                "params": params,
+                "chunk_count": chunk_count,
+                "indexed_at": datetime.now().isoformat(timespec="seconds")
+            }
+            self._save(sources)
+
+    def remove(self, source: str):
+        """Remove uma fonte do manifesto."""
+        with _manifest_lock:
+            sources = self.load()
+            if sources.pop(source, None) is not None:
+                self._save(sources)
+
+    def plan(self, pdf_paths: Dict[str, str], params: Dict[str, Any]) -> SyncPlan:
+        """Compara os PDFs (nome -> caminho) com o manifesto e retorna o que mudou."""
+        sources = self.load()
+        plan = SyncPlan()
+
+        for name, path in sorted(pdf_paths.items()):
+            content_hash = file_hash(path)
+            plan.hashes[name] = content_hash
+            entry = sources.get(name)
+            if entry is None:
+                plan.added[name] = path
+            elif entry.get("hash") != content_hash or entry.get("params") != params:
+                plan.changed[name] = path
+            else:
+                plan.unchanged.append(name)
+
+        plan.removed = sorted(name for name in sources if name not in pdf_paths)
+        return plan
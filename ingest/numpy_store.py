@@ -0,0 +1,675 @@
+import os
+import re
+import json
+import uuid
+import sqlite3
+import threading
+import logging
+from contextlib import contextmanager, nullcontext
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+try:
+    import fcntl
+except ImportError:  # Windows: só o lock entre threads do mesmo handle
+    fcntl = None
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+STORE_DIR = "numpy_store"
+RECORDS_FILE = "records.sqlite"
+LOCK_FILE = "write.lock"
+
+QUANTIZATIONS = ("none", "float16", "int8")
+_QUANTIZED_DTYPES = {"float16": np.float16, "int8": np.int8}
+
+# Elementos (linhas x dimensão) lidos por vez ao reescrever os arquivos
+BLOCK_ELEMENTS = 1 << 22
+# Na varredura da matriz quantizada, blocos pequenos o bastante para a conversão a float32 caber no cache
+SCAN_BLOCK_ELEMENTS = 1 << 18
+
+# Compactar os arquivos quando as linhas removidas passarem desta fração
+COMPACT_RATIO = 0.3
+
+_KEY_PATTERN = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+_COMPARISONS = {"$eq": "=", "$ne": "!=", "$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<="}
+
+
+def is_numpy_index(persist_directory: str) -> bool:
+    """Indica se o índice no diretório usa o backend NumPy."""
+    return os.path.exists(os.path.join(persist_directory, STORE_DIR, RECORDS_FILE))
+
+
+def index_quantization(persist_directory: str) -> Optional[str]:
+    """Quantização gravada no índice NumPy do diretório (None se não houver um)."""
+    if not is_numpy_index(persist_directory):
+        return None
+    conn = sqlite3.connect(os.path.join(persist_directory, STORE_DIR, RECORDS_FILE), timeout=30)
+    try:
+        row = conn.execute("SELECT value FROM meta WHERE key = 'quantization'").fetchone()
+    except sqlite3.OperationalError:
+        row = None
+    finally:
+        conn.close()
+    return row[0] if row else "none"
+
+
+def _where_sql(where: Dict[str, Any]) -> Tuple[str, List[Any]]:
+    """Traduz um filtro no formato do Chroma (`$and`, `$or`, `$in`, `$eq`...) para SQL sobre o JSON dos metadados."""
+    clauses, params = [], []
+    for key, condition in where.items():
+        if key in ("$and", "$or"):
+            parts = [_where_sql(item) for item in condition]
+            joiner = " AND " if key == "$and" else " OR "
+            clauses.append("(" + joiner.join(sql for sql, _ in parts) + ")")
+            params += [param for _, item_params in parts for param in item_params]
+            continue
+        if not _KEY_PATTERN.match(key):
+            raise ValueError(f"Campo de metadado inválido no filtro: {key}")
+        column = f"json_extract(metadata, '$.{key}')"
+        operations = condition if isinstance(condition, dict) else {"$eq": condition}
+        for operator, value in operations.items():
+            if operator in ("$in", "$nin"):
+                values = list(value)
+                placeholders = ",".join("?" * len(values)) or "NULL"
+                clauses.append(f"{column} {'IN' if operator == '$in' else 'NOT IN'} ({placeholders})")
+                params += values
+            elif operator in _COMPARISONS:
+                clauses.append(f"{column} {_COMPARISONS[operator]} ?")
+                params.append(value)
+            else:
+                raise ValueError(f"Operador de filtro não suportado: {operator}")
+    return " AND ".join(clauses) or "1", params
+
+
+def quantize_int8(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Quantização simétrica por linha: int8 e a escala (maior valor absoluto) de cada vetor."""
+    scales = np.abs(vectors).max(axis=1).astype(np.float32)
+    safe = np.where(scales > 0, scales, 1.0)
+    quantized = np.rint(vectors / safe[:, None] * 127).astype(np.int8)
+    return quantized, scales
+
+
+class NumpyVectorStore(VectorStore):
+    """Vectorstore em arquivos: matriz de embeddings mapeada em memória e metadados em SQLite.
+
+    Os vetores (float32) ficam em um arquivo binário lido com `np.memmap`, as
+    normas ao quadrado em outro e ids, textos e metadados em um SQLite ao
+    lado, que também resolve os filtros. A busca é uma varredura vetorizada
+    por blocos (distância L2 ao quadrado, como o Chroma) seguida de top-k.
+
+    Com `quantization` "float16" ou "int8" uma cópia quantizada da matriz é
+    usada na varredura (2x ou 4x menos memória residente) e os
+    `rescore_factor * k` melhores candidatos são reordenados com os vetores
+    float32 exatos, lidos do disco só para essas linhas.
+
+    Os arquivos só recebem acréscimos; o número de linhas válidas e a geração
+    dos arquivos ficam no SQLite e são confirmados na mesma transação dos
+    registros. Remoções apagam o registro e, acima de `COMPACT_RATIO` de
+    linhas mortas, os arquivos são reescritos em uma nova geração.
+
+    Vários handles (de um ou mais processos) podem abrir o mesmo diretório:
+    gravações, compactações e a limpeza de escritas interrompidas e de
+    gerações antigas acontecem sob um lock exclusivo em `LOCK_FILE`, e os
+    leitores mapeiam os arquivos sob o lock compartilhado, de modo que nada
+    é truncado ou apagado entre a leitura do estado e o mapeamento. Abrir um
+    handle não altera o índice: a quantização pedida só vale para um índice
+    novo; para converter um índice existente use `requantize`.
+    """
+
+    def __init__(
+        self,
+        persist_directory: str,
+        embedding_function,
+        quantization: Optional[str] = None,
+        rescore_factor: int = 4
+    ):
+        if quantization is not None and quantization not in QUANTIZATIONS:
+            raise ValueError(f"Quantização '{quantization}' não suportada (use {', '.join(QUANTIZATIONS)})")
+        self.persist_directory = persist_directory
+        self.directory = os.path.join(persist_directory, STORE_DIR)
+        self._embedding_function = embedding_function
+        self.rescore_factor = max(1, rescore_factor)
+        self._lock = threading.RLock()
+        os.makedirs(self.directory, exist_ok=True)
+        self._db_path = os.path.join(self.directory, RECORDS_FILE)
+        self._lock_path = os.path.join(self.directory, LOCK_FILE)
+        self._lock_owner: Optional[int] = None
+        self._reading = threading.local()
+
+        with self._connect() as conn:
+            conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS records (
+                    row INTEGER PRIMARY KEY,
+                    id TEXT NOT NULL UNIQUE,
+                    document TEXT,
+                    metadata TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_records_source ON records (json_extract(metadata, '$.source'));
+                CREATE INDEX IF NOT EXISTS idx_records_module ON records (json_extract(metadata, '$.module'));
+                CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+                """
+            )
+
+        self._version = -1
+        self._maps: Optional[Dict[str, np.ndarray]] = None
+        self._refresh()
+
+        if quantization is not None and quantization != self.quantization:
+            with self._exclusive():
+                self._refresh()
+                if not self._has_meta("quantization"):
+                    # Índice novo: a quantização é escolhida por quem o cria
+                    self._set_quantization(quantization)
+                elif quantization != self.quantization:
+                    logger.info(
+                        f"Índice NumPy em {persist_directory} mantido com quantização '{self.quantization}' "
+                        f"(pedida: '{quantization}'); use requantize() ou reconstrua o índice para trocar"
+                    )
+
+    @property
+    def embeddings(self):
+        return self._embedding_function
+
+    # ----- locks -----
+
+    @contextmanager
+    def _exclusive(self):
+        """Lock de escrita entre handles e processos (reentrante na mesma thread)."""
+        with self._lock:
+            if self._lock_owner is not None:
+                yield
+                return
+            with open(self._lock_path, "a+b") as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                self._lock_owner = threading.get_ident()
+                try:
+                    yield
+                finally:
+                    # Fechar o arquivo libera o lock
+                    self._lock_owner = None
+
+    @contextmanager
+    def _shared(self):
+        """Lock de leitura: nenhuma escrita, compactação ou limpeza acontece enquanto é mantido."""
+        if fcntl is None or self._lock_owner == threading.get_ident() or getattr(self._reading, "active", False):
+            # Esta thread já tem um dos locks
+            yield
+            return
+        with open(self._lock_path, "a+b") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_SH)
+            self._reading.active = True
+            try:
+                yield
+            finally:
+                self._reading.active = False
+
+    # ----- arquivos -----
+
+    def _refresh(self):
+        """Relê o estado do SQLite se outro handle (ou processo) gravou no índice."""
+        with self._lock:
+            with self._connect() as conn:
+                row = conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+            if int(row[0] if row else 0) == self._version:
+                return
+            with self._shared():
+                with self._connect() as conn:
+                    meta = dict(conn.execute("SELECT key, value FROM meta"))
+                    alive = [row for (row,) in conn.execute("SELECT row FROM records")]
+                self._version = int(meta.get("version", 0))
+                self.rows = int(meta.get("rows", 0))
+                self.dim = int(meta["dim"]) if "dim" in meta else None
+                self.generation = int(meta.get("generation", 0))
+                self.quantization = meta.get("quantization", "none")
+                self._alive = np.zeros(self.rows, dtype=bool)
+                self._alive[[row for row in alive if row < self.rows]] = True
+                # Mapeados ainda sob o lock: depois disso a geração pode ser apagada sem afetar os mapas
+                self._load_maps()
+
+    def _has_meta(self, key: str) -> bool:
+        with self._connect() as conn:
+            return conn.execute("SELECT 1 FROM meta WHERE key = ?", (key,)).fetchone() is not None
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self._db_path, timeout=30)
+
+    def _file(self, kind: str, generation: Optional[int] = None) -> str:
+        generation = self.generation if generation is None else generation
+        return os.path.join(self.directory, f"{kind}-{generation}.bin")
+
+    def _kinds(self, quantization: Optional[str] = None) -> Dict[str, Any]:
+        """Arquivos binários da geração: tipo -> (dtype, largura em elementos por linha)."""
+        quantization = quantization or self.quantization
+        kinds = {"vectors": (np.float32, self.dim), "norms": (np.float32, 1)}
+        if quantization in _QUANTIZED_DTYPES:
+            kinds["quantized"] = (_QUANTIZED_DTYPES[quantization], self.dim)
+        if quantization == "int8":
+            kinds["scales"] = (np.float32, 1)
+        return kinds
+
+    def _recover(self):
+        """Descarta bytes de escritas não confirmadas e arquivos de gerações antigas (sob o lock exclusivo)."""
+        if self.dim is not None:
+            for kind, (dtype, width) in self._kinds().items():
+                path = self._file(kind)
+                expected = self.rows * width * np.dtype(dtype).itemsize
+                if not os.path.exists(path):
+                    open(path, "wb").close()
+                if os.path.getsize(path) != expected:
+                    with open(path, "r+b") as f:
+                        f.truncate(expected)
+        current = {os.path.basename(self._file(kind)) for kind in self._kinds()} if self.dim else set()
+        for name in os.listdir(self.directory):
+            if name.endswith(".bin") and name not in current:
+                self._remove_file(os.path.join(self.directory, name))
+
+    @staticmethod
+    def _remove_file(path: str):
+        try:
+            os.remove(path)
+        except OSError as e:
+            logger.warning(f"Não foi possível remover {path}: {e}")
+
+    def _load_maps(self):
+        """Mapeia os arquivos da geração atual (com um dos locks mantido)."""
+        self._maps = {}
+        if self.rows and self.dim:
+            for kind, (dtype, width) in self._kinds().items():
+                matrix = np.memmap(self._file(kind), dtype=dtype, mode="r", shape=(self.rows, width))
+                self._maps[kind] = matrix if width > 1 else matrix[:, 0]
+
+    def _matrices(self) -> Dict[str, np.ndarray]:
+        """Mapas em memória dos arquivos da geração atual (recriados após cada escrita)."""
+        with self._lock:
+            return self._maps or {}
+
+    def _append_files(self, vectors: np.ndarray, generation: Optional[int] = None, quantization: Optional[str] = None):
+        quantization = quantization or self.quantization
+        arrays = {"vectors": vectors, "norms": np.einsum("ij,ij->i", vectors, vectors).astype(np.float32)}
+        if quantization == "float16":
+            arrays["quantized"] = vectors.astype(np.float16)
+        elif quantization == "int8":
+            arrays["quantized"], arrays["scales"] = quantize_int8(vectors)
+        for kind, array in arrays.items():
+            with open(self._file(kind, generation), "ab") as f:
+                f.write(np.ascontiguousarray(array).tobytes())
+
+    def _save_meta(self, conn: sqlite3.Connection):
+        """Confirma o estado junto com os registros; a versão avisa outros processos da mudança."""
+        self._version += 1
+        conn.executemany(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+            [
+                ("version", str(self._version)),
+                ("rows", str(self.rows)),
+                ("generation", str(self.generation)),
+                ("quantization", self.quantization)
+            ] + ([("dim", str(self.dim))] if self.dim is not None else [])
+        )
+
+    def _rewrite(self, rows: np.ndarray, quantization: str):
+        """Reescreve os arquivos em uma nova geração, só com as linhas `rows` (em ordem crescente)."""
+        with self._exclusive():
+            self._recover()
+            maps = self._matrices()
+            old_generation, new_generation = self.generation, self.generation + 1
+            for kind in self._kinds(quantization):
+                open(self._file(kind, new_generation), "wb").close()
+            step = max(1, BLOCK_ELEMENTS // max(self.dim or 1, 1))
+            for start in range(0, len(rows), step):
+                block = np.asarray(maps["vectors"][rows[start:start + step]], dtype=np.float32)
+                self._append_files(block, new_generation, quantization)
+
+            with self._connect() as conn:
+                # Renumerar em ordem crescente: a nova posição nunca está ocupada
+                conn.executemany(
+                    "UPDATE records SET row = ? WHERE row = ?",
+                    [(new_row, int(old_row)) for new_row, old_row in enumerate(rows) if new_row != old_row]
+                )
+                self.rows, self.generation, self.quantization = len(rows), new_generation, quantization
+                self._save_meta(conn)
+            self._alive = np.ones(self.rows, dtype=bool)
+            self._load_maps()
+            # Leitores de outros handles já mapearam a geração antiga ou vão ler a nova
+            for kind in ("vectors", "norms", "quantized", "scales"):
+                path = self._file(kind, old_generation)
+                if os.path.exists(path):
+                    self._remove_file(path)
+
+    def _set_quantization(self, quantization: str):
+        """Grava a quantização de um índice ainda sem vetores (sob o lock exclusivo)."""
+        self.quantization = quantization
+        with self._connect() as conn:
+            self._save_meta(conn)
+
+    def requantize(self, quantization: str):
+        """Converte o índice para outra quantização, reescrevendo os arquivos em uma nova geração."""
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Quantização '{quantization}' não suportada (use {', '.join(QUANTIZATIONS)})")
+        with self._exclusive():
+            self._refresh()
+            if quantization == self.quantization:
+                return
+            logger.info(f"Convertendo o índice NumPy de '{self.quantization}' para '{quantization}'")
+            if self.dim is None:
+                self._set_quantization(quantization)
+            else:
+                self._rewrite(np.flatnonzero(self._alive), quantization)
+
+    def compact(self):
+        """Remove dos arquivos as linhas cujos registros foram apagados."""
+        with self._exclusive():
+            self._refresh()
+            keep = np.flatnonzero(self._alive)
+            if len(keep) == self.rows:
+                return
+            logger.info(f"Compactando o índice NumPy: {self.rows - len(keep)} linhas removidas")
+            self._rewrite(keep, self.quantization)
+
+    # ----- gravação e remoção -----
+
+    def upsert_embeddings(
+        self,
+        ids: List[str],
+        embeddings: List[List[float]],
+        documents: List[str],
+        metadatas: List[Dict[str, Any]]
+    ):
+        """Grava vetores já calculados; ids existentes são substituídos."""
+        if not ids:
+            return
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        with self._exclusive():
+            self._refresh()
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Dimensão {vectors.shape[1]} diferente da do índice ({self.dim})")
+            # Nenhum outro escritor está no meio de uma gravação: bytes além das linhas confirmadas são sobras
+            self._recover()
+
+            self._append_files(vectors)
+            with self._connect() as conn:
+                replaced = self._delete_ids(conn, ids)
+                conn.executemany(
+                    "INSERT INTO records (row, id, document, metadata) VALUES (?, ?, ?, ?)",
+                    [
+                        (self.rows + i, chunk_id, document, json.dumps(metadata, ensure_ascii=False))
+                        for i, (chunk_id, document, metadata) in enumerate(zip(ids, documents, metadatas))
+                    ]
+                )
+                self.rows += len(ids)
+                self._save_meta(conn)
+            self._alive[replaced] = False
+            self._alive = np.concatenate([self._alive, np.ones(len(ids), dtype=bool)])
+            self._load_maps()
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[List[Dict[str, Any]]] = None,
+        ids: Optional[List[str]] = None,
+        **kwargs: Any
+    ) -> List[str]:
+        texts = list(texts)
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [str(uuid.uuid4()) for _ in texts]
+        vectors = self._embedding_function.embed_documents(texts)
+        self.upsert_embeddings(ids, vectors, texts, metadatas)
+        return ids
+
+    @staticmethod
+    def _delete_ids(conn: sqlite3.Connection, ids: List[str]) -> List[int]:
+        """Apaga os registros dos ids e retorna as linhas que eles ocupavam."""
+        rows = []
+        for i in range(0, len(ids), 500):
+            part = ids[i:i + 500]
+            placeholders = ",".join("?" * len(part))
+            rows += [row for (row,) in conn.execute(f"SELECT row FROM records WHERE id IN ({placeholders})", part)]
+            conn.execute(f"DELETE FROM records WHERE id IN ({placeholders})", part)
+        return rows
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> None:
+        if not ids:
+            return
+        with self._exclusive():
+            self._refresh()
+            with self._connect() as conn:
+                rows = self._delete_ids(conn, ids)
+                if rows:
+                    self._save_meta(conn)
+            self._alive[rows] = False
+            if self.rows and (self.rows - int(self._alive.sum())) / self.rows > COMPACT_RATIO:
+                self.compact()
+
+    # ----- leitura -----
+
+    def get(
+        self,
+        ids: Optional[List[str]] = None,
+        where: Optional[Dict[str, Any]] = None,
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+        include: Optional[List[str]] = None,
+        **kwargs: Any
+    ) -> Dict[str, Any]:
+        """Mesmo contrato de `Chroma.get` (ids, documentos, metadados e, se pedido, embeddings)."""
+        include = ["documents", "metadatas"] if include is None else include
+        sql, params = _where_sql(where or {})
+        if ids is not None:
+            sql += f" AND id IN ({','.join('?' * len(ids)) or 'NULL'})"
+            params += list(ids)
+        query = f"SELECT row, id, document, metadata FROM records WHERE {sql} ORDER BY row LIMIT ? OFFSET ?"
+        params += [-1 if limit is None else limit, offset or 0]
+        # Com embeddings, registros e arquivos são lidos sob o mesmo lock (uma compactação renumera as linhas)
+        with self._shared() if "embeddings" in include else nullcontext():
+            with self._connect() as conn:
+                rows = conn.execute(query, params).fetchall()
+            if "embeddings" in include:
+                with self._lock:
+                    self._refresh()
+                    vectors = self._matrices().get("vectors")
+                embeddings = [vectors[row[0]].tolist() for row in rows] if vectors is not None else []
+
+        result: Dict[str, Any] = {
+            "ids": [row[1] for row in rows],
+            "documents": [row[2] for row in rows] if "documents" in include else None,
+            "metadatas": [json.loads(row[3]) for row in rows] if "metadatas" in include else None,
+            "embeddings": None,
+            "included": include
+        }
+        if "embeddings" in include:
+            result["embeddings"] = embeddings
+        return result
+
+    def list_modules(self) -> List[str]:
+        """Módulos presentes nos metadados."""
+        with self._connect() as conn:
+            return [row[0] for row in conn.execute(
+                "SELECT DISTINCT json_extract(metadata, '$.module') AS module FROM records "
+                "WHERE module IS NOT NULL ORDER BY module"
+            )]
+
+    def _filtered_rows(self, filter: Dict[str, Any]) -> np.ndarray:
+        sql, params = _where_sql(filter)
+        with self._connect() as conn:
+            return np.array([row for (row,) in conn.execute(f"SELECT row FROM records WHERE {sql}", params)], dtype=np.int64)
+
+    def _scan(
+        self,
+        maps: Dict[str, np.ndarray],
+        query: np.ndarray,
+        count: int,
+        rows: Optional[np.ndarray] = None,
+        mask: Optional[np.ndarray] = None
+    ) -> np.ndarray:
+        """Linhas com as `count` menores distâncias aproximadas (ou exatas sem quantização).
+
+        Com `rows` só essas linhas são lidas; com `mask` a matriz é varrida em
+        blocos contíguos e as linhas fora da máscara são descartadas.
+        """
+        matrix = maps.get("quantized", maps["vectors"])
+        scales = maps.get("scales")
+        total = len(matrix) if rows is None else len(rows)
+        # float32 é multiplicado direto do mapa; a matriz quantizada precisa ser convertida por blocos
+        step = max(1, SCAN_BLOCK_ELEMENTS // self.dim) if "quantized" in maps else max(total, 1)
+        candidates, distances = [], []
+
+        for start in range(0, total, step):
+            end = min(start + step, total)
+            index = slice(start, end) if rows is None else rows[start:end]
+            dots = np.asarray(matrix[index], dtype=np.float32) @ query
+            if scales is not None:
+                dots *= scales[index] / 127.0
+            block_distances = maps["norms"][index] - 2 * dots
+            block_rows = np.arange(start, end) if rows is None else rows[start:end]
+            if mask is not None:
+                block_distances[~mask[start:end]] = np.inf
+            if count < len(block_distances):
+                top = np.argpartition(block_distances, count - 1)[:count]
+                block_rows, block_distances = block_rows[top], block_distances[top]
+            candidates.append(block_rows)
+            distances.append(block_distances)
+
+        if not candidates:
+            return np.empty(0, dtype=np.int64)
+        candidates, distances = np.concatenate(candidates), np.concatenate(distances)
+        if count < len(distances):
+            top = np.argpartition(distances, count - 1)[:count]
+            candidates, distances = candidates[top], distances[top]
+        order = np.argsort(distances, kind="stable")
+        return candidates[order][np.isfinite(distances[order])]
+
+    def similarity_search_by_vector_with_relevance_scores(
+        self,
+        embedding: List[float],
+        k: int = 4,
+        filter: Optional[Dict[str, Any]] = None,
+        **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        """Top-k por distância L2 ao quadrado (menor primeiro), como o Chroma."""
+        if k <= 0:
+            return []
+        # Sob o lock de leitura: as linhas dos candidatos continuam sendo as dos registros até o fim da busca
+        with self._shared():
+            return self._search(embedding, k, filter)
+
+    def _search(self, embedding: List[float], k: int, filter: Optional[Dict[str, Any]]) -> List[Tuple[Document, float]]:
+        with self._lock:
+            self._refresh()
+            maps, size, alive = self._matrices(), self.rows, self._alive
+        if not maps:
+            return []
+        query = np.asarray(embedding, dtype=np.float32)
+
+        # Linhas candidatas: as do filtro (lidas uma a uma se forem poucas) ou as não removidas
+        mask, rows = alive, None
+        if filter:
+            rows = self._filtered_rows(filter)
+            rows = rows[rows < size]
+            if not len(rows):
+                return []
+            if len(rows) > size // 4:
+                mask = np.zeros(size, dtype=bool)
+                mask[rows] = True
+                rows = None
+            else:
+                mask = None
+
+        quantized = "quantized" in maps
+        count = k * self.rescore_factor if quantized else k
+        candidates = self._scan(maps, query, count, rows, None if mask is not None and mask.all() else mask)
+
+        if quantized:
+            # Reordenar os candidatos com os vetores exatos
+            exact = maps["norms"][candidates] - 2 * (np.asarray(maps["vectors"][candidates], dtype=np.float32) @ query)
+            order = np.argsort(exact, kind="stable")[:k]
+            candidates, distances = candidates[order], exact[order]
+        else:
+            candidates = candidates[:k]
+            distances = maps["norms"][candidates] - 2 * (np.asarray(maps["vectors"][candidates], dtype=np.float32) @ query)
+        distances = np.maximum(distances + float(query @ query), 0.0)
+        if not len(candidates):
+            return []
+
+        placeholders = ",".join("?" * len(candidates))
+        with self._connect() as conn:
+            records = {
+                row: (chunk_id, document, metadata)
+                for row, chunk_id, document, metadata in conn.execute(
+                    f"SELECT row, id, document, metadata FROM records WHERE row IN ({placeholders})",
+                    [int(row) for row in candidates]
+                )
+            }
+        results = []
+        for row, distance in zip(candidates, distances):
+            record = records.get(int(row))
+            if record is None:  # removido durante a busca
+                continue
+            chunk_id, document, metadata = record
+            results.append((Document(page_content=document or "", metadata=json.loads(metadata), id=chunk_id), float(distance)))
+        return results
+
+    def similarity_search_by_vector(
+        self,
+        embedding: List[float],
+        k: int = 4,
+        filter: Optional[Dict[str, Any]] = None,
+        **kwargs: Any
+    ) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_by_vector_with_relevance_scores(embedding, k, filter)]
+
+    def similarity_search_with_score(
+        self,
+        query: str,
+        k: int = 4,
+        filter: Optional[Dict[str, Any]] = None,
+        **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        embedding = self._embedding_function.embed_query(query)
+        return self.similarity_search_by_vector_with_relevance_scores(embedding, k, filter)
+
+    def similarity_search(
+        self,
+        query: str,
+        k: int = 4,
+        filter: Optional[Dict[str, Any]] = None,
+        **kwargs: Any
+    ) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, filter)]
+
+    def _select_relevance_score_fn(self):
+        # Distância L2, como no Chroma
+        return self._euclidean_relevance_score_fn
+
+    def memory_bytes(self) -> Dict[str, int]:
+        """Bytes da matriz varrida em cada busca e da matriz exata (lida só para os candidatos)."""
+        with self._lock:
+            self._refresh()
+            maps = self._matrices()
+        scan = maps.get("quantized", maps.get("vectors"))
+        return {
+            "scan": int(scan.nbytes) if scan is not None else 0,
+            "exact": int(maps["vectors"].nbytes) if "vectors" in maps else 0
+        }
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: List[str],
+        embedding,
+        metadatas: Optional[List[Dict[str, Any]]] = None,
+        persist_directory: str = "data/index",
+        **kwargs: Any
+    ) -> "NumpyVectorStore":
+        store = cls(persist_directory, embedding, quantization=kwargs.get("quantization"))
+        store.add_texts(texts, metadatas)
+        return store
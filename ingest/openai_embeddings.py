@@ -0,0 +1,310 @@
+import re
+import time
+import random
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Mapping, Optional
+
+from langchain_core.embeddings import Embeddings
+
+from ingest.tracing import estimate_tokens
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Mesmo modelo padrão do OpenAIEmbeddings do LangChain (e, portanto, dos índices já criados)
+DEFAULT_OPENAI_MODEL = "text-embedding-ada-002"
+
+# Tokens (estimados) por requisição; a API aceita bem mais, mas requisições menores
+# se distribuem melhor entre as requisições simultâneas e perdem menos em um erro
+DEFAULT_REQUEST_TOKENS = 16000
+# Limite de textos por requisição da API
+MAX_INPUTS_PER_REQUEST = 2048
+
+DEFAULT_CONCURRENCY = 4
+DEFAULT_MAX_RETRIES = 6
+
+# Status que valem uma nova tentativa (limite de taxa, timeout, erros do servidor)
+RETRY_STATUS = {408, 409, 429, 500, 502, 503, 504}
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+
+_DURATION = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_UNITS = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """Converte os tempos dos cabeçalhos da API ("20ms", "1s", "6m0s", "1.5") em segundos."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+
+def retry_after(headers: Optional[Mapping[str, str]]) -> Optional[float]:
+    """Espera pedida pela API (retry-after-ms / retry-after), em segundos."""
+    if not headers:
+        return None
+    milliseconds = parse_duration(headers.get("retry-after-ms"))
+    if milliseconds is not None:
+        return milliseconds / 1000
+    return parse_duration(headers.get("retry-after"))
+
+
+def pack_requests(
+    tokens: List[int],
+    request_tokens: int = DEFAULT_REQUEST_TOKENS,
+    max_inputs: int = MAX_INPUTS_PER_REQUEST
+) -> List[List[int]]:
+    """Agrupa os índices dos textos, em ordem, em requisições de até `request_tokens` tokens."""
+    requests: List[List[int]] = []
+    current: List[int] = []
+    used = 0
+    for i, count in enumerate(tokens):
+        if current and (used + count > request_tokens or len(current) >= max_inputs):
+            requests.append(current)
+            current, used = [], 0
+        current.append(i)
+        used += count
+    if current:
+        requests.append(current)
+    return requests
+
+
+class RateLimiter:
+    """Limites de taxa informados pela API e concorrência adaptativa, compartilhados entre as threads.
+
+    Antes de cada requisição, `acquire` espera por uma vaga (no máximo
+    `limit` requisições simultâneas), pelo fim de uma pausa imposta por um
+    429 e, se os cabeçalhos x-ratelimit-* da última resposta indicarem que a
+    cota de requisições ou de tokens acabou, pela renovação da cota. Cada 429
+    reduz `limit` pela metade; depois de `limit` respostas bem-sucedidas
+    seguidas, ele volta a crescer de um em um até `max_concurrency`.
+    """
+
+    def __init__(self, max_concurrency: int):
+        self.max_concurrency = max(1, max_concurrency)
+        self.limit = self.max_concurrency
+        self.active = 0
+        self.successes = 0
+        self.paused_until = 0.0
+        self.remaining_requests: Optional[int] = None
+        self.remaining_tokens: Optional[int] = None
+        self.requests_reset_at = 0.0
+        self.tokens_reset_at = 0.0
+        self.waited = 0.0
+        self._cond = threading.Condition()
+
+    def _wait_time(self, tokens: int, now: float) -> Optional[float]:
+        """Segundos até a requisição poder sair (0: já pode; None: esperar por uma vaga)."""
+        if self.active >= self.limit:
+            return None
+        wait = self.paused_until - now
+        if self.remaining_requests is not None and self.remaining_requests <= 0:
+            wait = max(wait, self.requests_reset_at - now)
+        if self.remaining_tokens is not None and tokens > self.remaining_tokens:
+            wait = max(wait, self.tokens_reset_at - now)
+        return max(wait, 0.0)
+
+    def acquire(self, tokens: int):
+        start = time.monotonic()
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                wait = self._wait_time(tokens, now)
+                if wait == 0.0:
+                    break
+                self._cond.wait(timeout=wait)
+            self.active += 1
+            # Descontar da cota até a resposta trazer os valores atualizados
+            if self.remaining_requests is not None:
+                self.remaining_requests -= 1
+            if self.remaining_tokens is not None:
+                self.remaining_tokens -= tokens
+            self.waited += time.monotonic() - start
+
+    def release(self, headers: Optional[Mapping[str, str]] = None, throttled: bool = False, pause: float = 0.0):
+        with self._cond:
+            self.active -= 1
+            now = time.monotonic()
+            if headers:
+                self._update(headers, now)
+            if throttled:
+                self.limit = max(1, self.limit // 2)
+                self.successes = 0
+                self.paused_until = max(self.paused_until, now + pause)
+            elif headers is not None:
+                self.successes += 1
+                if self.successes >= self.limit and self.limit < self.max_concurrency:
+                    self.limit += 1
+                    self.successes = 0
+            self._cond.notify_all()
+
+    def _update(self, headers: Mapping[str, str], now: float):
+        for kind in ("requests", "tokens"):
+            remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+            reset = parse_duration(headers.get(f"x-ratelimit-reset-{kind}"))
+            if remaining is None:
+                continue
+            try:
+                setattr(self, f"remaining_{kind}", int(float(remaining)))
+            except ValueError:
+                continue
+            setattr(self, f"{kind}_reset_at", now + (reset or 0.0))
+
+
+class OpenAIEmbeddingClient(Embeddings):
+    """Embeddings da OpenAI em requisições simultâneas, limitadas por tokens e atentas ao limite de taxa.
+
+    Os textos de uma chamada são agrupados em requisições de até
+    `request_tokens` tokens (estimados) e enviados por até `concurrency`
+    threads; o `RateLimiter` segura as requisições conforme os cabeçalhos de
+    limite da API e reduz a concorrência a cada 429. Limite de taxa, timeout
+    e erros do servidor são repetidos até `max_retries` vezes, com espera
+    exponencial (ou a pedida em retry-after); outros erros (chave inválida,
+    texto grande demais) são propagados na hora.
+
+    `base_url` (ou OPENAI_BASE_URL) aponta o cliente para outro servidor
+    compatível, como um stub local. O identificador do modelo é o mesmo do
+    `OpenAIEmbeddings`, de modo que o cache de embeddings e o manifesto do
+    índice continuam valendo. `workers` informa à ingestão quantos lotes
+    manter em andamento: cada lote é gravado assim que seus embeddings chegam.
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        model: str = DEFAULT_OPENAI_MODEL,
+        base_url: Optional[str] = None,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        request_tokens: int = DEFAULT_REQUEST_TOKENS,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        timeout: float = 60.0,
+        count_tokens: Optional[Callable[[str], int]] = None
+    ):
+        from openai import OpenAI
+        # As novas tentativas ficam por conta do cliente, que conhece o estado do limite de taxa
+        self.client = OpenAI(api_key=api_key, base_url=base_url, max_retries=0, timeout=timeout)
+        self.model = model
+        self.model_id = f"OpenAIEmbeddings:{model}"
+        self.workers = max(1, concurrency)
+        self.request_tokens = request_tokens
+        self.max_retries = max_retries
+        self.count_tokens = count_tokens or estimate_tokens
+        self.limiter = RateLimiter(self.workers)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._stats = {"texts": 0, "requests": 0, "retries": 0, "throttled": 0, "tokens": 0, "seconds": 0.0}
+
+    def _pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="openai-embed")
+            return self._executor
+
+    def _count(self, **values: float):
+        with self._lock:
+            for key, value in values.items():
+                self._stats[key] += value
+
+    def _backoff(self, attempt: int, headers: Optional[Mapping[str, str]]) -> float:
+        delay = retry_after(headers)
+        if delay is None:
+            # Espera exponencial com jitter, para as threads não voltarem todas juntas
+            delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt) * (0.5 + random.random() / 2)
+        return delay
+
+    def _request(self, texts: List[str], tokens: int) -> List[List[float]]:
+        """Uma requisição de embeddings, repetida em caso de limite de taxa ou falha temporária."""
+        import openai
+
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire(tokens)
+            try:
+                raw = self.client.embeddings.with_raw_response.create(model=self.model, input=texts)
+                response = raw.parse()
+            except openai.APIStatusError as e:
+                headers = e.response.headers
+                if e.status_code not in RETRY_STATUS or attempt == self.max_retries:
+                    self.limiter.release(headers)
+                    raise
+                delay = self._backoff(attempt, headers)
+                throttled = e.status_code == 429
+                self.limiter.release(headers, throttled=throttled, pause=delay)
+                self._count(retries=1, throttled=int(throttled))
+                logger.warning(
+                    f"Embeddings da OpenAI: status {e.status_code}, nova tentativa em {delay:.1f}s "
+                    f"({attempt + 1}/{self.max_retries}, concorrência {self.limiter.limit})"
+                )
+                if throttled:
+                    # A pausa vale para todas as threads e é aplicada pelo limiter
+                    continue
+            except openai.APIConnectionError as e:
+                self.limiter.release()
+                if attempt == self.max_retries:
+                    raise
+                delay = self._backoff(attempt, None)
+                self._count(retries=1)
+                logger.warning(
+                    f"Embeddings da OpenAI: {type(e).__name__}, nova tentativa em {delay:.1f}s "
+                    f"({attempt + 1}/{self.max_retries})"
+                )
+            else:
+                self.limiter.release(raw.headers)
+                usage = getattr(response, "usage", None)
+                self._count(requests=1, tokens=getattr(usage, "total_tokens", None) or tokens)
+                return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+            time.sleep(delay)
+        raise RuntimeError("Número de tentativas esgotado")
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Calcula os embeddings em requisições simultâneas, devolvendo-os na ordem dos textos."""
+        if not texts:
+            return []
+        start = time.perf_counter()
+        tokens = [max(self.count_tokens(text), 1) for text in texts]
+        requests = pack_requests(tokens, self.request_tokens)
+
+        def run(indexes: List[int]) -> List[List[float]]:
+            return self._request([texts[i] for i in indexes], sum(tokens[i] for i in indexes))
+
+        if len(requests) == 1:
+            results = [run(requests[0])]
+        else:
+            results = list(self._pool().map(run, requests))
+
+        vectors: List[List[float]] = [[] for _ in texts]
+        for indexes, batch in zip(requests, results):
+            for i, vector in zip(indexes, batch):
+                vectors[i] = vector
+        self._count(texts=len(texts), seconds=time.perf_counter() - start)
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._request([text], max(self.count_tokens(text), 1))[0]
+
+    def stats(self) -> Dict[str, Any]:
+        """Requisições, novas tentativas, limites de taxa atingidos, espera e concorrência atual."""
+        with self._lock:
+            stats: Dict[str, Any] = dict(self._stats)
+        stats["seconds"] = round(stats["seconds"], 3)
+        stats["texts_per_second"] = round(stats["texts"] / stats["seconds"], 1) if stats["seconds"] else 0.0
+        stats["rate_limit_wait_seconds"] = round(self.limiter.waited, 3)
+        stats["concurrency"] = self.limiter.limit
+        stats["max_concurrency"] = self.limiter.max_concurrency
+        return stats
+
+    def close(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
@@ -0,0 +1,167 @@
+import queue
+import threading
+import logging
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Marca o fim do fluxo entre estágios
+_DONE = object()
+
+ProgressCallback = Callable[[int, int, int], None]
+
+
+class PageCounter:
+    """Envolve um iterador de páginas contando quantas já foram consumidas."""
+
+    def __init__(self, pages: Iterable[Dict[str, Any]]):
+        self._pages = pages
+        self.count = 0
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for page in self._pages:
+            self.count += 1
+            yield page
+
+
+def batched(items: Iterable[Any], batch_size: int) -> Iterator[List[Any]]:
+    """Agrupa um iterável em listas de até `batch_size` itens."""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class IngestPipeline:
+    """Pipeline de ingestão em estágios com filas limitadas.
+
+    chunks -> lotes -> embeddings -> gravação. Os chunks são consumidos em uma
+    thread, os embeddings calculados em `embed_concurrency` threads (mais de
+    uma só compensa com um modelo que atende lotes em paralelo, como o pool de
+    processos locais) e a gravação acontece na thread que chamou `run`, de
+    modo que o callback de progresso pode atualizar a UI do Streamlit. Cada
+    lote gravado fica persistido mesmo que o processo caia depois; a memória é
+    limitada por `batch_size` * `queue_size`.
+    """
+
+    def __init__(
+        self,
+        embed_fn: Callable[[List[str]], List[List[float]]],
+        write_fn: Callable[[List[Dict[str, Any]], List[List[float]]], List[str]],
+        batch_size: int = 64,
+        queue_size: int = 4,
+        progress_callback: Optional[ProgressCallback] = None,
+        embed_concurrency: int = 1
+    ):
+        self.embed_fn = embed_fn
+        self.write_fn = write_fn
+        self.batch_size = max(1, batch_size)
+        self.embed_concurrency = max(1, embed_concurrency)
+        self.queue_size = max(1, queue_size, self.embed_concurrency)
+        self.progress_callback = progress_callback
+
+    def run(
+        self,
+        chunks: Iterable[Dict[str, Any]],
+        pages_total: int = 0,
+        pages_done: Optional[Callable[[], int]] = None
+    ) -> int:
+        """Executa o pipeline e retorna o número de chunks gravados."""
+        to_embed: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        to_write: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        stop = threading.Event()
+        errors: List[BaseException] = []
+
+        def put(q: queue.Queue, item: Any) -> bool:
+            # Espera por espaço na fila, desistindo se o pipeline foi interrompido
+            while not stop.is_set():
+                try:
+                    q.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def get(q: queue.Queue) -> Any:
+            # Espera pelo próximo item, encerrando se o pipeline foi interrompido
+            while True:
+                try:
+                    return q.get(timeout=0.1)
+                except queue.Empty:
+                    if stop.is_set():
+                        return _DONE
+
+        def chunk_stage():
+            try:
+                for batch in batched(chunks, self.batch_size):
+                    done = pages_done() if pages_done else 0
+                    if not put(to_embed, (batch, done)):
+                        return
+            except BaseException as e:
+                errors.append(e)
+                stop.set()
+            finally:
+                # Um marcador de fim para cada thread de embeddings
+                for _ in range(self.embed_concurrency):
+                    put(to_embed, _DONE)
+
+        def embed_stage():
+            try:
+                while True:
+                    item = get(to_embed)
+                    if item is _DONE:
+                        break
+                    batch, done = item
+                    vectors = self.embed_fn([chunk["content"] for chunk in batch])
+                    if not put(to_write, (batch, vectors, done)):
+                        return
+            except BaseException as e:
+                errors.append(e)
+                stop.set()
+            finally:
+                put(to_write, _DONE)
+
+        threads = [threading.Thread(target=chunk_stage, name="ingest-chunk", daemon=True)] + [
+            threading.Thread(target=embed_stage, name=f"ingest-embed-{i}", daemon=True)
+            for i in range(self.embed_concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+
+        written = 0
+        pages = 0
+        finished = 0
+        try:
+            while finished < self.embed_concurrency:
+                item = get(to_write)
+                if item is _DONE:
+                    finished += 1
+                    continue
+                batch, vectors, done = item
+                ids = self.write_fn(batch, vectors)
+                written += len(ids)
+                # Com várias threads de embeddings os lotes podem chegar fora de ordem
+                pages = max(pages, done)
+                if self.progress_callback:
+                    self.progress_callback(pages, pages_total, written)
+        finally:
+            stop.set()
+            # Drenar as filas para liberar estágios bloqueados
+            for q in (to_embed, to_write):
+                while not q.empty():
+                    q.get_nowait()
+            for thread in threads:
+                thread.join()
+
+        if errors:
+            raise errors[0]
+
+        if self.progress_callback:
+            self.progress_callback(pages_done() if pages_done else 0, pages_total, written)
+        return written
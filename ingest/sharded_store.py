@@ -0,0 +1,362 @@
+import os
+import re
+import json
+import math
+import uuid
+import hashlib
+import threading
+import unicodedata
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Tuple
+
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+if TYPE_CHECKING:
+    # Importado sob demanda: o chromadb é pesado e só é necessário ao abrir as coleções
+    from langchain_chroma import Chroma
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+SHARDS_FILE = "shards.json"
+
+# Coleção padrão do langchain_chroma, usada por índices criados antes da divisão por módulo
+LEGACY_COLLECTION = "langchain"
+
+
+def is_sharded_index(persist_directory: str) -> bool:
+    """Indica se o índice no diretório foi criado com uma coleção por módulo."""
+    return os.path.exists(os.path.join(persist_directory, SHARDS_FILE))
+
+
+def shard_collection_name(module: str) -> str:
+    """Nome de coleção Chroma válido para um módulo ("Módulo 3" -> "shard-modulo-3-<hash>").
+
+    O hash do nome original distingue módulos que viram o mesmo texto depois
+    de remover acentos, maiúsculas e pontuação ou do corte em 63 caracteres.
+    """
+    text = unicodedata.normalize("NFKD", module)
+    text = "".join(c for c in text if not unicodedata.combining(c)).lower()
+    slug = re.sub(r"[^a-z0-9]+", "-", text).strip("-")[:48].rstrip("-") or "sem-modulo"
+    digest = hashlib.sha1(module.encode("utf-8")).hexdigest()[:8]
+    return f"shard-{slug}-{digest}"
+
+
+def _normalize(vector: List[float]) -> List[float]:
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return [x / norm for x in vector]
+
+
+class ShardedVectorStore(VectorStore):
+    """Vectorstore com uma coleção Chroma por módulo no mesmo diretório.
+
+    As gravações são roteadas pelo metadado "module". As buscas consultam só
+    os shards escolhidos (filtro explícito de módulos ou os `route_top_n`
+    shards cujo centróide é mais próximo da consulta) e combinam os top-k
+    pelo score. O centróide de cada shard é mantido incrementalmente em
+    `shards.json` (soma dos vetores normalizados e contagem).
+
+    Cada busca em um shard também filtra pelo metadado "module", de modo que
+    uma coleção compartilhada por dois módulos (nomes de índices criados
+    antes do hash em `shard_collection_name`) nunca devolve chunks de um
+    módulo que não foi pedido.
+    """
+
+    def __init__(
+        self,
+        persist_directory: str,
+        embedding_function,
+        route_top_n: int = 3,
+        max_workers: int = 8
+    ):
+        self.persist_directory = persist_directory
+        self._embedding_function = embedding_function
+        self.route_top_n = route_top_n
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+        self._collections: Dict[str, "Chroma"] = {}
+        self._state_path = os.path.join(persist_directory, SHARDS_FILE)
+        self._state = self._load_state()
+        shared = self._shared_collections()
+        if shared:
+            logger.warning(
+                f"Módulos com a mesma coleção em {persist_directory}: "
+                + "; ".join(f"{name}: {', '.join(modules)}" for name, modules in shared.items())
+                + ". As buscas filtram pelo módulo; reconstrua o índice para separá-los"
+            )
+
+        # Índices antigos (uma única coleção) continuam consultáveis até serem reindexados
+        from langchain_chroma import Chroma
+        self._legacy = Chroma(
+            collection_name=LEGACY_COLLECTION,
+            persist_directory=persist_directory,
+            embedding_function=embedding_function
+        )
+        self._save_state()
+
+    @property
+    def embeddings(self):
+        return self._embedding_function
+
+    # ----- estado dos shards -----
+
+    def _load_state(self) -> Dict[str, Dict[str, Any]]:
+        if not os.path.exists(self._state_path):
+            return {}
+        with open(self._state_path, "r", encoding="utf-8") as f:
+            return json.load(f).get("shards", {})
+
+    def _save_state(self):
+        os.makedirs(self.persist_directory, exist_ok=True)
+        tmp_path = f"{self._state_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": 1, "shards": self._state}, f, ensure_ascii=False)
+        os.replace(tmp_path, self._state_path)
+
+    def _collection_name(self, module: str) -> str:
+        return self._state.get(module, {}).get("collection") or shard_collection_name(module)
+
+    def _shared_collections(self) -> Dict[str, List[str]]:
+        """Coleções usadas por mais de um módulo (nome -> módulos)."""
+        by_collection: Dict[str, List[str]] = {}
+        for module in self._state:
+            by_collection.setdefault(self._collection_name(module), []).append(module)
+        return {name: modules for name, modules in by_collection.items() if len(modules) > 1}
+
+    def _shard(self, module: str) -> "Chroma":
+        collection = self._collections.get(module)
+        if collection is None:
+            name = self._collection_name(module)
+            from langchain_chroma import Chroma
+            collection = Chroma(
+                collection_name=name,
+                persist_directory=self.persist_directory,
+                embedding_function=self._embedding_function
+            )
+            self._collections[module] = collection
+        return collection
+
+    def _update_centroid(self, module: str, vectors: Iterable[List[float]], sign: int):
+        entry = self._state.setdefault(module, {
+            "collection": shard_collection_name(module),
+            "count": 0,
+            "sum": None
+        })
+        for vector in vectors:
+            vector = _normalize(list(vector))
+            if entry["sum"] is None:
+                entry["sum"] = [0.0] * len(vector)
+            entry["sum"] = [a + sign * b for a, b in zip(entry["sum"], vector)]
+            entry["count"] += sign
+
+    def list_modules(self) -> List[str]:
+        """Módulos com pelo menos um chunk no índice."""
+        return sorted(module for module, entry in self._state.items() if entry["count"] > 0)
+
+    def _by_collection(self, modules: Iterable[str]) -> Dict[str, List[str]]:
+        """Agrupa os módulos pela coleção que os guarda (nome -> módulos)."""
+        groups: Dict[str, List[str]] = {}
+        for module in modules:
+            groups.setdefault(self._collection_name(module), []).append(module)
+        return groups
+
+    def _all_shards(self) -> List["Chroma"]:
+        return [self._shard(modules[0]) for modules in self._by_collection(self._state).values()] + [self._legacy]
+
+    def _route(self, embedding: List[float], modules: Optional[List[str]] = None) -> List[Tuple["Chroma", List[str]]]:
+        """Shards a consultar, cada um com os módulos pelos quais foi escolhido."""
+        if modules:
+            chosen = [module for module in modules if module in self._state]
+        else:
+            query = _normalize(embedding)
+            scored = []
+            for module, entry in self._state.items():
+                if entry["count"] <= 0 or not entry["sum"]:
+                    continue
+                centroid = _normalize(entry["sum"])
+                scored.append((sum(a * b for a, b in zip(query, centroid)), module))
+            scored.sort(reverse=True)
+            chosen = [module for _, module in scored[:self.route_top_n]]
+        return [(self._shard(group[0]), group) for group in self._by_collection(chosen).values()]
+
+    def select_shards(self, embedding: List[float], modules: Optional[List[str]] = None) -> List["Chroma"]:
+        """Escolhe os shards a consultar: os módulos pedidos ou os de centróide mais próximo."""
+        shards = [shard for shard, _ in self._route(embedding, modules)]
+        if not modules and self._legacy._collection.count() > 0:
+            shards.append(self._legacy)
+        return shards
+
+    # ----- gravação e remoção -----
+
+    def upsert_embeddings(
+        self,
+        ids: List[str],
+        embeddings: List[List[float]],
+        documents: List[str],
+        metadatas: List[Dict[str, Any]]
+    ):
+        """Grava vetores já calculados, cada um no shard do seu módulo."""
+        groups: Dict[str, List[int]] = {}
+        for i, metadata in enumerate(metadatas):
+            groups.setdefault(metadata.get("module", "Desconhecido"), []).append(i)
+
+        with self._lock:
+            for module, positions in groups.items():
+                self._shard(module)._collection.upsert(
+                    ids=[ids[i] for i in positions],
+                    embeddings=[embeddings[i] for i in positions],
+                    documents=[documents[i] for i in positions],
+                    metadatas=[metadatas[i] for i in positions]
+                )
+                self._update_centroid(module, (embeddings[i] for i in positions), 1)
+            self._save_state()
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[List[Dict[str, Any]]] = None,
+        ids: Optional[List[str]] = None,
+        **kwargs: Any
+    ) -> List[str]:
+        texts = list(texts)
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [str(uuid.uuid4()) for _ in texts]
+        vectors = self._embedding_function.embed_documents(texts)
+        self.upsert_embeddings(ids, vectors, texts, metadatas)
+        return ids
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> None:
+        """Remove os ids de todos os shards, atualizando os centróides."""
+        if not ids:
+            return
+        with self._lock:
+            # Uma vez por coleção; o centróide descontado é o do módulo de cada chunk
+            for group in self._by_collection(list(self._state)).values():
+                shard = self._shard(group[0])
+                found = shard._collection.get(ids=ids, include=["embeddings", "metadatas"])
+                if not found["ids"]:
+                    continue
+                shard._collection.delete(ids=found["ids"])
+                removed: Dict[str, List[List[float]]] = {}
+                for vector, metadata in zip(found["embeddings"], found["metadatas"]):
+                    module = (metadata or {}).get("module", "Desconhecido")
+                    removed.setdefault(module if module in group else group[0], []).append(vector)
+                for module, vectors in removed.items():
+                    self._update_centroid(module, vectors, -1)
+            self._legacy.delete(ids=ids)
+            self._save_state()
+
+    # ----- leitura -----
+
+    def get(
+        self,
+        ids: Optional[List[str]] = None,
+        where: Optional[Dict[str, Any]] = None,
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+        include: Optional[List[str]] = None,
+        **kwargs: Any
+    ) -> Dict[str, Any]:
+        """Mesmo contrato de `Chroma.get`, percorrendo os shards em sequência."""
+        offset = offset or 0
+        wanted = None if limit is None else offset + limit
+        merged: Dict[str, List[Any]] = {}
+
+        for shard in self._all_shards():
+            remaining = None if wanted is None else wanted - len(merged.get("ids", []))
+            if remaining is not None and remaining <= 0:
+                break
+            result = shard.get(ids=ids, where=where, limit=remaining, include=include)
+            for key, values in result.items():
+                # Os embeddings vêm como array NumPy; "included" repete a lista de campos
+                if key != "included" and values is not None:
+                    merged.setdefault(key, []).extend(list(values))
+
+        end = None if limit is None else offset + limit
+        return {key: values[offset:end] for key, values in merged.items()}
+
+    def similarity_search_by_vector_with_relevance_scores(
+        self,
+        embedding: List[float],
+        k: int = 4,
+        filter: Optional[Dict[str, Any]] = None,
+        modules: Optional[List[str]] = None,
+        **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        """Busca nos shards selecionados em paralelo e combina os top-k (menor distância primeiro)."""
+        def with_modules(shard_modules: List[str]) -> Dict[str, Any]:
+            module_filter = {"module": {"$in": list(shard_modules)}}
+            return {"$and": [filter, module_filter]} if filter else module_filter
+
+        # Cada shard só devolve chunks dos módulos pelos quais foi escolhido
+        searches = [(shard, with_modules(shard_modules)) for shard, shard_modules in self._route(embedding, modules)]
+
+        # A coleção antiga (se ainda houver dados) é filtrada pelo metadado quando há módulos pedidos
+        if self._legacy._collection.count() > 0:
+            searches.append((self._legacy, with_modules(modules) if modules else filter))
+
+        if not searches:
+            return []
+
+        def search(item: Tuple["Chroma", Optional[Dict[str, Any]]]) -> List[Tuple[Document, float]]:
+            shard, shard_filter = item
+            if shard._collection.count() == 0:
+                return []
+            return shard.similarity_search_by_vector_with_relevance_scores(embedding, k=k, filter=shard_filter)
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(searches))) as executor:
+            results = [pair for shard_results in executor.map(search, searches) for pair in shard_results]
+
+        results.sort(key=lambda pair: pair[1])
+        return results[:k]
+
+    def similarity_search_by_vector(
+        self,
+        embedding: List[float],
+        k: int = 4,
+        filter: Optional[Dict[str, Any]] = None,
+        modules: Optional[List[str]] = None,
+        **kwargs: Any
+    ) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_by_vector_with_relevance_scores(embedding, k, filter, modules)]
+
+    def similarity_search_with_score(
+        self,
+        query: str,
+        k: int = 4,
+        filter: Optional[Dict[str, Any]] = None,
+        modules: Optional[List[str]] = None,
+        **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        embedding = self._embedding_function.embed_query(query)
+        return self.similarity_search_by_vector_with_relevance_scores(embedding, k, filter, modules)
+
+    def similarity_search(
+        self,
+        query: str,
+        k: int = 4,
+        filter: Optional[Dict[str, Any]] = None,
+        modules: Optional[List[str]] = None,
+        **kwargs: Any
+    ) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, filter, modules)]
+
+    def _select_relevance_score_fn(self):
+        # Distância L2 (padrão do Chroma) convertida em relevância, como no langchain_chroma
+        return self._euclidean_relevance_score_fn
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: List[str],
+        embedding,
+        metadatas: Optional[List[Dict[str, Any]]] = None,
+        persist_directory: str = "data/index",
+        **kwargs: Any
+    ) -> "ShardedVectorStore":
+        store = cls(persist_directory, embedding)
+        store.add_texts(texts, metadatas)
+        return store
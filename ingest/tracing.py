@@ -0,0 +1,211 @@
+import os
+import json
+import time
+import uuid
+import threading
+import logging
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+DEFAULT_TRACE_DIR = os.getenv("INVEST_GURU_TRACE_DIR", "data/traces")
+SPANS_FILE = "spans.jsonl"
+METRICS_FILE = "metrics.prom"
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimativa barata de tokens (~4 caracteres por token), usada quando o modelo não informa o uso."""
+    return (len(text) + 3) // 4 if text else 0
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Percentil por interpolação linear (q entre 0 e 100)."""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    position = (len(ordered) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+class Trace:
+    """Spans de duração das etapas de uma operação (uma pergunta, uma ingestão).
+
+    `span` mede um trecho e `record`/`timed`/`wrap` acumulam várias execuções
+    de uma mesma etapa em um único span (útil para estágios repetidos por
+    lote ou executados em outras threads, que podem se sobrepor no tempo).
+    """
+
+    def __init__(self, name: str, **attributes: Any):
+        self.name = name
+        self.trace_id = uuid.uuid4().hex
+        self.attributes = dict(attributes)
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self.duration_ms: Optional[float] = None
+        self.spans: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def _span(self, name: str, seconds: float) -> Dict[str, Any]:
+        span = self.spans.get(name)
+        if span is None:
+            # Início da primeira execução, relativo ao início do trace
+            span = self.spans[name] = {
+                "name": name,
+                "offset_ms": round((time.perf_counter() - seconds - self._start) * 1000, 3),
+                "duration_ms": 0.0,
+                "calls": 0,
+                "attributes": {}
+            }
+        return span
+
+    def record(self, name: str, seconds: float, **attributes: Any):
+        """Acumula uma execução da etapa `name`; atributos numéricos são somados."""
+        with self._lock:
+            span = self._span(name, seconds)
+            span["duration_ms"] = round(span["duration_ms"] + seconds * 1000, 3)
+            span["calls"] += 1
+            for key, value in attributes.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    span["attributes"][key] = span["attributes"].get(key, 0) + value
+                else:
+                    span["attributes"][key] = value
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[Dict[str, Any]]:
+        """Mede o bloco; o dicionário retornado recebe atributos definidos durante a etapa."""
+        extra = dict(attributes)
+        start = time.perf_counter()
+        try:
+            yield extra
+        finally:
+            self.record(name, time.perf_counter() - start, **extra)
+
+    def timed(self, items: Iterable[Any], name: str) -> Iterator[Any]:
+        """Repassa os itens acumulando em `name` o tempo gasto para produzir cada um."""
+        iterator = iter(items)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.record(name, time.perf_counter() - start, items=0)
+                return
+            self.record(name, time.perf_counter() - start, items=1)
+            yield item
+
+    def wrap(self, fn: Callable, name: str, attributes_fn: Optional[Callable[..., Dict[str, Any]]] = None) -> Callable:
+        """Envolve `fn` para acumular a duração de cada chamada em `name`."""
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            result = fn(*args, **kwargs)
+            attributes = attributes_fn(*args, **kwargs) if attributes_fn else {}
+            self.record(name, time.perf_counter() - start, **attributes)
+            return result
+        return wrapper
+
+    def finish(self, **attributes: Any) -> "Trace":
+        """Encerra a medição total (chamadas seguintes não alteram a duração)."""
+        self.attributes.update(attributes)
+        if self.duration_ms is None:
+            self.duration_ms = round((time.perf_counter() - self._start) * 1000, 3)
+        return self
+
+    def breakdown(self) -> List[Dict[str, Any]]:
+        """Spans na ordem em que começaram."""
+        with self._lock:
+            return sorted((dict(span) for span in self.spans.values()), key=lambda span: span["offset_ms"])
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "started_at": datetime.fromtimestamp(self.started_at).isoformat(timespec="milliseconds"),
+            "duration_ms": self.duration_ms,
+            "attributes": self.attributes,
+            "spans": self.breakdown()
+        }
+
+
+class TraceExporter:
+    """Exporta traces como linhas JSON e métricas agregadas no formato texto do Prometheus.
+
+    `spans.jsonl` recebe um trace por linha (rotacionado ao passar de
+    `max_bytes`); `metrics.prom` é reescrito a cada trace com a soma e a
+    contagem das durações e dos tokens por etapa desde o início do processo,
+    podendo ser lido pelo textfile collector do node_exporter.
+    """
+
+    def __init__(self, directory: str = DEFAULT_TRACE_DIR, max_bytes: int = 10 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._totals: Dict[tuple, Dict[str, float]] = {}
+
+    def _rotate(self, path: str):
+        if os.path.exists(path) and os.path.getsize(path) > self.max_bytes:
+            os.replace(path, f"{path}.1")
+
+    def _accumulate(self, trace: Trace):
+        stages = [("total", trace.duration_ms or 0.0, {})] + [
+            (span["name"], span["duration_ms"], span["attributes"]) for span in trace.breakdown()
+        ]
+        for stage, duration_ms, attributes in stages:
+            totals = self._totals.setdefault((trace.name, stage), {"count": 0, "seconds": 0.0, "tokens": 0})
+            totals["count"] += 1
+            totals["seconds"] += duration_ms / 1000
+            totals["tokens"] += sum(
+                value for key, value in attributes.items()
+                if key.endswith("tokens") and isinstance(value, (int, float)) and not isinstance(value, bool)
+            )
+
+    def render_metrics(self) -> str:
+        lines = [
+            "# HELP invest_guru_stage_seconds Duração das etapas por operação.",
+            "# TYPE invest_guru_stage_seconds summary"
+        ]
+        for (operation, stage), totals in sorted(self._totals.items()):
+            labels = f'operation="{operation}",stage="{stage}"'
+            lines.append(f"invest_guru_stage_seconds_sum{{{labels}}} {totals['seconds']:.6f}")
+            lines.append(f"invest_guru_stage_seconds_count{{{labels}}} {totals['count']}")
+        lines += [
+            "# HELP invest_guru_stage_tokens_total Tokens processados por etapa.",
+            "# TYPE invest_guru_stage_tokens_total counter"
+        ]
+        for (operation, stage), totals in sorted(self._totals.items()):
+            if totals["tokens"]:
+                lines.append(f'invest_guru_stage_tokens_total{{operation="{operation}",stage="{stage}"}} {totals["tokens"]}')
+        return "\n".join(lines) + "\n"
+
+    def export(self, trace: Trace):
+        """Grava o trace; falhas de escrita são registradas sem interromper a operação."""
+        trace.finish()
+        try:
+            with self._lock:
+                os.makedirs(self.directory, exist_ok=True)
+                spans_path = os.path.join(self.directory, SPANS_FILE)
+                self._rotate(spans_path)
+                with open(spans_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(trace.to_dict(), ensure_ascii=False, default=str) + "\n")
+
+                self._accumulate(trace)
+                metrics_path = os.path.join(self.directory, METRICS_FILE)
+                tmp_path = f"{metrics_path}.tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    f.write(self.render_metrics())
+                os.replace(tmp_path, metrics_path)
+        except OSError as e:
+            logger.error(f"Erro ao exportar trace {trace.name}: {e}")
+
+
+exporter = TraceExporter()
+
+
+def export_trace(trace: Trace):
+    """Exporta o trace pelo exportador padrão do processo."""
+    exporter.export(trace)